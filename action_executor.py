@@ -0,0 +1,149 @@
+# Non-blocking execution of bot actions.
+# play_card makes two pyautogui clicks with pyautogui.PAUSE between them, which used
+# to stall capture and drawing for at least 200 ms per action. The executor runs the
+# clicks on its own thread. It keeps at most one pending action (a newer decision
+# replaces an older one) and drops actions whose source frame is too old by the time
+# they would be executed. An action that was decided while the previous card was still
+# being played is dropped once that card lands: it was based on a state without it.
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+import numpy as np
+
+from game_automation import play_card
+from game_state import GameState
+from metrics import registry as metrics
+
+# --- Настройки ---
+# Максимальный возраст кадра (сек), на основе которого принято решение, к моменту клика
+MAX_ACTION_AGE = 0.5
+# Сколько последних задержек хранить для статистики
+LATENCY_WINDOW = 1000
+
+@dataclass
+class PendingAction:
+    slot_index: int
+    coords: Tuple[int, int]          # глобальные экранные координаты
+    card_name: Optional[str] = None
+    frame_time: float = 0.0          # time.monotonic() захвата кадра, по которому принято решение
+    decided_at: float = field(default_factory=time.monotonic)
+    # Состояние, по которому принято решение; после клика в нем заполняется action_time
+    game_state: Optional[GameState] = None
+
+class ActionExecutor(threading.Thread):
+    """
+    Поток исполнения действий. submit() не блокирует вызывающий поток, и действия можно
+    подавать, даже пока исполнитель занят: новое заменяет ожидающее.
+    on_played(action) вызывается после успешного розыгрыша (например, для списания эликсира
+    и отсчета паузы между действиями).
+    card_slots и playable_area задают калибровку окна, по умолчанию — из game_automation.
+    """
+
+    def __init__(self, max_age=MAX_ACTION_AGE, on_played=None, card_slots=None, playable_area=None,
+                 name="action-executor"):
+        super().__init__(name=name, daemon=True)
+        self.max_age = max_age
+        self.on_played = on_played
+        self.card_slots = card_slots
+        self.playable_area = playable_area
+        self._condition = threading.Condition()
+        self._pending = None
+        self._executing = False
+        self._running = True
+        self.executed = 0
+        self.failed = 0
+        self.dropped_stale = 0
+        self.dropped_outdated = 0
+        self.replaced = 0
+        # time.monotonic() последнего успешного розыгрыша
+        self.last_played_at = 0.0
+        # Задержки "решение -> клик" и "кадр -> клик", сек
+        self.decide_to_click = deque(maxlen=LATENCY_WINDOW)
+        self.frame_to_click = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def busy(self):
+        """True, если есть ожидающее действие или клики выполняются прямо сейчас."""
+        with self._condition:
+            return self._pending is not None or self._executing
+
+    def submit(self, action: PendingAction):
+        """Ставит действие в очередь, заменяя еще не выполненное."""
+        with self._condition:
+            if self._pending is not None:
+                self.replaced += 1
+            self._pending = action
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None or not self._running)
+                if not self._running:
+                    return
+                action, self._pending = self._pending, None
+                self._executing = True
+
+            try:
+                self._execute(action)
+            finally:
+                with self._condition:
+                    self._executing = False
+                    # Решение, принятое до только что разыгранной карты, ее не учитывает
+                    if self._pending is not None and self._pending.decided_at < self.last_played_at:
+                        self._pending = None
+                        self.dropped_outdated += 1
+                        metrics.inc("actions_dropped_outdated")
+
+    def _execute(self, action):
+        age = time.monotonic() - action.frame_time
+        if action.frame_time and age > self.max_age:
+            self.dropped_stale += 1
+            metrics.inc("actions_dropped_stale")
+            print(f"[Executor] Действие отброшено: кадр устарел на {age * 1000:.0f} мс")
+            return
+
+        if not play_card(action.slot_index, action.coords, card_slots=self.card_slots,
+                         playable_area=self.playable_area):
+            self.failed += 1
+            metrics.inc("actions_failed")
+            return
+
+        clicked_at = time.monotonic()
+        self.last_played_at = clicked_at
+        self.executed += 1
+        metrics.inc("actions_executed")
+        self.decide_to_click.append(clicked_at - action.decided_at)
+        metrics.observe("decision_to_action", clicked_at - action.decided_at)
+        if action.frame_time:
+            self.frame_to_click.append(clicked_at - action.frame_time)
+            metrics.observe("capture_to_action", clicked_at - action.frame_time)
+        if action.game_state is not None:
+            action.game_state.action_time = clicked_at
+        if self.on_played is not None:
+            self.on_played(action)
+
+    def stats(self):
+        """Сводка по исполненным и отброшенным действиям и задержкам (мс)."""
+        summary = {
+            "executed": self.executed,
+            "failed": self.failed,
+            "dropped_stale": self.dropped_stale,
+            "dropped_outdated": self.dropped_outdated,
+            "replaced": self.replaced,
+        }
+        for name, samples in (("decide_to_click", self.decide_to_click), ("frame_to_click", self.frame_to_click)):
+            if samples:
+                values = np.asarray(samples) * 1000.0
+                summary[f"{name}_p50_ms"] = float(np.percentile(values, 50))
+                summary[f"{name}_p95_ms"] = float(np.percentile(values, 95))
+        return summary
@@ -0,0 +1,112 @@
+# Export and compare inference backends for CPU-only hosts.
+#
+#   python backend_compare.py export               # ONNX, OpenVINO FP32 и OpenVINO INT8
+#   python backend_compare.py compare --json backends.json
+#
+# INT8 калибруется на train-изображениях из датасета. Сравнение запускает model.val на
+# valid-сплите для каждого доступного бэкенда и выводит mAP и задержку на изображение.
+# Выбранный бэкенд включается переменной окружения CR_INFERENCE_BACKEND (см. game_vision.py).
+
+import argparse
+import json
+import os
+import shutil
+
+from ultralytics import YOLO
+
+# Модель в game_vision загружается лениво, поэтому пути берутся прямо оттуда
+from game_vision import MODEL_PATH, MODEL_PATHS
+
+# --- Настройки ---
+DATA_YAML = "CustomWorkflowObjectDetection.v3i.yolov12/data.yaml"
+
+def _train_imgsz(torch_model):
+    """Размер входа, на котором обучалась модель (predict по умолчанию использует его же)."""
+    return torch_model.overrides.get('imgsz', 640)
+
+def export_backends(imgsz=None, backends=('onnx', 'openvino', 'openvino_int8')):
+    """Экспортирует модель в выбранные форматы по путям из MODEL_PATHS."""
+    torch_model = YOLO(MODEL_PATH)
+    imgsz = imgsz or _train_imgsz(torch_model)
+
+    for backend in backends:
+        print(f"[Export] {backend} (imgsz={imgsz})...")
+        if backend == 'onnx':
+            exported = torch_model.export(format='onnx', imgsz=imgsz, simplify=True, dynamic=False)
+        elif backend == 'openvino':
+            exported = torch_model.export(format='openvino', imgsz=imgsz, half=False)
+        elif backend == 'openvino_int8':
+            # Калибровка INT8 на train-изображениях датасета
+            exported = torch_model.export(format='openvino', imgsz=imgsz, int8=True, data=DATA_YAML, split='train')
+        else:
+            raise ValueError(f"Экспорт для бэкенда {backend} не поддерживается")
+
+        target = MODEL_PATHS[backend]
+        if os.path.abspath(exported) != os.path.abspath(target):
+            if os.path.exists(target):
+                shutil.rmtree(target) if os.path.isdir(target) else os.remove(target)
+            shutil.move(exported, target)
+        print(f"[Export] {backend} -> {target}")
+
+def compare_backends(imgsz=None, backends=None, device='cpu'):
+    """Запускает валидацию на valid-сплите для каждого доступного бэкенда."""
+    imgsz = imgsz or _train_imgsz(YOLO(MODEL_PATH))
+    rows = []
+    for backend in backends or MODEL_PATHS:
+        path = MODEL_PATHS[backend]
+        if not os.path.exists(path):
+            print(f"[Compare] {backend}: модель {path} не найдена, пропускаем")
+            continue
+        print(f"[Compare] {backend}...")
+        metrics = YOLO(path, task='detect').val(data=DATA_YAML, split='val', imgsz=imgsz, batch=1,
+                                                device=device, plots=False, verbose=False)
+        speed = metrics.speed
+        rows.append({
+            "backend": backend,
+            "map50": float(metrics.box.map50),
+            "map50_95": float(metrics.box.map),
+            "preprocess_ms": float(speed.get('preprocess', 0.0)),
+            "inference_ms": float(speed.get('inference', 0.0)),
+            "postprocess_ms": float(speed.get('postprocess', 0.0)),
+            "total_ms": float(sum(speed.values())),
+        })
+    return rows
+
+def print_comparison(rows):
+    print(f"\n{'backend':<16}{'mAP50':>8}{'mAP50-95':>10}{'infer ms':>10}{'total ms':>10}{'vs torch':>10}")
+    baseline = next((r for r in rows if r["backend"] == 'torch'), None)
+    for r in rows:
+        speedup = f"x{baseline['total_ms'] / r['total_ms']:.2f}" if baseline and r['total_ms'] else "-"
+        print(f"{r['backend']:<16}{r['map50']:>8.3f}{r['map50_95']:>10.3f}"
+              f"{r['inference_ms']:>10.1f}{r['total_ms']:>10.1f}{speedup:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт модели для CPU и сравнение бэкендов инференса.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Экспортировать ONNX / OpenVINO / OpenVINO INT8.")
+    export.add_argument("--imgsz", type=int, default=None, help="По умолчанию — размер обучения модели.")
+    export.add_argument("--backends", nargs="+", default=['onnx', 'openvino', 'openvino_int8'],
+                        choices=[b for b in MODEL_PATHS if b != 'torch'])
+
+    compare = subparsers.add_parser("compare", help="Сравнить mAP и задержку на valid-сплите.")
+    compare.add_argument("--imgsz", type=int, default=None)
+    compare.add_argument("--backends", nargs="+", default=None, choices=list(MODEL_PATHS))
+    compare.add_argument("--device", default='cpu')
+    compare.add_argument("--json", dest="json_path", default=None, help="Сохранить результаты в JSON.")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_backends(imgsz=args.imgsz, backends=args.backends)
+        return 0
+
+    rows = compare_backends(imgsz=args.imgsz, backends=args.backends, device=args.device)
+    print_comparison(rows)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\n[Compare] Результаты сохранены в {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,175 @@
+# Headless benchmark for the perception pipeline.
+# Runs game_vision.perceive_game_state over a folder of images or a recorded video
+# without screen capture, cv2.imshow or pyautogui, and reports per-stage latency.
+#
+# Пример:
+#   python benchmark.py --source CustomWorkflowObjectDetection.v3i.yolov12/test/images
+#   python benchmark.py --source match.mp4 --limit 200 --json bench.json
+
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+import game_vision
+from elixir_estimator import OCR_CORRECTION_INTERVAL
+from game_state import GameState
+
+# --- Настройки ---
+DEFAULT_SOURCE = "CustomWorkflowObjectDetection.v3i.yolov12/test/images"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+WARMUP_FRAMES = 3
+PERCENTILES = (50, 95, 99)
+# Этап, в который записывается полное время вызова perceive_game_state
+STAGE_TOTAL = 'total'
+
+def load_frames(source, limit=None, size=None):
+    """
+    Загружает кадры в память заранее, чтобы чтение с диска не попадало в замеры.
+    `source` — папка с изображениями (например, дамп записанных кадров) или видеофайл.
+    """
+    frames = []
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names:
+            if limit is not None and len(frames) >= limit:
+                break
+            frame = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+            if frame is not None:
+                frames.append(frame)
+    else:
+        capture = cv2.VideoCapture(source)
+        try:
+            while limit is None or len(frames) < limit:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frames.append(frame)
+        finally:
+            capture.release()
+
+    if size is not None:
+        frames = [cv2.resize(f, size, interpolation=cv2.INTER_AREA) if f.shape[1::-1] != size else f for f in frames]
+    return frames
+
+def _summarize(samples):
+    """Переводит список длительностей (сек) в p50/p95/p99/mean в миллисекундах."""
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean"] = float(values.mean())
+    summary["count"] = int(values.size)
+    return summary
+
+def run_benchmark(frames, analyze_slow_components, warmup=WARMUP_FRAMES, keyframe_interval=1):
+    """
+    Прогоняет кадры через perceive_game_state и возвращает статистику по этапам.
+    Состояние передается от кадра к кадру так же, как в vision_worker.
+    """
+    samples = defaultdict(list)
+    recording = False
+
+    def observer(stage, seconds):
+        if recording:
+            samples[stage].append(seconds)
+
+    last_game_state = GameState()
+    # Каждый прогон с чистого состояния: треки, рука, раскладка башен, кэши областей и OCR
+    game_vision.reset_perception()
+    # В прогоне "slow" OCR эликсира выполняется на каждом кадре, как подписан этап elixir_ocr,
+    # а не раз в интервал коррекции
+    if analyze_slow_components is True:
+        game_vision.elixir_estimator.ocr_interval = 0.0
+    # Отложенные бюджетом компоненты не должны зависеть от скорости машины
+    game_vision.slow_scheduler.deterministic = True
+    game_vision.set_stage_observer(observer)
+    try:
+        # Прогрев: первые вызовы модели заметно медленнее и искажают перцентили
+        for frame in frames[:warmup]:
+            last_game_state, _ = game_vision.perceive_game_state(
+                frame, last_game_state=last_game_state, analyze_slow_components=analyze_slow_components)
+
+        recording = True
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            frame_start = time.perf_counter()
+            last_game_state, _ = game_vision.perceive_game_state(
+                frame, last_game_state=last_game_state, analyze_slow_components=analyze_slow_components,
+                keyframe=(i % keyframe_interval == 0))
+            samples[STAGE_TOTAL].append(time.perf_counter() - frame_start)
+        elapsed = time.perf_counter() - start
+    finally:
+        game_vision.set_stage_observer(None)
+        game_vision.elixir_estimator.ocr_interval = OCR_CORRECTION_INTERVAL
+        game_vision.slow_scheduler.deterministic = False
+
+    report = {
+        "analyze_slow_components": analyze_slow_components,
+        "keyframe_interval": keyframe_interval,
+        "frames": len(frames),
+        "fps": len(frames) / elapsed if elapsed > 0 else 0.0,
+        "stages": {stage: _summarize(values) for stage, values in samples.items()},
+    }
+    if analyze_slow_components:
+        report["ocr_cache"] = game_vision.ocr_cache.stats()
+    if analyze_slow_components == game_vision.SLOW_AUTO:
+        report["slow_scheduler"] = game_vision.slow_scheduler.stats()
+    return report
+
+def print_report(report):
+    """Печатает отчет одного прогона в виде таблицы."""
+    if report["analyze_slow_components"] == game_vision.SLOW_AUTO:
+        mode = "event-driven slow components"
+    else:
+        mode = "with slow components" if report["analyze_slow_components"] else "fast path only"
+    print(f"\n=== {mode}, keyframe every {report['keyframe_interval']}: "
+          f"{report['frames']} frames, {report['fps']:.2f} FPS ===")
+    print(f"{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'count':>8}")
+    for stage, s in sorted(report["stages"].items()):
+        print(f"{stage:<22}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['mean']:>10.2f}{s['count']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark for perceive_game_state.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Папка с изображениями или видеофайл.")
+    parser.add_argument("--limit", type=int, default=None, help="Максимальное число кадров.")
+    parser.add_argument("--size", default=None, help="Привести кадры к размеру WxH, например 766x1355.")
+    parser.add_argument("--mode", choices=("both", "fast", "slow", "event"), default="both",
+                        help="fast — без analyze_slow_components, slow — с ними, both — оба прогона, "
+                             "event — по планировщику медленных компонентов.")
+    parser.add_argument("--keyframe-interval", type=int, default=1,
+                        help="YOLO раз в N кадров, между ними экстраполяция треков.")
+    parser.add_argument("--split-regions", action="store_true",
+                        help="Инференс по областям (game_vision.INFERENCE_REGIONS) вместо всего кадра.")
+    parser.add_argument("--pipelined-ocr", action="store_true",
+                        help="OCR медленных компонентов в пуле потоков (game_vision.OCR_PIPELINE).")
+    parser.add_argument("--json", dest="json_path", default=None, help="Сохранить отчет в JSON.")
+    args = parser.parse_args()
+
+    game_vision.REGION_SPLIT = args.split_regions
+    game_vision.OCR_PIPELINE = args.pipelined_ocr
+    size = tuple(int(v) for v in args.size.lower().split("x")) if args.size else None
+    frames = load_frames(args.source, limit=args.limit, size=size)
+    if not frames:
+        print(f"[Benchmark ERROR] Не найдено кадров в {args.source}")
+        return 1
+    print(f"[Benchmark] Загружено {len(frames)} кадров из {args.source}")
+
+    modes = {"both": (False, True), "fast": (False,), "slow": (True,), "event": (game_vision.SLOW_AUTO,)}[args.mode]
+    reports = []
+    for analyze_slow in modes:
+        report = run_benchmark(frames, analyze_slow_components=analyze_slow,
+                               keyframe_interval=max(1, args.keyframe_interval))
+        print_report(report)
+        reports.append(report)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"source": args.source, "runs": reports}, f, indent=2)
+        print(f"\n[Benchmark] Отчет сохранен в {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,22 @@
+# Screen calibration of the emulator window: card slot centers, the playable area and
+# the vision capture area. Kept free of side effects (no pyautogui, no capture backends)
+# so that the decision logic, placement scoring and tools can import the coordinates
+# without pulling in the automation module.
+
+# --- Координаты, полученные после калибровки ---
+
+# Координаты центров для 4-х слотов карт в руке
+CARD_SLOTS = [
+    (2900, 1241), # Слот 1
+    (3050, 1241), # Слот 2
+    (3200, 1241), # Слот 3
+    (3350, 1241)  # Слот 4
+]
+
+# Прямоугольная область игрового поля, куда можно ставить юнитов
+# (левый_верхний_x, левый_верхний_y, правый_нижний_x, правый_нижний_y)
+PLAYABLE_AREA = (2731, 636, 3385, 1058)
+
+# Область захвата экрана, которая передается в модель зрения
+# Это нужно для пересчета координат
+VISION_CAPTURE_AREA = {"top": 35, "left": 2674, "width": 766, "height": 1355}
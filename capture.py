@@ -0,0 +1,185 @@
+# Capture backends for the bot.
+# A CaptureSource writes frames straight into preallocated FrameRing slots; a
+# CaptureThread drives it at a target FPS, independently of the UI loop.
+# Backends:
+#   - MssCapture: screen capture of the emulator window.
+#   - FileCapture: playback of a video file or an image directory (recorded frames,
+#     dataset images) in real time or at maximum speed — for headless runs and load tests.
+
+import os
+import threading
+import time
+
+import cv2
+import mss
+import numpy as np
+
+from metrics import registry as metrics
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# FPS воспроизведения папки с изображениями в реальном времени
+DEFAULT_IMAGE_FPS = 30.0
+
+class CaptureSource:
+    """Базовый источник кадров. frame_shape — (высота, ширина, 3) кадров BGR на выходе."""
+
+    frame_shape = None
+    # Собственная частота источника (для видео), None — не задана
+    native_fps = None
+
+    def read_into(self, out):
+        """Записывает следующий кадр в `out`. Возвращает False, если кадры закончились."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class MssCapture(CaptureSource):
+    """Захват области экрана через mss с конвертацией BGRA->BGR прямо в буфер кольца."""
+
+    def __init__(self, monitor):
+        self.monitor = dict(monitor)
+        self.frame_shape = (monitor["height"], monitor["width"], 3)
+        # Экземпляр mss создается в потоке захвата: на Windows он не переносится между потоками
+        self._sct = None
+
+    def read_into(self, out):
+        if self._sct is None:
+            self._sct = mss.mss()
+        sct_img = self._sct.grab(self.monitor)
+        bgra = np.frombuffer(sct_img.bgra, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=out)
+        return True
+
+    def close(self):
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+class FileCapture(CaptureSource):
+    """
+    Воспроизведение видеофайла или папки с изображениями.
+    `size` — (ширина, высота) выходного кадра; по умолчанию размер первого кадра.
+    """
+
+    def __init__(self, path, size=None, loop=False, image_fps=DEFAULT_IMAGE_FPS):
+        self.path = path
+        self.loop = loop
+        self._video = None
+        self._images = None
+        self._index = 0
+
+        if os.path.isdir(path):
+            self._images = sorted(os.path.join(path, n) for n in os.listdir(path)
+                                  if n.lower().endswith(IMAGE_EXTENSIONS))
+            if not self._images:
+                raise ValueError(f"В папке {path} нет изображений")
+            first = cv2.imread(self._images[0], cv2.IMREAD_COLOR)
+            self.native_fps = image_fps
+        else:
+            self._video = cv2.VideoCapture(path)
+            ok, first = self._video.read()
+            if not ok:
+                raise ValueError(f"Не удалось прочитать видео {path}")
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            fps = self._video.get(cv2.CAP_PROP_FPS)
+            self.native_fps = fps if fps and fps > 0 else None
+
+        width, height = size if size is not None else (first.shape[1], first.shape[0])
+        self.frame_shape = (height, width, 3)
+
+    def _next_frame(self):
+        if self._images is not None:
+            if self._index >= len(self._images):
+                if not self.loop:
+                    return None
+                self._index = 0
+            frame = cv2.imread(self._images[self._index], cv2.IMREAD_COLOR)
+            self._index += 1
+            return frame
+
+        ok, frame = self._video.read()
+        if not ok and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._video.read()
+        return frame if ok else None
+
+    def read_into(self, out):
+        frame = self._next_frame()
+        if frame is None:
+            return False
+        if frame.shape == out.shape:
+            np.copyto(out, frame)
+        else:
+            cv2.resize(frame, (out.shape[1], out.shape[0]), dst=out, interpolation=cv2.INTER_AREA)
+        return True
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+def create_capture_source(backend, monitor=None, path=None, loop=False):
+    """
+    Создает источник по имени: 'mss' — захват экрана, 'file' — видео или папка с кадрами.
+    Для 'file' кадры приводятся к размеру monitor (если задан): области game_vision,
+    hand_recognizer и motion_gate заданы в пикселях полного кадра окна.
+    """
+    if backend == 'mss':
+        return MssCapture(monitor)
+    if backend == 'file':
+        size = (monitor["width"], monitor["height"]) if monitor is not None else None
+        return FileCapture(path, size=size, loop=loop)
+    raise ValueError(f"Неизвестный источник захвата: {backend}")
+
+class CaptureThread(threading.Thread):
+    """
+    Поток захвата: читает источник с заданной частотой и публикует кадры в FrameRing.
+    target_fps=None — без ограничения частоты (максимальная скорость). Частоту можно
+    менять на ходу (например, режим простоя вне матча снижает ее).
+    """
+
+    def __init__(self, source, ring, target_fps=None):
+        super().__init__(name="capture", daemon=True)
+        self.source = source
+        self.ring = ring
+        self.target_fps = target_fps
+        self.frames_captured = 0
+        self.capture_seconds = 0.0
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        next_deadline = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                period = 1.0 / self.target_fps if self.target_fps else 0.0
+                start = time.perf_counter()
+                if not self.source.read_into(self.ring.acquire_write()):
+                    break
+                self.ring.publish()
+                elapsed = time.perf_counter() - start
+                self.frames_captured += 1
+                self.capture_seconds += elapsed
+                metrics.observe("capture", elapsed)
+
+                if period:
+                    next_deadline += period
+                    delay = next_deadline - time.perf_counter()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    else:
+                        # Не успеваем — не пытаемся догонять пачкой кадров
+                        next_deadline = time.perf_counter()
+        except Exception as e:
+            print(f"[Capture ERROR] Ошибка захвата: {e}")
+        finally:
+            self.source.close()
+            self.finished.set()
+
+    @property
+    def average_capture_ms(self):
+        return 1000.0 * self.capture_seconds / self.frames_captured if self.frames_captured else 0.0
@@ -0,0 +1,244 @@
+# Built-in digit recognizer for the game's fixed font.
+# Reads numbers from the thresholded output of game_vision._preprocess_for_ocr by
+# matching each glyph against templates built from labelled crops, in-process and
+# without launching a tesseract subprocess.
+#
+# Подготовка шаблонов:
+#   1. Включить OCR_CROP_DUMP_DIR в game_vision.py и поиграть матч — обработанные кропы
+#      сохранятся как <прочитанное_значение>_<вид>_<номер>.png (вид — elixir или hp).
+#   2. Проверить имена файлов (исправить неверные значения) и собрать шаблоны:
+#        python digit_ocr.py build ocr_crops --out digit_templates.npz
+#   3. Сравнить точность с tesseract на отложенных кропах: каждый HOLDOUT_EVERY-й кроп
+#      не участвует в сборке шаблонов, check собирает их из остальных и проверяет на нем:
+#        python digit_ocr.py check ocr_crops
+#      С --holdout 0 проверяются готовые шаблоны --templates на всех кропах; если они
+#      собраны из тех же кропов, точность завышена.
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+# --- Настройки ---
+GLYPH_SIZE = (10, 14)          # (ширина, высота) нормализованного символа
+MIN_GLYPH_WIDTH = 2            # Столбцы уже этого значения считаются шумом
+MIN_GLYPH_HEIGHT_RATIO = 0.4   # Символ должен занимать не меньше этой доли высоты кропа
+MIN_MATCH_SCORE = 0.75         # Минимальная корреляция с шаблоном, иначе отказ (fallback на tesseract)
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.jpg', '.jpeg')
+# Режим сегментации tesseract для каждого вида кропа — тот же, что в game_vision
+# (ELIXIR_OCR_CONFIG: одно слово, HP_OCR_CONFIG: одна строка)
+CROP_KINDS = {'elixir': 8, 'hp': 7}
+DEFAULT_PSM = 7
+# check: каждый N-й размеченный кроп откладывается для проверки и не попадает в шаблоны
+HOLDOUT_EVERY = 5
+
+def _segment_glyphs(binary):
+    """
+    Делит бинарное изображение (белые цифры на черном фоне) на символы
+    по вертикальной проекции. Возвращает список кропов слева направо.
+    """
+    mask = binary > 0
+    if not mask.any():
+        return []
+
+    columns = mask.any(axis=0)
+    # Границы непрерывных участков столбцов с пикселями цифр
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], columns.view(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+
+    min_height = MIN_GLYPH_HEIGHT_RATIO * mask.shape[0]
+    glyphs = []
+    for start, end in zip(starts, ends):
+        if end - start < MIN_GLYPH_WIDTH:
+            continue
+        rows = np.flatnonzero(mask[:, start:end].any(axis=1))
+        if rows[-1] - rows[0] + 1 < min_height:
+            continue
+        glyphs.append(mask[rows[0]:rows[-1] + 1, start:end])
+    return glyphs
+
+def _normalize_glyphs(glyphs):
+    """Приводит символы к GLYPH_SIZE и возвращает матрицу векторов с нулевым средним и единичной нормой."""
+    vectors = np.empty((len(glyphs), GLYPH_SIZE[0] * GLYPH_SIZE[1]), dtype=np.float32)
+    for i, glyph in enumerate(glyphs):
+        resized = cv2.resize(glyph.astype(np.float32), GLYPH_SIZE, interpolation=cv2.INTER_AREA)
+        vectors[i] = resized.ravel()
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class DigitReader:
+    """Распознает числа сопоставлением символов с шаблонами (нормализованная корреляция)."""
+
+    def __init__(self, templates, labels, min_score=MIN_MATCH_SCORE):
+        self.templates = np.asarray(templates, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.uint8)
+        self.min_score = min_score
+
+    @classmethod
+    def load(cls, path, min_score=MIN_MATCH_SCORE):
+        data = np.load(path)
+        return cls(data["templates"], data["labels"], min_score=min_score)
+
+    def save(self, path):
+        np.savez_compressed(path, templates=self.templates, labels=self.labels)
+
+    def read_digits(self, binary):
+        """
+        Возвращает строку цифр или None, если хотя бы один символ распознан неуверенно.
+        """
+        if binary is None or binary.size == 0 or len(self.templates) == 0:
+            return None
+        glyphs = _segment_glyphs(binary)
+        if not glyphs:
+            return None
+
+        scores = _normalize_glyphs(glyphs) @ self.templates.T
+        best = scores.argmax(axis=1)
+        if scores[np.arange(len(best)), best].min() < self.min_score:
+            return None
+        return "".join(str(d) for d in self.labels[best])
+
+    def read(self, binary):
+        """Возвращает распознанное число (int) или None."""
+        digits = self.read_digits(binary)
+        return int(digits) if digits else None
+
+def crop_kind(name):
+    """Вид кропа по имени файла (`2534_hp_00001.png` -> 'hp') или None для старых имен без вида."""
+    parts = os.path.splitext(name)[0].split("_")
+    return parts[1] if len(parts) > 2 and parts[1] in CROP_KINDS else None
+
+def _iter_labelled_crops(crops_dir, holdout=0, held_out=False):
+    """
+    Перебирает размеченные кропы: имя файла начинается со значения, например `2534_hp_00001.png`.
+    holdout > 0 делит кропы: каждый holdout-й отложен для проверки (held_out=True выдает
+    только их, False — только остальные).
+    """
+    index = 0
+    for name in sorted(os.listdir(crops_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        label = name.split("_", 1)[0].split(".", 1)[0]
+        if not label.isdigit():
+            continue
+        index += 1
+        if holdout > 0 and (index % holdout == 0) != held_out:
+            continue
+        image = cv2.imread(os.path.join(crops_dir, name), cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            yield name, label, image
+
+def build_templates(crops_dir, min_score=MIN_MATCH_SCORE, holdout=0):
+    """
+    Собирает шаблоны из размеченных кропов (при holdout > 0 — без отложенных). Кропы,
+    в которых число найденных символов не совпадает с длиной метки, пропускаются.
+    """
+    templates, labels, skipped = [], [], []
+    for name, label, image in _iter_labelled_crops(crops_dir, holdout):
+        glyphs = _segment_glyphs(image)
+        if len(glyphs) != len(label):
+            skipped.append(name)
+            continue
+        templates.extend(_normalize_glyphs(glyphs))
+        labels.extend(int(ch) for ch in label)
+
+    if skipped:
+        print(f"[DigitOCR] Пропущено {len(skipped)} кропов с неверной сегментацией, например: {skipped[:5]}")
+    return DigitReader(np.array(templates, dtype=np.float32).reshape(-1, GLYPH_SIZE[0] * GLYPH_SIZE[1]),
+                       labels, min_score=min_score)
+
+def check_accuracy(reader, crops_dir, psm=None, holdout=0):
+    """
+    Сравнивает встроенный распознаватель и tesseract на размеченных кропах (при
+    holdout > 0 — только на отложенных; reader не должен быть собран из них).
+    tesseract запускается с режимом сегментации вида кропа (CROP_KINDS), как в рабочем
+    режиме; psm, если задан, используется для всех кропов.
+    Возвращает словарь с точностью и средним временем на кроп для каждого режима.
+    """
+    import pytesseract
+
+    # combined — рабочий режим game_vision: шаблоны, а при отказе tesseract
+    stats = {engine: {"correct": 0, "rejected": 0, "seconds": 0.0}
+             for engine in ("reader", "tesseract", "combined")}
+    total = 0
+    for name, label, image in _iter_labelled_crops(crops_dir, holdout, held_out=True):
+        total += 1
+
+        start = time.perf_counter()
+        digits = reader.read_digits(image)
+        reader_seconds = time.perf_counter() - start
+
+        crop_psm = psm if psm is not None else CROP_KINDS.get(crop_kind(name), DEFAULT_PSM)
+        config = f'--psm {crop_psm} -c tessedit_char_whitelist=0123456789'
+        start = time.perf_counter()
+        text = pytesseract.image_to_string(image, config=config).strip()
+        tesseract_seconds = time.perf_counter() - start
+
+        results = {
+            "reader": (digits, reader_seconds),
+            "tesseract": (text or None, tesseract_seconds),
+            "combined": (digits, reader_seconds) if digits is not None
+                        else (text or None, reader_seconds + tesseract_seconds),
+        }
+        for engine, (value, seconds) in results.items():
+            stats[engine]["seconds"] += seconds
+            if value is None:
+                stats[engine]["rejected"] += 1
+            elif value == label:
+                stats[engine]["correct"] += 1
+
+    for s in stats.values():
+        s["accuracy"] = s["correct"] / total if total else 0.0
+        s["ms_per_crop"] = 1000.0 * s["seconds"] / total if total else 0.0
+    stats["total"] = total
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Шаблонный распознаватель цифр для эликсира и HP башен.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Собрать шаблоны из размеченных кропов.")
+    build.add_argument("crops_dir")
+    build.add_argument("--out", default="digit_templates.npz")
+
+    check = subparsers.add_parser("check", help="Сравнить точность с tesseract.")
+    check.add_argument("crops_dir")
+    check.add_argument("--templates", default="digit_templates.npz",
+                       help="Готовые шаблоны; используются только при --holdout 0.")
+    check.add_argument("--holdout", type=int, default=HOLDOUT_EVERY,
+                       help="Проверять на каждом N-м кропе, а шаблоны собрать из остальных; 0 — все кропы и --templates.")
+    check.add_argument("--psm", type=int, default=None,
+                       help="Режим сегментации tesseract для всех кропов (по умолчанию — по виду кропа).")
+    check.add_argument("--tesseract-cmd", default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        reader = build_templates(args.crops_dir)
+        reader.save(args.out)
+        print(f"[DigitOCR] Сохранено {len(reader.labels)} шаблонов в {args.out}")
+        return 0
+
+    if args.tesseract_cmd:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+
+    if args.holdout > 0:
+        reader = build_templates(args.crops_dir, holdout=args.holdout)
+    else:
+        print("[DigitOCR] Проверка на всех кропах: если шаблоны собраны из них же, точность завышена")
+        reader = DigitReader.load(args.templates)
+    stats = check_accuracy(reader, args.crops_dir, psm=args.psm, holdout=args.holdout)
+    print(f"[DigitOCR] Кропов: {stats['total']}" + (f" (каждый {args.holdout}-й, отложенные)" if args.holdout > 0 else ""))
+    for engine in ("reader", "tesseract", "combined"):
+        s = stats[engine]
+        print(f"  {engine:<10} accuracy={s['accuracy']:.3f} rejected={s['rejected']} {s['ms_per_crop']:.2f} ms/crop")
+    # Ненулевой код возврата, если рабочий режим (шаблоны + tesseract) распознает хуже, чем один tesseract
+    return 0 if stats["combined"]["accuracy"] >= stats["tesseract"]["accuracy"] else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
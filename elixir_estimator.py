@@ -0,0 +1,220 @@
+# Fast elixir estimation without OCR on the hot path.
+# Every frame the fill ratio of the elixir bar is measured with vectorized pixel
+# counting and nudged into a time-based regeneration model. The model carries the
+# estimate; a bar reading only pulls it a little, and not at all when the bar does
+# not look like a filled prefix (effects, units drawn over it). Playing a card
+# subtracts its cost immediately; OCR only corrects drift from time to time. Outside
+# a match there is no elixir to track, so the estimate is dropped until GameStart.
+
+import threading
+import time
+
+import numpy as np
+
+# --- Настройки ---
+
+# Область полосы эликсира (x, y, w, h) справа от цифры ELIXIR_ROI. Калибруется под окно.
+ELIXIR_BAR_ROI = (245, 1300, 505, 24)
+ELIXIR_MAX = 10
+# Время восстановления одной единицы эликсира (обычное время / двойной эликсир)
+ELIXIR_REGEN_SECONDS = 2.8
+DOUBLE_ELIXIR_REGEN_SECONDS = 1.4
+# Через сколько секунд после начала матча (GameStart) включается двойной эликсир
+DOUBLE_ELIXIR_AFTER = 120.0
+
+# Заполненная часть полосы — ярко-фиолетовая (BGR): много синего и красного, мало зеленого
+BAR_MIN_BLUE = 150
+BAR_MIN_RED = 140
+BAR_MAX_GREEN = 110
+# Столбец считается заполненным, если в нем не меньше этой доли "фиолетовых" пикселей
+BAR_COLUMN_FILL = 0.5
+# Вес измерения полосы относительно модели восстановления (0..1) на кадр при полной уверенности
+BAR_MEASUREMENT_WEIGHT = 0.1
+# Уверенность измерения — доля столбцов, согласных с заполнением "слева до края";
+# ниже этого значения измерение не учитывается
+BAR_MIN_CONFIDENCE = 0.9
+# Как часто (сек) допускается коррекция дрейфа по OCR
+OCR_CORRECTION_INTERVAL = 2.0
+
+# Стоимость карт колоды (по имени без суффикса Deck/Next)
+CARD_ELIXIR_COSTS = {
+    'Arrow': 3,
+    'Bandit': 3,
+    'BattleRam': 4,
+    'ElectroSpirit': 1,
+    'Minions': 3,
+    'Pekka': 7,
+    'Rage': 2,
+    'RoyaleGhost': 3,
+}
+DEFAULT_CARD_COST = 3
+
+def card_cost(class_name):
+    """Возвращает стоимость карты по имени класса ('PekkaDeck', 'Pekka', ...)."""
+    if class_name is None:
+        return DEFAULT_CARD_COST
+    name = class_name.replace('Deck', '').replace('Next', '')
+    return CARD_ELIXIR_COSTS.get(name, DEFAULT_CARD_COST)
+
+def measure_bar(frame, roi=ELIXIR_BAR_ROI):
+    """
+    Возвращает (доля заполнения полосы эликсира 0..1, уверенность 0..1) или (None, 0.0),
+    если область не помещается в кадр. Полоса заполняется слева направо, поэтому
+    уверенность — доля столбцов, совпадающих с заполненным префиксом той же длины.
+    """
+    x, y, w, h = roi
+    if frame is None or frame.shape[0] < y + h or frame.shape[1] < x + w:
+        return None, 0.0
+    bar = frame[y:y+h, x:x+w]
+    b, g, r = bar[..., 0], bar[..., 1], bar[..., 2]
+    mask = (b >= BAR_MIN_BLUE) & (r >= BAR_MIN_RED) & (g <= BAR_MAX_GREEN)
+    filled_columns = mask.mean(axis=0) >= BAR_COLUMN_FILL
+    filled = int(filled_columns.sum())
+    confidence = float((filled_columns == (np.arange(w) < filled)).mean())
+    return filled / w, confidence
+
+def measure_bar_fill(frame, roi=ELIXIR_BAR_ROI):
+    """Доля заполнения полосы эликсира (0..1) или None, если область не помещается в кадр."""
+    return measure_bar(frame, roi)[0]
+
+class ElixirEstimator:
+    """
+    Оценка эликсира на каждый кадр: модель восстановления по времени,
+    слегка поправленная уверенным измерением полосы, розыгрышем карт и редкими
+    чтениями OCR. Вне матча оценки нет.
+    Потокобезопасна: update() вызывается потоком зрения, on_card_played() — основным.
+    """
+
+    def __init__(self, regen_seconds=ELIXIR_REGEN_SECONDS, bar_roi=ELIXIR_BAR_ROI,
+                 double_regen_seconds=DOUBLE_ELIXIR_REGEN_SECONDS, ocr_interval=OCR_CORRECTION_INTERVAL):
+        self.lock = threading.Lock()
+        self.regen_seconds = regen_seconds
+        self.double_regen_seconds = double_regen_seconds
+        # Интервал коррекции по OCR (сек); 0 — OCR на каждый запрос (замеры в benchmark.py)
+        self.ocr_interval = ocr_interval
+        # Момент включения двойного эликсира; None — начало матча неизвестно
+        self._double_at = None
+        self.bar_roi = bar_roi
+        self._value = None
+        self._updated_at = None
+        self._last_ocr_time = 0.0
+        self._last_card_time = None
+        # False — вне матча: после update(in_match=False) и до reset() оценка не ведется
+        self._active = True
+
+    def _predict(self, now):
+        """Значение по модели восстановления на момент `now` (вызывать под lock)."""
+        if self._value is None:
+            return None
+        return min(float(ELIXIR_MAX), self._value + self._regen(self._updated_at, now))
+
+    def _regen(self, start, end):
+        """Эликсир, восстановленный за [start, end], с переходом на двойной эликсир внутри интервала."""
+        if end <= start:
+            return 0.0
+        if self._double_at is None:
+            return (end - start) / self.regen_seconds
+        switch = min(end, max(start, self._double_at))
+        return (switch - start) / self.regen_seconds + (end - switch) / self.double_regen_seconds
+
+    def clear(self):
+        """Забывает оценку и начало матча (новый прогон с чистым состоянием)."""
+        with self.lock:
+            self._value = None
+            self._updated_at = None
+            self._last_ocr_time = 0.0
+            self._last_card_time = None
+            self._double_at = None
+
+    def reset(self, value, now=None):
+        """Сбрасывает оценку в начале матча; от этого момента отсчитывается двойной эликсир."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._value = float(value) if value is not None else None
+            self._updated_at = now
+            self._double_at = now + DOUBLE_ELIXIR_AFTER
+            self._last_card_time = None
+            self._active = True
+
+    def update(self, frame, now=None, in_match=True):
+        """
+        Обновляет оценку по кадру и возвращает текущее значение (float) или None.
+        Вне матча (in_match=False) оценка сбрасывается и не накапливается: следующий
+        матч начнется с reset() по GameStart.
+        """
+        now = time.monotonic() if now is None else now
+        if not in_match:
+            self.clear()
+            with self.lock:
+                self._active = False
+            return None
+        measured, confidence = measure_bar(frame, self.bar_roi)
+        with self.lock:
+            predicted = self._predict(now)
+            if measured is not None and confidence >= BAR_MIN_CONFIDENCE:
+                measured *= ELIXIR_MAX
+                if predicted is None:
+                    predicted = measured
+                else:
+                    predicted += BAR_MEASUREMENT_WEIGHT * confidence * (measured - predicted)
+            if predicted is not None:
+                self._value = predicted
+                self._updated_at = now
+            return self._value
+
+    def on_card_played(self, class_name=None, cost=None, now=None):
+        """Сразу вычитает стоимость разыгранной карты, не дожидаясь полосы или OCR."""
+        now = time.monotonic() if now is None else now
+        cost = card_cost(class_name) if cost is None else cost
+        with self.lock:
+            predicted = self._predict(now)
+            if predicted is None:
+                return
+            self._value = max(0.0, predicted - cost)
+            self._updated_at = now
+            self._last_card_time = now
+
+    def needs_ocr_correction(self, now=None):
+        """True, если пора сверить оценку с OCR."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return self._value is None or now - self._last_ocr_time >= self.ocr_interval
+
+    def correct_with_ocr(self, value, now=None):
+        """
+        Корректирует дрейф по целому значению OCR: истинный эликсир лежит в [value, value + 1),
+        поэтому оценка только прижимается к этому интервалу.
+        `now` — время кадра, с которого прочитано значение. Если оценка уже обновлена
+        более поздними кадрами (OCR выполнялся в конвейере), интервал сдвигается на
+        восстановление за прошедшее время; чтение до розыгрыша карты устарело и не применяется.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._last_ocr_time = max(self._last_ocr_time, now)
+            if value is None or not self._active:
+                return
+            if self._updated_at is not None and now < self._updated_at:
+                if self._last_card_time is not None and self._last_card_time > now:
+                    return
+                shift = self._regen(now, self._updated_at)
+                low = min(float(ELIXIR_MAX), value + shift)
+                high = min(float(ELIXIR_MAX), value + 0.99 + shift)
+                self._value = min(max(self._value, low), high)
+                return
+            predicted = self._predict(now)
+            if predicted is None:
+                predicted = float(value)
+            self._value = min(max(predicted, float(value)), value + 0.99)
+            self._updated_at = now
+
+    def estimate(self, now=None):
+        """Оценка на момент `now`, округленная вниз до целого (как число на экране), или None."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            value = self._predict(now)
+        return int(value) if value is not None else None
+
+    @property
+    def elixir(self):
+        """Текущая оценка, округленная вниз до целого, или None."""
+        return self.estimate()
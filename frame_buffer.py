@@ -0,0 +1,113 @@
+# Zero-copy frame handoff between the capture thread and its consumers.
+# A fixed set of preallocated slots (triple buffering by default) is shared by one
+# writer and any number of readers. Every published frame gets a monotonically
+# increasing sequence number; readers only ever receive frames they have not seen
+# yet and count the ones they skipped.
+
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_SLOTS = 3
+
+class FrameRing:
+    """
+    Кольцо предвыделенных буферов кадров.
+    Писатель: acquire_write() -> заполнить буфер -> publish().
+    Читатели: reader() -> FrameReader.read() возвращает последний новый кадр без копирования.
+    Слот, который сейчас читают, не перезаписывается, поэтому слотов должно быть
+    не меньше, чем читателей + 2.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=DEFAULT_SLOTS):
+        if slots < 2:
+            raise ValueError("FrameRing требует минимум 2 слота")
+        self.shape = tuple(shape)
+        self._buffers = [np.zeros(shape, dtype=dtype) for _ in range(slots)]
+        self._slot_seq = [0] * slots
+        # time.monotonic() публикации кадра в каждом слоте (момент захвата)
+        self._slot_time = [0.0] * slots
+        self._pins = [0] * slots
+        self._condition = threading.Condition()
+        self._latest = None
+        self._writing = None
+        self.sequence = 0
+
+    def acquire_write(self):
+        """Возвращает свободный буфер для записи следующего кадра."""
+        with self._condition:
+            for slot in range(len(self._buffers)):
+                if slot != self._latest and self._pins[slot] == 0:
+                    self._writing = slot
+                    return self._buffers[slot]
+        raise RuntimeError("FrameRing: нет свободного слота, увеличьте число слотов")
+
+    def publish(self):
+        """Публикует записанный буфер как самый свежий кадр и будит читателей."""
+        with self._condition:
+            if self._writing is None:
+                raise RuntimeError("FrameRing: publish() без acquire_write()")
+            self.sequence += 1
+            self._slot_seq[self._writing] = self.sequence
+            self._slot_time[self._writing] = time.monotonic()
+            self._latest = self._writing
+            self._writing = None
+            self._condition.notify_all()
+            return self.sequence
+
+    def write(self, frame):
+        """Копирует готовый кадр в кольцо (для источников, которые не умеют писать в буфер сами)."""
+        np.copyto(self.acquire_write(), frame)
+        return self.publish()
+
+    def reader(self):
+        return FrameReader(self)
+
+class FrameReader:
+    """Курсор читателя: помнит последний обработанный кадр и считает пропущенные."""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.last_seq = 0
+        self.frames_read = 0
+        self.dropped = 0
+        # Время захвата последнего прочитанного кадра (time.monotonic())
+        self.last_timestamp = 0.0
+        self._slot = None
+
+    def read(self, timeout=None):
+        """
+        Ждет кадр новее последнего прочитанного и возвращает (seq, frame).
+        frame — представление буфера только для чтения, действительное до следующего
+        вызова read() или release(). При таймауте возвращает (None, None).
+        """
+        ring = self.ring
+        with ring._condition:
+            if not ring._condition.wait_for(lambda: ring.sequence > self.last_seq, timeout=timeout):
+                return None, None
+            self._release_locked()
+            slot = ring._latest
+            seq = ring._slot_seq[slot]
+            self.last_timestamp = ring._slot_time[slot]
+            ring._pins[slot] += 1
+            self._slot = slot
+
+        if self.last_seq:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.frames_read += 1
+
+        frame = ring._buffers[slot].view()
+        frame.flags.writeable = False
+        return seq, frame
+
+    def release(self):
+        """Освобождает слот последнего прочитанного кадра."""
+        with self.ring._condition:
+            self._release_locked()
+
+    def _release_locked(self):
+        if self._slot is not None:
+            self.ring._pins[self._slot] -= 1
+            self._slot = None
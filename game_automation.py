@@ -3,86 +3,95 @@
 # such as clicking on cards and locations on the screen.
 # This will likely use pyautogui or ADB. 
 
-import pyautogui
 import time
 import random
+import threading
 
-# --- Координаты, полученные после калибровки ---
+# Координаты калибровки (CARD_SLOTS, PLAYABLE_AREA, VISION_CAPTURE_AREA) — в calibration.py
+from calibration import CARD_SLOTS, PLAYABLE_AREA, VISION_CAPTURE_AREA
 
-# Координаты центров для 4-х слотов карт в руке
-CARD_SLOTS = [
-    (2900, 1241), # Слот 1
-    (3050, 1241), # Слот 2
-    (3200, 1241), # Слот 3
-    (3350, 1241)  # Слот 4
-]
+try:
+    import pyautogui
+except Exception:
+    # На безголовом Linux pyautogui не импортируется без дисплея — работаем только в DRY_RUN
+    pyautogui = None
 
-# Прямоугольная область игрового поля, куда можно ставить юнитов
-# (левый_верхний_x, левый_верхний_y, правый_нижний_x, правый_нижний_y)
-PLAYABLE_AREA = (2731, 636, 3385, 1058)
+# Режим без кликов: действия только печатаются (для прогонов на записанных кадрах)
+DRY_RUN = False
 
-# Область захвата экрана, которая передается в модель зрения
-# Это нужно для пересчета координат
-VISION_CAPTURE_AREA = {"top": 35, "left": 2674, "width": 766, "height": 1355}
+# Мышь одна на все окна: пара кликов "карта -> поле" не должна перемешаться с кликами
+# другого окна (см. multi_instance.py)
+_input_lock = threading.Lock()
 
-def convert_vision_to_global_coords(local_coords):
+def convert_vision_to_global_coords(local_coords, capture_area=None):
     """
     Преобразует локальные координаты от модуля зрения в глобальные экранные координаты.
+    capture_area — область захвата окна, по умолчанию VISION_CAPTURE_AREA.
     """
+    capture_area = capture_area or VISION_CAPTURE_AREA
     local_x, local_y = local_coords
-    global_x = local_x + VISION_CAPTURE_AREA["left"]
-    global_y = local_y + VISION_CAPTURE_AREA["top"]
+    global_x = local_x + capture_area["left"]
+    global_y = local_y + capture_area["top"]
     return (global_x, global_y)
 
-def clamp_coords_to_playable_area(coords):
+def clamp_coords_to_playable_area(coords, playable_area=None):
     """
-    "Примагничивает" координаты к ближайшей точке внутри PLAYABLE_AREA.
+    "Примагничивает" координаты к ближайшей точке внутри PLAYABLE_AREA (или playable_area).
     """
     x, y = coords
-    x_min, y_min, x_max, y_max = PLAYABLE_AREA
+    x_min, y_min, x_max, y_max = playable_area or PLAYABLE_AREA
     
     clamped_x = max(x_min, min(x, x_max))
     clamped_y = max(y_min, min(y, y_max))
     
     return (clamped_x, clamped_y)
 
-def is_within_playable_area(coords):
+def is_within_playable_area(coords, playable_area=None):
     """Проверяет, находятся ли координаты внутри игровой области."""
     x, y = coords
-    x_min, y_min, x_max, y_max = PLAYABLE_AREA
+    x_min, y_min, x_max, y_max = playable_area or PLAYABLE_AREA
     return x_min <= x <= x_max and y_min <= y <= y_max
 
-def play_card(card_slot_index, placement_coords):
+def play_card(card_slot_index, placement_coords, card_slots=None, playable_area=None):
     """
     Разыгрывает карту из указанного слота в указанное место на поле.
 
     :param card_slot_index: Индекс слота карты (0, 1, 2 или 3).
     :param placement_coords: Кортеж (x, y) для размещения на поле.
+    :param card_slots: Координаты слотов окна, по умолчанию CARD_SLOTS.
+    :param playable_area: Игровая зона окна, по умолчанию PLAYABLE_AREA.
     :return: True, если действие выполнено, False в случае ошибки.
     """
+    card_slots = card_slots or CARD_SLOTS
     # 1. Проверка входных данных
-    if not 0 <= card_slot_index < len(CARD_SLOTS):
+    if not 0 <= card_slot_index < len(card_slots):
         print(f"[Automation ERROR] Неверный индекс слота карты: {card_slot_index}")
         return False
 
-    if not is_within_playable_area(placement_coords):
+    if not is_within_playable_area(placement_coords, playable_area):
         print(f"[Automation ERROR] Координаты {placement_coords} вне игровой зоны.")
         return False
 
     # 2. Получение координат карты
-    card_coords = CARD_SLOTS[card_slot_index]
+    card_coords = card_slots[card_slot_index]
 
     # 3. Симуляция действий
     print(f"[Action] Играем карту из слота {card_slot_index+1} в точку {placement_coords}")
+    if DRY_RUN:
+        return True
+    if pyautogui is None:
+        print("[Automation ERROR] pyautogui недоступен (нет дисплея). Используйте DRY_RUN.")
+        return False
     try:
         # Устанавливаем небольшую паузу между действиями, чтобы игра успела среагировать
         pyautogui.PAUSE = 0.1
         
-        # Кликаем на карту
-        pyautogui.click(card_coords)
-        
-        # Кликаем на поле
-        pyautogui.click(placement_coords)
+        with _input_lock:
+            # Кликаем на карту
+            pyautogui.click(card_coords)
+            
+            # Кликаем на поле
+            pyautogui.click(placement_coords)
         
         return True
     except Exception as e:
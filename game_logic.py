@@ -3,19 +3,16 @@
 # Initially, this will be a simple rule-based system. 
 
 from game_state import GameState
-import math
+from placement import ThreatMap, MODE_DEFENSE, MODE_SUPPORT, MODE_ROW
 
 # --- Константы для принятия решений ---
 DEFENSE_RADIUS = 300
 SAFE_PLAY_COORDS = (515, 650) 
 # Смещаем точку атаки немного вниз, чтобы она попадала в игровую зону
 BRIDGE_ATTACK_COORDS = (515, 610)
+# Точки выше — ориентиры по Y; X (линию) выбирает карта угроз (placement.py)
 TANK_CLASSES = ['MyPekka', 'MyGiant', 'MyGolem', 'MyBarbarian'] 
 
-def _get_distance(point1, point2):
-    """Вычисляет евклидово расстояние между двумя точками."""
-    return math.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
-
 def _get_box_center(box):
     """Находит центр рамки (bounding box)."""
     x1, y1, x2, y2 = box
@@ -24,18 +21,16 @@ def _get_box_center(box):
 def choose_action_rule_based(game_state: GameState):
     """
     Принимает решение о следующем действии на основе простых правил.
+    Точки розыгрыша выбираются по карте угроз кадра (placement.ThreatMap).
     """
-    
+    threat_map = ThreatMap(game_state)
+
     # --- Приоритет №1: ЗАЩИТА ---
-    if game_state.enemy_units:
-        for enemy in game_state.enemy_units:
-            enemy_center = _get_box_center(enemy.box)
-            for tower in game_state.my_towers:
-                tower_center = _get_box_center(tower.box)
-                if _get_distance(enemy_center, tower_center) < DEFENSE_RADIUS:
-                    if game_state.cards:
-                        print(f"[Brain] ЗАЩИТА! Враг {enemy.class_name} близко. Играем карту 0 на него.")
-                        return {'slot_index': 0, 'coords': (int(enemy_center[0]), int(enemy_center[1]))}
+    if game_state.cards and threat_map.threatened_towers(DEFENSE_RADIUS).any():
+        enemy = game_state.enemy_units[threat_map.closest_enemy()]
+        coords = threat_map.best_placement(MODE_DEFENSE)
+        print(f"[Brain] ЗАЩИТА! Враг {enemy.class_name} близко. Играем карту 0 в {coords}.")
+        return {'slot_index': 0, 'coords': coords}
 
     # --- Приоритет №2: ПОДДЕРЖКА АТАКИ ---
     if game_state.my_units and game_state.elixir and game_state.elixir >= 4:
@@ -44,23 +39,25 @@ def choose_action_rule_based(game_state: GameState):
         if front_unit_coords[1] > 480: # Y-координата моста
             if game_state.cards:
                 print(f"[Brain] ПОДДЕРЖКА АТАКИ! Добавляем юнита к {front_unit.class_name}.")
-                return {'slot_index': 1, 'coords': (int(front_unit_coords[0]), int(front_unit_coords[1] + 50))}
+                target = (front_unit_coords[0], front_unit_coords[1] + 50)
+                return {'slot_index': 1, 'coords': threat_map.best_placement(MODE_SUPPORT, target)}
 
     # --- Приоритет №3: НАЧАЛО АТАКИ ---
     if game_state.elixir and game_state.elixir >= 8: # Уменьшим порог для большей активности
         if game_state.cards:
-            # Ищем танка в руке
+            # Ищем танка в руке; индекс в get_hand_cards() совпадает со слотом CARD_SLOTS
             tank_card_index = -1
-            for i, card in enumerate(game_state.cards):
-                if not card.is_next and card.class_name.replace('Deck', '') in TANK_CLASSES:
+            for i, card in enumerate(game_state.get_hand_cards()):
+                if card.class_name.replace('Deck', '') in TANK_CLASSES:
                     tank_card_index = i
                     break
             
             if tank_card_index != -1:
                 print(f"[Brain] НАЧАЛО АТАКИ (Танк)! Эликсир {game_state.elixir}. Играем танка в безопасную зону.")
-                return {'slot_index': tank_card_index, 'coords': SAFE_PLAY_COORDS}
+                return {'slot_index': tank_card_index,
+                        'coords': threat_map.best_placement(MODE_ROW, SAFE_PLAY_COORDS[1])}
             else:
                 print(f"[Brain] НАЧАЛО АТАКИ (Экономика)! Эликсир {game_state.elixir}. Играем карту 2 у моста.")
-                return {'slot_index': 2, 'coords': BRIDGE_ATTACK_COORDS}
+                return {'slot_index': 2, 'coords': threat_map.best_placement(MODE_ROW, BRIDGE_ATTACK_COORDS[1])}
 
     return None 
\ No newline at end of file
@@ -1,6 +1,10 @@
+import math
+import struct
 from dataclasses import dataclass, field
 from typing import List, Dict, Tuple, Optional
 
+import numpy as np
+
 @dataclass
 class Tower:
     class_name: str
@@ -11,6 +15,9 @@ class Tower:
 class Unit:
     class_name: str
     box: Tuple[int, int, int, int]
+    track_id: Optional[int] = None
+    # Скорость центра юнита в пикселях в секунду (по данным трекера)
+    velocity: Tuple[float, float] = (0.0, 0.0)
 
 @dataclass
 class Card:
@@ -28,6 +35,13 @@ class GameState:
     cards: List[Card] = field(default_factory=list)
     match_over: bool = False
     game_start: bool = False
+    # Сквозные отметки времени (time.monotonic()): захват кадра, конец восприятия,
+    # принятие решения и клик. 0.0 — этап еще не наступил.
+    frame_seq: int = 0
+    capture_time: float = 0.0
+    inference_done_time: float = 0.0
+    decision_time: float = 0.0
+    action_time: float = 0.0
 
     def __str__(self):
         """Красивый вывод состояния игры в консоль."""
@@ -64,4 +78,271 @@ class GameState:
         return self.my_towers
     
     def get_enemy_towers(self) -> List[Tower]:
-        return self.enemy_towers 
\ No newline at end of file
+        return self.enemy_towers
+
+    def to_compact(self) -> tuple:
+        """Компактное представление из кортежей — дешево сериализуется для передачи между процессами."""
+        return (
+            self.elixir,
+            tuple((t.class_name, t.health, tuple(t.box)) for t in self.my_towers),
+            tuple((t.class_name, t.health, tuple(t.box)) for t in self.enemy_towers),
+            tuple((u.class_name, tuple(u.box), u.track_id, tuple(u.velocity)) for u in self.my_units),
+            tuple((u.class_name, tuple(u.box), u.track_id, tuple(u.velocity)) for u in self.enemy_units),
+            tuple((c.class_name, tuple(c.box), c.is_next) for c in self.cards),
+            self.match_over,
+            self.game_start,
+            self.frame_seq,
+            self.capture_time,
+            self.inference_done_time,
+        )
+
+    def get_hand_cards(self) -> List[Card]:
+        """Карты в руке (без следующей), упорядоченные слева направо, как слоты CARD_SLOTS."""
+        return sorted((c for c in self.cards if not c.is_next), key=lambda c: c.box[0])
+
+# --- КОМПАКТНОЕ ПРЕДСТАВЛЕНИЕ ---
+# Юниты — структурированный массив NumPy, башни и карты — фиксированное число слотов.
+# Снимок строится из масок детекций без создания объекта на каждую рамку, его массивы
+# только для чтения (снимок можно отдавать другим потокам без копий), и он сериализуется
+# в байты одним вызовом.
+
+UNIT_DTYPE = np.dtype([('class_id', np.int16), ('is_mine', np.bool_), ('box', np.int32, (4,)),
+                       ('track_id', np.int32), ('velocity', np.float32, (2,))])
+TOWER_DTYPE = np.dtype([('class_id', np.int16), ('is_mine', np.bool_), ('health', np.int32),
+                        ('box', np.int32, (4,))])
+CARD_DTYPE = np.dtype([('class_id', np.int16), ('is_next', np.bool_), ('box', np.int32, (4,))])
+MAX_TOWERS = 6
+MAX_CARDS = 5
+# class_id пустого слота башни или карты
+EMPTY_SLOT = -1
+
+SNAPSHOT_VERSION = 2
+# Заголовок: версия, эликсир (NaN — неизвестен), флаги, номер кадра, кадр HP башен, 4 отметки времени, число юнитов
+_SNAPSHOT_HEADER = struct.Struct('<HfBqq4dI')
+_FLAG_GAME_START = 1
+_FLAG_MATCH_OVER = 2
+
+def class_name_list(names):
+    """Словарь model.names (id -> имя) в список, индексируемый id класса."""
+    class_names = [''] * (max(names) + 1 if names else 0)
+    for class_id, class_name in names.items():
+        class_names[class_id] = class_name
+    return class_names
+
+def make_tower_slots(records=()):
+    """Массив MAX_TOWERS слотов башен из записей (class_id, is_mine, health, box); свои башни первыми, слева направо."""
+    towers = np.zeros(MAX_TOWERS, dtype=TOWER_DTYPE)
+    towers['class_id'] = EMPTY_SLOT
+    records = sorted(records, key=lambda r: (not r[1], r[3][0]))[:MAX_TOWERS]
+    for i, (class_id, is_mine, health, box) in enumerate(records):
+        towers[i] = (class_id, is_mine, health, box)
+    return towers
+
+def make_card_slots(class_ids=(), boxes=(), is_next=(), conf=None):
+    """
+    Массив MAX_CARDS слотов карт, слева направо. Если рамок больше, чем слотов,
+    остаются самые уверенные.
+    """
+    class_ids, boxes, is_next = np.asarray(class_ids), np.asarray(boxes).reshape(-1, 4), np.asarray(is_next)
+    if len(class_ids) > MAX_CARDS and conf is not None:
+        keep = np.argsort(-np.asarray(conf))[:MAX_CARDS]
+        class_ids, boxes, is_next = class_ids[keep], boxes[keep], is_next[keep]
+    order = np.argsort(boxes[:, 0], kind='stable')[:MAX_CARDS]
+    cards = np.zeros(MAX_CARDS, dtype=CARD_DTYPE)
+    cards['class_id'] = EMPTY_SLOT
+    count = len(order)
+    cards['class_id'][:count] = class_ids[order]
+    cards['box'][:count] = boxes[order]
+    cards['is_next'][:count] = is_next[order]
+    return cards
+
+class GameSnapshot:
+    """
+    Снимок состояния игры на массивах. По чтению совместим с GameState
+    (my_units, my_towers, cards, elixir, get_hand_cards() и т.д.): списки объектов
+    Unit/Tower/Card создаются только при первом обращении и кэшируются.
+    Массивы и поля состояния не меняются после создания. Изменяемы только отметки
+    времени конвейера: inference_done_time, decision_time и action_time, и каждую
+    записывает один этап (зрение, основной цикл, исполнитель действий).
+    towers_frame_seq — номер кадра, с которого прочитано здоровье башен (при OCR в
+    конвейере оно отстает от frame_seq).
+    """
+
+    __slots__ = ('elixir', 'game_start', 'match_over', 'frame_seq', 'towers_frame_seq', 'capture_time',
+                 'inference_done_time', 'decision_time', 'action_time', 'unit_array', 'tower_array', 'card_array', 'class_names', '_views')
+
+    def __init__(self, unit_array, tower_array, card_array, class_names, elixir=None, game_start=False, match_over=False,
+                 frame_seq=0, capture_time=0.0, inference_done_time=0.0, decision_time=0.0, action_time=0.0,
+                 towers_frame_seq=0):
+        for array in (unit_array, tower_array, card_array):
+            array.flags.writeable = False
+        self.unit_array = unit_array
+        self.tower_array = tower_array
+        self.card_array = card_array
+        self.class_names = class_names
+        self.elixir = elixir
+        self.game_start = game_start
+        self.match_over = match_over
+        self.frame_seq = frame_seq
+        self.towers_frame_seq = towers_frame_seq
+        self.capture_time = capture_time
+        self.inference_done_time = inference_done_time
+        self.decision_time = decision_time
+        self.action_time = action_time
+        self._views = {}
+
+    @classmethod
+    def empty(cls, class_names=()):
+        return cls(np.zeros(0, dtype=UNIT_DTYPE), make_tower_slots(), make_card_slots(), list(class_names))
+
+    @classmethod
+    def from_game_state(cls, game_state: GameState, class_ids: Dict[str, int], class_names):
+        """Переводит GameState в снимок; class_ids — имя класса -> id."""
+        units = np.zeros(len(game_state.my_units) + len(game_state.enemy_units), dtype=UNIT_DTYPE)
+        for i, (unit, is_mine) in enumerate([(u, True) for u in game_state.my_units] +
+                                            [(u, False) for u in game_state.enemy_units]):
+            track_id = unit.track_id if unit.track_id is not None else -1
+            units[i] = (class_ids.get(unit.class_name, EMPTY_SLOT), is_mine, unit.box, track_id, unit.velocity)
+        towers = make_tower_slots([(class_ids.get(t.class_name, EMPTY_SLOT), True, t.health, t.box)
+                                   for t in game_state.my_towers] +
+                                  [(class_ids.get(t.class_name, EMPTY_SLOT), False, t.health, t.box)
+                                   for t in game_state.enemy_towers])
+        cards = make_card_slots([class_ids.get(c.class_name, EMPTY_SLOT) for c in game_state.cards],
+                                [c.box for c in game_state.cards], [c.is_next for c in game_state.cards])
+        return cls(units, towers, cards, class_names, elixir=game_state.elixir, game_start=game_state.game_start,
+                   match_over=game_state.match_over, frame_seq=game_state.frame_seq,
+                   capture_time=game_state.capture_time, inference_done_time=game_state.inference_done_time,
+                   decision_time=game_state.decision_time, action_time=game_state.action_time,
+                   towers_frame_seq=game_state.frame_seq)
+
+    # --- Совместимое с GameState чтение ---
+
+    def _view(self, name, build):
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = build()
+        return view
+
+    def _unit_list(self, mine):
+        units = self.unit_array[self.unit_array['is_mine'] == mine]
+        return [Unit(class_name=self.class_names[c], box=tuple(b), track_id=t if t >= 0 else None, velocity=tuple(v))
+                for c, b, t, v in zip(units['class_id'].tolist(), units['box'].tolist(),
+                                      units['track_id'].tolist(), units['velocity'].tolist())]
+
+    def _tower_list(self, mine):
+        towers = self.tower_array[(self.tower_array['class_id'] != EMPTY_SLOT) & (self.tower_array['is_mine'] == mine)]
+        return [Tower(class_name=self.class_names[c], health=h, box=tuple(b))
+                for c, h, b in zip(towers['class_id'].tolist(), towers['health'].tolist(), towers['box'].tolist())]
+
+    @property
+    def my_units(self) -> List[Unit]:
+        return self._view('my_units', lambda: self._unit_list(True))
+
+    @property
+    def enemy_units(self) -> List[Unit]:
+        return self._view('enemy_units', lambda: self._unit_list(False))
+
+    @property
+    def my_towers(self) -> List[Tower]:
+        return self._view('my_towers', lambda: self._tower_list(True))
+
+    @property
+    def enemy_towers(self) -> List[Tower]:
+        return self._view('enemy_towers', lambda: self._tower_list(False))
+
+    @property
+    def cards(self) -> List[Card]:
+        def build():
+            cards = self.card_array[self.card_array['class_id'] != EMPTY_SLOT]
+            return [Card(class_name=self.class_names[c], box=tuple(b), is_next=n)
+                    for c, b, n in zip(cards['class_id'].tolist(), cards['box'].tolist(), cards['is_next'].tolist())]
+        return self._view('cards', build)
+
+    def get_my_towers(self) -> List[Tower]:
+        return self.my_towers
+
+    def get_enemy_towers(self) -> List[Tower]:
+        return self.enemy_towers
+
+    def get_hand_cards(self) -> List[Card]:
+        """Карты в руке (без следующей), слева направо, как слоты CARD_SLOTS."""
+        return [c for c in self.cards if not c.is_next]
+
+    def to_game_state(self) -> GameState:
+        return GameState(elixir=self.elixir, my_towers=self.my_towers, enemy_towers=self.enemy_towers,
+                         my_units=self.my_units, enemy_units=self.enemy_units, cards=self.cards,
+                         match_over=self.match_over, game_start=self.game_start, frame_seq=self.frame_seq,
+                         capture_time=self.capture_time, inference_done_time=self.inference_done_time,
+                         decision_time=self.decision_time, action_time=self.action_time)
+
+    def to_compact(self) -> tuple:
+        return self.to_game_state().to_compact()
+
+    def __str__(self):
+        return str(self.to_game_state())
+
+    # --- Сравнение и сериализация ---
+
+    def diff(self, previous: 'GameSnapshot') -> dict:
+        """
+        Изменения относительно предыдущего снимка; в словарь попадают только изменившиеся поля:
+        elixir, game_start, match_over — (было, стало); tower_health — [(класс, было, стало)];
+        towers — слоты башен изменились; units_appeared / units_gone — id треков; cards — (было, стало).
+        """
+        changes = {}
+        for name in ('elixir', 'game_start', 'match_over'):
+            old, new = getattr(previous, name), getattr(self, name)
+            if old != new:
+                changes[name] = (old, new)
+
+        if not np.array_equal(previous.tower_array['class_id'], self.tower_array['class_id']):
+            changes['towers'] = True
+        else:
+            changed = np.flatnonzero((self.tower_array['class_id'] != EMPTY_SLOT) &
+                                     (previous.tower_array['health'] != self.tower_array['health']))
+            if changed.size:
+                changes['tower_health'] = [(self.class_names[self.tower_array['class_id'][i]],
+                                            int(previous.tower_array['health'][i]), int(self.tower_array['health'][i]))
+                                           for i in changed.tolist()]
+
+        old_ids = previous.unit_array['track_id'][previous.unit_array['track_id'] >= 0]
+        new_ids = self.unit_array['track_id'][self.unit_array['track_id'] >= 0]
+        appeared, gone = np.setdiff1d(new_ids, old_ids), np.setdiff1d(old_ids, new_ids)
+        if appeared.size:
+            changes['units_appeared'] = appeared.tolist()
+        if gone.size:
+            changes['units_gone'] = gone.tolist()
+
+        if not np.array_equal(previous.card_array['class_id'], self.card_array['class_id']):
+            changes['cards'] = ([c.class_name for c in previous.cards], [c.class_name for c in self.cards])
+        return changes
+
+    def to_bytes(self) -> bytes:
+        """Бинарная сериализация: заголовок и сырые байты массивов (имена классов не входят)."""
+        flags = (_FLAG_GAME_START if self.game_start else 0) | (_FLAG_MATCH_OVER if self.match_over else 0)
+        header = _SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, math.nan if self.elixir is None else self.elixir, flags,
+                                       self.frame_seq, self.towers_frame_seq, self.capture_time, self.inference_done_time,
+                                       self.decision_time, self.action_time, len(self.unit_array))
+        return b''.join((header, self.unit_array.tobytes(), self.tower_array.tobytes(), self.card_array.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data, class_names) -> 'GameSnapshot':
+        """Восстанавливает снимок из to_bytes() без копирования массивов."""
+        (version, elixir, flags, frame_seq, towers_frame_seq, capture_time, inference_done_time, decision_time,
+         action_time, unit_count) = _SNAPSHOT_HEADER.unpack_from(data)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия снимка: {version}")
+        offset = _SNAPSHOT_HEADER.size
+        if unit_count:
+            units = np.frombuffer(data, dtype=UNIT_DTYPE, count=unit_count, offset=offset)
+        else:
+            units = np.zeros(0, dtype=UNIT_DTYPE)
+        offset += units.nbytes
+        towers = np.frombuffer(data, dtype=TOWER_DTYPE, count=MAX_TOWERS, offset=offset)
+        offset += towers.nbytes
+        cards = np.frombuffer(data, dtype=CARD_DTYPE, count=MAX_CARDS, offset=offset)
+        return cls(units, towers, cards, class_names, elixir=None if math.isnan(elixir) else int(elixir),
+                   game_start=bool(flags & _FLAG_GAME_START), match_over=bool(flags & _FLAG_MATCH_OVER),
+                   frame_seq=frame_seq, capture_time=capture_time, inference_done_time=inference_done_time,
+                   decision_time=decision_time, action_time=action_time, towers_frame_seq=towers_frame_seq)
+
@@ -7,20 +7,127 @@
 import cv2
 import numpy as np
 import pytesseract
-import math
-from ultralytics import YOLO
-from game_state import GameState, Tower, Unit, Card
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import NamedTuple, Tuple
+from game_state import GameSnapshot, UNIT_DTYPE, EMPTY_SLOT, make_card_slots, make_tower_slots
+from digit_ocr import DigitReader
+from elixir_estimator import ElixirEstimator
+from tracking import UnitTracker
+from ocr_cache import OcrCache
+from metrics import registry as metrics
+from ocr_pipeline import OcrPipeline
+from hand_recognizer import CardTemplates, HandRecognizer, HAND_SIZE, NEXT_SLOT
+from tower_layout import TowerLayout, match_hp_to_towers
+from perception_scheduler import (SlowComponentScheduler, COMPONENT_TOWER_HEALTH, COMPONENT_ELIXIR_OCR,
+                                  CARD_PLAYED_OCR_DELAY)
 import time
 
 # --- НАСТРОЙКИ И КОНСТАНТЫ ---
 
-# OCR
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# OCR. Путь к tesseract по умолчанию задается только на Windows; TESSERACT_CMD его переопределяет.
+TESSERACT_CMD = os.environ.get('TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe' if os.name == 'nt' else None)
+if TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
 ELIXIR_ROI = (213, 1293, 27, 34)
+ELIXIR_OCR_CONFIG = r'--psm 8 -c tessedit_char_whitelist=0123456789'
+HP_OCR_CONFIG = r'--psm 7 -c tessedit_char_whitelist=0123456789'
+
+# Встроенный распознаватель цифр (см. digit_ocr.py). Если файла шаблонов нет,
+# используется только tesseract.
+DIGIT_TEMPLATES_PATH = "digit_templates.npz"
+digit_reader = DigitReader.load(DIGIT_TEMPLATES_PATH) if os.path.exists(DIGIT_TEMPLATES_PATH) else None
+
+# Оценка эликсира по полосе и модели восстановления; OCR лишь корректирует дрейф.
+# main.py сообщает ей о разыгранных картах через on_card_played().
+elixir_estimator = ElixirEstimator()
+
+# Треки юнитов: скорости по ключевым кадрам и экстраполяция между ними
+unit_tracker = UnitTracker()
+
+# Планировщик медленных компонентов (см. perception_scheduler.py). Включается, когда
+# perceive_game_state получает analyze_slow_components=SLOW_AUTO.
+slow_scheduler = SlowComponentScheduler()
+SLOW_AUTO = 'auto'
+SLOW_COMPONENTS = frozenset((COMPONENT_TOWER_HEALTH, COMPONENT_ELIXIR_OCR))
+
+# Кэш результатов OCR по содержимому порогового кропа (см. ocr_cache.py). 0 — выключен.
+OCR_CACHE_SIZE = 256
+ocr_cache = OcrCache(OCR_CACHE_SIZE)
+
+# OCR медленных компонентов в пуле потоков (ocr_pipeline): кадр N читается параллельно
+# с YOLO кадра N+1, результаты сливаются в свежий снимок с номером своего кадра.
+# False — OCR выполняется внутри perceive_game_state.
+OCR_PIPELINE = False
+
+# Распознавание руки по слотам карт (см. hand_recognizer.py). Шаблоны карт общие для всех
+# окон, пополняются из детекций карт и сохраняются save_card_templates(). False — карты только из детектора.
+HAND_RECOGNIZER = True
+CARD_TEMPLATES_PATH = "card_templates.npz"
+card_templates = CardTemplates.load(CARD_TEMPLATES_PATH) if os.path.exists(CARD_TEMPLATES_PATH) else CardTemplates()
+hand_recognizer = HandRecognizer(card_templates)
+
+def save_card_templates(path=CARD_TEMPLATES_PATH):
+    """Сохраняет шаблоны карт, если за время работы появились новые."""
+    if card_templates.dirty:
+        card_templates.save(path)
+        print(f"[Vision] Сохранено {len(card_templates)} шаблонов карт в {path}")
+
+# Папка для сохранения обработанных кропов OCR (для разметки и сборки шаблонов). None — выключено.
+OCR_CROP_DUMP_DIR = None
+_ocr_crop_counter = 0
+# OCR может идти в потоках ocr_pipeline — номер кропа выдается под блокировкой
+_ocr_crop_lock = threading.Lock()
 
 # YOLO
 MODEL_PATH = "runs/detect/train6/weights/best.pt"
-model = YOLO(MODEL_PATH)
+
+# Бэкенд инференса. Экспортированные модели (см. backend_compare.py) заметно быстрее
+# на CPU без GPU. Выбирается переменной окружения CR_INFERENCE_BACKEND.
+MODEL_PATHS = {
+    'torch': MODEL_PATH,
+    'onnx': "runs/detect/train6/weights/best.onnx",
+    'openvino': "runs/detect/train6/weights/best_openvino_model",
+    'openvino_int8': "runs/detect/train6/weights/best_int8_openvino_model",
+}
+INFERENCE_BACKEND = os.environ.get('CR_INFERENCE_BACKEND', 'torch')
+# Порог уверенности детекций
+DETECTION_CONF = 0.3
+# Размер входа, на котором обучалась модель (imgsz обучения)
+MODEL_IMGSZ = 900
+# Размер входа при инференсе; None — размер из модели. Меняется на ходу контроллером
+# качества (qos.py). Экспортированные модели с фиксированным входом его не учитывают.
+INFERENCE_IMGSZ = None
+
+def _predict_args(region_imgsz=None):
+    """
+    Аргументы predict/track. Размер входа области масштабируется вместе с INFERENCE_IMGSZ
+    (в той же пропорции к MODEL_IMGSZ), с шагом 32, который требует YOLO.
+    """
+    args = {'conf': DETECTION_CONF, 'verbose': False}
+    if INFERENCE_IMGSZ is None:
+        imgsz = region_imgsz
+    elif region_imgsz is None:
+        imgsz = INFERENCE_IMGSZ
+    else:
+        imgsz = max(32, int(round(region_imgsz * INFERENCE_IMGSZ / MODEL_IMGSZ / 32)) * 32)
+    if imgsz is not None:
+        args['imgsz'] = imgsz
+    return args
+
+def load_model(backend=INFERENCE_BACKEND):
+    """Загружает модель выбранного бэкенда. Интерфейс predict/track у всех одинаковый."""
+    # Импорт здесь: модулям, которым модель не нужна, не приходится грузить ultralytics
+    from ultralytics import YOLO
+    if backend not in MODEL_PATHS:
+        raise ValueError(f"Неизвестный бэкенд инференса: {backend}. Доступны: {', '.join(MODEL_PATHS)}")
+    path = MODEL_PATHS[backend]
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Модель для бэкенда '{backend}' не найдена: {path}. "
+                                f"Экспортируйте ее: python backend_compare.py export")
+    return YOLO(path, task='detect')
 
 # Классы объектов
 ALLY_TOWER_CLASSES = ['MyPrincessTower', 'MyKingTower']
@@ -31,8 +138,6 @@ HP_CLASSES = ['TowerPrincessHP', 'MyPrincessTowerHP', 'MyKingHP', 'KingTowerHP']
 ALLY_HP_CLASSES = ['MyPrincessTowerHP', 'MyKingHP']
 ENEMY_HP_CLASSES = ['TowerPrincessHP', 'KingTowerHP']
 
-CARD_CLASSES = [cls for cls in model.names.values() if 'Deck' in cls or 'Next' in cls]
-
 # Явный список своих юнитов, чтобы избежать ошибочной реакции
 MY_UNIT_CLASSES = [
     'MyBandit', 'MyBarbarian', 'MyBattleRam', 'MyElectroSpirit', 
@@ -42,7 +147,6 @@ MY_UNIT_CLASSES = [
 # Классы, которые являются заклинаниями или состояниями, а не юнитами
 SPELL_CLASSES = ['Rage', 'Empty', 'Arrows', 'FireBall']
 
-UNIT_CLASSES = [cls for cls in model.names.values() if cls not in TOWER_CLASSES + HP_CLASSES + CARD_CLASSES + SPELL_CLASSES + ['Elixir']]
 
 HP_TO_TOWER_MAP = {
     'MyPrincessTowerHP': 'MyPrincessTower',
@@ -50,6 +154,382 @@ HP_TO_TOWER_MAP = {
     'KingTowerHP': 'KingTower',
     'TowerPrincessHP': 'PrincessTower'
 }
+# Класс HP -> (класс башни в GameState, классы детекций, над которыми может стоять рамка).
+# Вражеские принцессы иногда детектируются как EnemyTower.
+HP_TOWER_CANDIDATES = {
+    hp_class: (tower_class, (tower_class, 'EnemyTower') if tower_class == 'PrincessTower' else (tower_class,))
+    for hp_class, tower_class in HP_TO_TOWER_MAP.items()
+}
+# Разрушенные башни: их появление на месте зафиксированной башни сбрасывает раскладку
+BROKEN_TOWER_CLASSES = ['MyPrincessTowerBrocken', 'EnemyTowerBrocken']
+
+# Раскладка башен и областей HP текущего матча (см. tower_layout.py)
+tower_layout = TowerLayout(HP_TOWER_CANDIDATES)
+
+@dataclass
+class PerceptionContext:
+    """
+    Состояние восприятия одного окна игры: оценка эликсира, треки юнитов, планировщик
+    медленных компонентов, раскладка башен, рука и задачи OCR в пуле. Модель, кэш OCR и шаблоны карт общие для всех окон.
+    """
+    name: str = 'default'
+    elixir_estimator: ElixirEstimator = field(default_factory=ElixirEstimator)
+    unit_tracker: UnitTracker = field(default_factory=UnitTracker)
+    slow_scheduler: SlowComponentScheduler = field(default_factory=SlowComponentScheduler)
+    tower_layout: TowerLayout = field(default_factory=lambda: TowerLayout(HP_TOWER_CANDIDATES))
+    hand_recognizer: HandRecognizer = field(default_factory=lambda: HandRecognizer(card_templates))
+    ocr_pipeline: OcrPipeline = field(default_factory=OcrPipeline)
+
+    def reset(self):
+        """Чистое состояние окна: оценка эликсира, треки, планировщик, раскладка башен, рука, задачи OCR."""
+        self.elixir_estimator.clear()
+        self.unit_tracker.reset()
+        self.slow_scheduler.reset()
+        self.tower_layout.reset()
+        self.hand_recognizer.reset()
+        self.ocr_pipeline.reset()
+
+# Контекст единственного окна (main.py); глобальные объекты выше — его части
+default_context = PerceptionContext(elixir_estimator=elixir_estimator, unit_tracker=unit_tracker,
+                                    slow_scheduler=slow_scheduler, tower_layout=tower_layout,
+                                    hand_recognizer=hand_recognizer)
+
+# --- ТАБЛИЦЫ ПОИСКА ПО ID КЛАССА ---
+# Вместо проверки `class_name in UNIT_CLASSES` для каждой рамки все детекции кадра
+# маршрутизируются масками по заранее посчитанным массивам: id класса -> категория / принадлежность.
+
+CATEGORY_OTHER = 0
+CATEGORY_UNIT = 1
+CATEGORY_CARD = 2
+CATEGORY_TOWER = 3
+CATEGORY_HP = 4
+CATEGORY_STATUS = 5
+
+STATUS_CLASSES = ['GameStart', 'MatchOver']
+
+class ClassTables(NamedTuple):
+    """Таблицы, производные от model.names. Строятся один раз при загрузке модели."""
+    category: np.ndarray        # id класса -> CATEGORY_*
+    is_mine: np.ndarray         # id класса -> "свой"
+    is_next: np.ndarray         # id класса -> "следующая карта"
+    names: list                 # id класса -> имя
+    ids: dict                   # имя -> id класса
+    card_classes: list
+    unit_classes: list
+    game_start_id: int
+    match_over_id: int
+    broken_tower_ids: np.ndarray
+
+def _build_class_tables(names):
+    """Строит массивы id класса -> категория, -> "свой", -> "следующая карта", списки имен и особые id."""
+    card_classes = [cls for cls in names.values() if 'Deck' in cls or 'Next' in cls]
+    unit_classes = [cls for cls in names.values()
+                    if cls not in TOWER_CLASSES + HP_CLASSES + card_classes + SPELL_CLASSES + ['Elixir']]
+    size = max(names) + 1
+    category = np.full(size, CATEGORY_OTHER, dtype=np.uint8)
+    is_mine = np.zeros(size, dtype=bool)
+    is_next = np.zeros(size, dtype=bool)
+    class_names = [''] * size
+    for class_id, class_name in names.items():
+        class_names[class_id] = class_name
+        if class_name in STATUS_CLASSES:
+            category[class_id] = CATEGORY_STATUS
+        elif class_name in TOWER_CLASSES:
+            category[class_id] = CATEGORY_TOWER
+            is_mine[class_id] = class_name in ALLY_TOWER_CLASSES
+        elif class_name in HP_CLASSES:
+            category[class_id] = CATEGORY_HP
+            is_mine[class_id] = class_name in ALLY_HP_CLASSES
+        elif class_name in card_classes:
+            category[class_id] = CATEGORY_CARD
+            is_next[class_id] = 'Next' in class_name
+        elif class_name in unit_classes:
+            category[class_id] = CATEGORY_UNIT
+            # Принадлежность по явному списку, а не по префиксу
+            is_mine[class_id] = class_name in MY_UNIT_CLASSES
+    ids = {name: class_id for class_id, name in enumerate(class_names) if name}
+    return ClassTables(
+        category=category, is_mine=is_mine, is_next=is_next, names=class_names, ids=ids,
+        card_classes=card_classes, unit_classes=unit_classes,
+        game_start_id=ids.get('GameStart', -1), match_over_id=ids.get('MatchOver', -1),
+        broken_tower_ids=np.array([ids[n] for n in BROKEN_TOWER_CLASSES if n in ids], dtype=np.int64),
+    )
+
+# --- ДВИЖОК ВОСПРИЯТИЯ ---
+# Модель не загружается при импорте: game_state, game_logic и инструменты импортируют
+# модули без ultralytics. Модель и таблицы классов загружаются один раз на процесс,
+# при первом обращении или заранее (engine.start()), и переживают смену матчей.
+
+# Кадр прогрева: размер окна захвата и число прогонов
+WARMUP_FRAME_SHAPE = (1355, 766, 3)
+WARMUP_RUNS = 2
+
+class PerceptionEngine:
+    """Ленивая загрузка модели, таблиц классов и прогрев инференса."""
+
+    def __init__(self, backend=INFERENCE_BACKEND):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self._model = None
+        self._tables = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        """Загружает модель и строит таблицы классов (один раз, потокобезопасно)."""
+        with self.lock:
+            if self._model is None:
+                start = time.perf_counter()
+                model = load_model(self.backend)
+                self._tables = _build_class_tables(model.names)
+                self._model = model
+                self.load_seconds = time.perf_counter() - start
+                metrics.observe("model_load", self.load_seconds)
+                print(f"[Vision] Модель '{self.backend}' загружена за {self.load_seconds:.2f} с")
+        return self._model
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else self.load()
+
+    @property
+    def tables(self) -> ClassTables:
+        if self._tables is None:
+            self.load()
+        return self._tables
+
+    def warmup(self, frame_shape=WARMUP_FRAME_SHAPE, runs=WARMUP_RUNS):
+        """
+        Прогоняет модель на пустом кадре, чтобы инициализация бэкенда (выделение памяти,
+        компиляция графа) прошла при запуске, а не на первом настоящем кадре. Трекер не
+        используется, чтобы не засорять его состояние. При инференсе по областям
+        прогреваются и их размеры входа.
+        """
+        model = self.model
+        frame = np.zeros(frame_shape, dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model.predict(source=frame, **_predict_args())
+            if REGION_SPLIT:
+                for region in INFERENCE_REGIONS:
+                    x, y, w, h = region.roi
+                    model.predict(source=frame[y:y+h, x:x+w], **_predict_args(region.imgsz))
+        self.warmup_seconds = time.perf_counter() - start
+        metrics.observe("model_warmup", self.warmup_seconds)
+        print(f"[Vision] Прогрев модели: {self.warmup_seconds:.2f} с")
+
+    def start(self, frame_shape=WARMUP_FRAME_SHAPE, warmup=True):
+        """
+        Загружает и прогревает модель в фоновом потоке, пока запускаются захват и
+        остальные потоки. Возвращает поток; перед первым восприятием его нужно дождаться (join).
+        """
+        def run():
+            self.load()
+            if warmup:
+                self.warmup(frame_shape)
+        thread = threading.Thread(target=run, name="perception-warmup", daemon=True)
+        thread.start()
+        return thread
+
+engine = PerceptionEngine()
+
+# Прежние имена модуля (model, CLASS_NAMES, ...) загружают модель при первом обращении
+_ENGINE_TABLE_ATTRS = {
+    'CLASS_CATEGORY': 'category', 'CLASS_IS_MINE': 'is_mine', 'CLASS_IS_NEXT': 'is_next',
+    'CLASS_NAMES': 'names', 'CARD_CLASSES': 'card_classes', 'UNIT_CLASSES': 'unit_classes',
+}
+
+def __getattr__(name):
+    if name == 'model':
+        return engine.model
+    if name in _ENGINE_TABLE_ATTRS:
+        return getattr(engine.tables, _ENGINE_TABLE_ATTRS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- ДЕТЕКЦИИ В ВИДЕ МАССИВОВ ---
+
+class Detections(NamedTuple):
+    """Детекции кадра в виде массивов NumPy: компактно, без тензоров, легко передать в другой процесс."""
+    xyxy: np.ndarray  # (N, 4) int32
+    conf: np.ndarray  # (N,) float32
+    cls: np.ndarray   # (N,) int32
+    track_id: np.ndarray  # (N,) int32, -1 — без трека
+
+EMPTY_DETECTIONS = Detections(
+    xyxy=np.empty((0, 4), dtype=np.int32),
+    conf=np.empty(0, dtype=np.float32),
+    cls=np.empty(0, dtype=np.int32),
+    track_id=np.empty(0, dtype=np.int32),
+)
+
+def detections_from_results(yolo_results):
+    """Переводит результат model.predict в Detections одним проходом."""
+    boxes = yolo_results[0].boxes if yolo_results else None
+    if boxes is None or len(boxes) == 0:
+        return EMPTY_DETECTIONS
+    if boxes.id is not None:
+        track_id = boxes.id.cpu().numpy().astype(np.int32)
+    else:
+        track_id = np.full(len(boxes), -1, dtype=np.int32)
+    return Detections(
+        xyxy=boxes.xyxy.cpu().numpy().astype(np.int32),
+        conf=boxes.conf.cpu().numpy().astype(np.float32),
+        cls=boxes.cls.cpu().numpy().astype(np.int32),
+        track_id=track_id,
+    )
+
+def _merge_detections(parts):
+    """Объединяет детекции нескольких областей в одну структуру."""
+    parts = [p for p in parts if len(p.cls)]
+    if not parts:
+        return EMPTY_DETECTIONS
+    if len(parts) == 1:
+        return parts[0]
+    return Detections(*(np.concatenate(fields) for fields in zip(*parts)))
+
+# --- ИНФЕРЕНС ПО ОБЛАСТЯМ ---
+# Вместо одного model.predict на весь кадр можно запускать отдельные проходы по областям,
+# каждая со своим размером входа и частотой: арена — на каждом ключевом кадре, панель карт —
+# только после розыгрыша карты или на медленном тике, башни — на медленном тике или по событию.
+# Результаты сливаются в одни Detections, поэтому GameState собирается так же, как обычно.
+# Экспортированные модели (ONNX/OpenVINO) имеют фиксированный вход, для них imgsz областей не действует.
+
+@dataclass
+class InferenceRegion:
+    """Область кадра с собственным размером входа модели и частотой обновления."""
+    name: str
+    roi: Tuple[int, int, int, int]      # (x, y, w, h) в координатах кадра
+    imgsz: int
+    categories: Tuple[int, ...]         # какие категории классов берутся из этой области
+    every_n_frames: int = 1             # 0 — только по событию (request_region_refresh)
+    refresh_on_slow_tick: bool = False
+
+# Включает инференс по областям. False — один проход по всему кадру.
+REGION_SPLIT = False
+
+INFERENCE_REGIONS = [
+    InferenceRegion('arena', (0, 0, 766, 1150), imgsz=640,
+                    categories=(CATEGORY_UNIT, CATEGORY_STATUS)),
+    InferenceRegion('cards', (0, 1150, 766, 205), imgsz=320,
+                    categories=(CATEGORY_CARD,), every_n_frames=0, refresh_on_slow_tick=True),
+    InferenceRegion('enemy_towers', (0, 40, 766, 340), imgsz=480,
+                    categories=(CATEGORY_TOWER, CATEGORY_HP), every_n_frames=0, refresh_on_slow_tick=True),
+    InferenceRegion('my_towers', (0, 810, 766, 350), imgsz=480,
+                    categories=(CATEGORY_TOWER, CATEGORY_HP), every_n_frames=0, refresh_on_slow_tick=True),
+]
+
+_region_cache = {}
+_region_pending = set()
+_region_lock = threading.Lock()
+_region_frame_counter = 0
+
+def request_region_refresh(name):
+    """Просит обновить область на ближайшем ключевом кадре (например, 'cards' после розыгрыша)."""
+    with _region_lock:
+        _region_pending.add(name)
+
+def reset_perception(context=None):
+    """
+    Сбрасывает состояние восприятия окна, кэш областей и кэш OCR, чтобы следующий
+    прогон (например, в benchmark.py) не начинался с прогретыми кэшами и старыми треками.
+    """
+    global _region_frame_counter
+    (context or default_context).reset()
+    with _region_lock:
+        _region_cache.clear()
+        _region_pending.clear()
+    _region_frame_counter = 0
+    ocr_cache.clear()
+
+def _run_region(frame, region):
+    """
+    Запускает модель на области и возвращает ее детекции в координатах всего кадра.
+    Все области — обычный predict: трекер ultralytics, подключенный к модели, пропускал бы
+    через состояние арены и рамки других областей. Юниты трекаются в _build_game_state.
+    """
+    tables = engine.tables
+    x, y, w, h = region.roi
+    crop = frame[y:y+h, x:x+w]
+    results = engine.model.predict(source=crop, **_predict_args(region.imgsz))
+    detections = detections_from_results(results)
+    keep = np.isin(tables.category[detections.cls], region.categories)
+    return Detections(
+        xyxy=detections.xyxy[keep] + np.array([x, y, x, y], dtype=np.int32),
+        conf=detections.conf[keep],
+        cls=detections.cls[keep],
+        track_id=detections.track_id[keep],
+    )
+
+def _detect_regions(frame, analyze_slow_components, skip=frozenset()):
+    """
+    Обновляет нужные области и сливает их детекции (необновленные берутся из кэша).
+    Области из skip не обновляются (например, 'cards', когда рука распознана по слотам).
+    """
+    global _region_frame_counter
+    with _region_lock:
+        pending = set(_region_pending)
+        _region_pending.clear()
+
+    for region in INFERENCE_REGIONS:
+        due = region.name not in skip and (
+            region.name not in _region_cache
+            or region.name in pending
+            or (region.every_n_frames and _region_frame_counter % region.every_n_frames == 0)
+            or (analyze_slow_components and region.refresh_on_slow_tick)
+        )
+        if due:
+            _region_cache[region.name] = _run_region(frame, region)
+
+    _region_frame_counter += 1
+    return _merge_detections([_region_cache[r.name] for r in INFERENCE_REGIONS])
+
+def notify_card_played(class_name, context=None, now=None):
+    """Сообщает зрению о розыгрыше карты: списывает эликсир и обновляет панель карт."""
+    ctx = context or default_context
+    ctx.elixir_estimator.on_card_played(class_name, now=now)
+    ctx.slow_scheduler.trigger(COMPONENT_ELIXIR_OCR, 'card_played', delay=CARD_PLAYED_OCR_DELAY, now=now)
+    if HAND_RECOGNIZER:
+        ctx.hand_recognizer.on_card_played(class_name)
+    if not (HAND_RECOGNIZER and ctx.hand_recognizer.ready):
+        request_region_refresh('cards')
+
+# --- ПРОФИЛИРОВАНИЕ ЭТАПОВ ---
+
+# Названия этапов, время которых передается наблюдателю
+STAGE_YOLO = 'yolo_predict'
+STAGE_ELIXIR = 'elixir_ocr'
+STAGE_ELIXIR_BAR = 'elixir_bar'
+STAGE_TOWER_HEALTH = 'tower_health'
+STAGE_BOXES = 'box_classification'
+STAGE_TRACKING = 'tracking'
+STAGE_HAND = 'hand_recognition'
+
+_stage_observer = None
+
+def set_stage_observer(observer):
+    """
+    Устанавливает наблюдателя observer(stage, seconds), который получает длительность
+    каждого этапа `perceive_game_state`. None отключает замеры.
+    """
+    global _stage_observer
+    _stage_observer = observer
+
+@contextmanager
+def _timed_stage(stage):
+    """Замеряет длительность блока и сообщает ее наблюдателю, если он установлен."""
+    observer = _stage_observer
+    if observer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observer(stage, time.perf_counter() - start)
 
 # --- ФУНКЦИИ-ПОМОЩНИКИ (OCR) ---
 
@@ -77,181 +557,392 @@ def _preprocess_for_ocr(image, is_ally=False, is_elixir=False):
     _, thresh = cv2.threshold(gray, threshold_value, 255, cv2.THRESH_BINARY)
     return thresh
 
-def _get_elixir_from_frame(frame):
-    """Извлекает значение эликсира из полного кадра игры."""
-    x, y, w, h = ELIXIR_ROI
-    elixir_image = frame[y:y+h, x:x+w]
+def _dump_ocr_crop(processed_image, value, kind):
+    """
+    Сохраняет обработанный кроп для последующей разметки: в имени файла прочитанное
+    значение и вид кропа (digit_ocr.CROP_KINDS), например `7_elixir_00012.png`.
+    """
+    global _ocr_crop_counter
+    os.makedirs(OCR_CROP_DUMP_DIR, exist_ok=True)
+    label = value if value is not None else 'unknown'
+    with _ocr_crop_lock:
+        index = _ocr_crop_counter
+        _ocr_crop_counter += 1
+    cv2.imwrite(os.path.join(OCR_CROP_DUMP_DIR, f"{label}_{kind}_{index:05d}.png"), processed_image)
+
+def _read_number(processed_image, tesseract_config, kind):
+    """
+    Читает число с обработанного кропа: сначала встроенным распознавателем цифр,
+    при неуверенном результате — через tesseract. Возвращает int или None.
+    kind — вид кропа ('elixir' или 'hp') для имени сохраненного кропа.
+    Если такой же кроп уже распознан, значение берется из ocr_cache (неудачи не кэшируются).
+    """
+    key = OcrCache.key(processed_image, tesseract_config)
+    hit, value = ocr_cache.get(key)
+    if hit:
+        return value
+
+    value = digit_reader.read(processed_image) if digit_reader is not None else None
+    if value is None:
+        try:
+            text = pytesseract.image_to_string(processed_image, config=tesseract_config)
+            value = int(text.strip())
+        except (ValueError, TypeError):
+            value = None
+
+    ocr_cache.put(key, value)
+    if OCR_CROP_DUMP_DIR is not None:
+        _dump_ocr_crop(processed_image, value, kind)
+    return value
+
+def _read_elixir(elixir_image):
+    """Распознает эликсир на кропе ELIXIR_ROI."""
     processed_image = _preprocess_for_ocr(elixir_image, is_elixir=True)
     if processed_image is None: return None
     
-    custom_config = r'--psm 8 -c tessedit_char_whitelist=0123456789'
-    try:
-        text = pytesseract.image_to_string(processed_image, config=custom_config)
-        value = int(text.strip())
-        return value if 0 <= value <= 10 else None
-    except (ValueError, TypeError):
-        return None
+    value = _read_number(processed_image, ELIXIR_OCR_CONFIG, 'elixir')
+    return value if value is not None and 0 <= value <= 10 else None
 
-def _get_tower_health(yolo_results, frame):
-    """Определяет здоровье башен."""
-    # (Эта функция будет идентична той, что мы написали, но я ее сюда вставлю)
-    # ... код определения здоровья ...
-    # Вместо этого я скопирую код из game_state.py в эту область
-    towers = {cls: [] for cls in TOWER_CLASSES}
-    hp_regions = {cls: [] for cls in HP_CLASSES}
-
-    if yolo_results[0].boxes is not None:
-        for box in yolo_results[0].boxes:
-            class_id = int(box.cls[0])
-            class_name = yolo_results[0].names[class_id]
-            coords = [int(i) for i in box.xyxy[0]]
-
-            if class_name in TOWER_CLASSES:
-                towers[class_name].append(coords)
-            elif class_name in HP_CLASSES:
-                hp_regions[class_name].append(coords)
+def _elixir_crop(frame):
+    x, y, w, h = ELIXIR_ROI
+    return frame[y:y+h, x:x+w]
+
+def _get_elixir_from_frame(frame):
+    """Извлекает значение эликсира из полного кадра игры."""
+    return _read_elixir(_elixir_crop(frame))
 
+def _update_tower_layout(detections, game_start, match_over, layout):
+    """
+    Ключевой кадр: сопоставляет рамки HP башням. Пока раскладка не зафиксирована, это
+    ее кандидат; после фиксации — проверка, не разрушена ли одна из башен, и поиск
+    башен, появившихся позже (например, активированной королевской).
+    """
+    tables = engine.tables
+    if not game_start or match_over:
+        return
+    if layout.locked and layout.check_destroyed(detections.xyxy[np.isin(detections.cls, tables.broken_tower_ids)]):
+        return
+
+    categories = tables.category[detections.cls]
+    tower_mask = categories == CATEGORY_TOWER
+    hp_mask = categories == CATEGORY_HP
+    layout.observe([tables.names[c] for c in detections.cls[tower_mask].tolist()], detections.xyxy[tower_mask],
+                   [tables.names[c] for c in detections.cls[hp_mask].tolist()], detections.xyxy[hp_mask])
+
+def _tower_hp_slots(detections, layout):
+    """
+    Слоты "башня — область HP" для OCR и флаг фиксации раскладки. После фиксации
+    (tower_layout) области HP неизменны и рамки YOLO не нужны; до нее пары
+    сопоставляются по детекциям кадра.
+    """
+    tables = engine.tables
+    if layout.locked:
+        return list(layout.slots), True
+    categories = tables.category[detections.cls]
+    tower_mask = categories == CATEGORY_TOWER
+    hp_mask = categories == CATEGORY_HP
+    slots = match_hp_to_towers([tables.names[c] for c in detections.cls[tower_mask].tolist()],
+                               detections.xyxy[tower_mask],
+                               [tables.names[c] for c in detections.cls[hp_mask].tolist()],
+                               detections.xyxy[hp_mask], HP_TOWER_CANDIDATES)
+    return slots, False
+
+def _tower_hp_crops(frame, slots, copy=False):
+    """
+    Кропы HP слотов. copy=True — копии, которые можно отдать в другой поток, пока
+    буфер кадра переиспользуется захватом.
+    """
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (slot.hp_roi for slot in slots)]
+    return [crop.copy() for crop in crops] if copy else crops
+
+def _read_tower_hp(slots, crops):
+    """Здоровье по кропам HP слотов (None — не распознано)."""
+    values = []
+    for slot, crop in zip(slots, crops):
+        processed_image = _preprocess_for_ocr(crop, is_ally=slot.hp_class in ALLY_HP_CLASSES)
+        values.append(_read_number(processed_image, HP_OCR_CONFIG, 'hp') if processed_image is not None else None)
+    return values
+
+def _towers_from_reads(slots, values, locked, layout):
+    """Слоты башен (make_tower_slots) по прочитанному здоровью; при фиксированной раскладке чтения учитываются в ней."""
+    tables = engine.tables
     towers_with_health = []
-    for hp_class, tower_class in HP_TO_TOWER_MAP.items():
-        for hp_box in hp_regions[hp_class]:
-            closest_tower_box = None
-            min_dist = float('inf')
-            
-            possible_towers = towers.get(tower_class, [])
-            if tower_class == 'PrincessTower':
-                possible_towers.extend(towers.get('EnemyTower', []))
-
-            hp_center = ((hp_box[0] + hp_box[2]) / 2, (hp_box[1] + hp_box[3]) / 2)
-
-            for tower_box in possible_towers:
-                tower_center = ((tower_box[0] + tower_box[2]) / 2, (tower_box[1] + tower_box[3]) / 2)
-                dist = math.dist(hp_center, tower_center)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest_tower_box = tower_box
-            
-            if closest_tower_box and min_dist < 250:
-                x1_hp, y1_hp, x2_hp, y2_hp = hp_box
-                hp_crop = None
-                
-                # Определяем параметры обрезки на основе класса
-                if hp_class in ['MyKingHP', 'KingTowerHP']:
-                    crop_right = 32
-                elif hp_class == 'MyPrincessTowerHP':
-                    crop_right = 28
-                else: # TowerPrincessHP
-                    crop_right = 20
-
-                new_x2_hp = x2_hp - crop_right
-
-                # Определяем параметры обрезки на основе класса
-                if hp_class in ['MyKingHP', 'KingTowerHP']:
-                    crop_left = 35
-                elif hp_class == 'MyPrincessTowerHP':
-                    crop_left = 30
-                else: # TowerPrincessHP
-                    crop_left = 20
-
-                new_x1 = x1_hp + crop_left
-
-                # Вертикальная обрезка
-                if hp_class in ALLY_HP_CLASSES:
-                    crop_top = 12
-                    new_y1 = y1_hp + crop_top
-                    if new_x1 < new_x2_hp and new_y1 < y2_hp:
-                        hp_crop = frame[new_y1:y2_hp, new_x1:new_x2_hp]
-                else:
-                    crop_bottom = 10
-                    new_y2 = y2_hp - crop_bottom
-                    if new_x1 < new_x2_hp and y1_hp < new_y2:
-                        hp_crop = frame[y1_hp:new_y2, new_x1:new_x2_hp]
-
-                health_value = None
-                if hp_crop is not None:
-                    is_ally_hp = hp_class in ALLY_HP_CLASSES
-                    custom_config = r'--psm 7 -c tessedit_char_whitelist=0123456789'
-                    try:
-                        processed_image = _preprocess_for_ocr(hp_crop, is_ally=is_ally_hp)
-                        text = pytesseract.image_to_string(processed_image, config=custom_config)
-                        health_value = int(text.strip())
-                    except (ValueError, TypeError):
-                        health_value = None
-                
-                # Добавляем башню, только если удалось распознать здоровье
-                if health_value is not None:
-                    towers_with_health.append(Tower(
-                        class_name=tower_class, 
-                        box=closest_tower_box, 
-                        health=health_value
-                    ))
-
-    return towers_with_health
+    for slot, health_value in zip(slots, values):
+        if locked:
+            layout.record_read(slot, health_value)
+
+        # Добавляем башню, только если удалось распознать здоровье
+        if health_value is not None and slot.class_name in tables.ids:
+            towers_with_health.append((tables.ids[slot.class_name], slot.class_name in ALLY_TOWER_CLASSES,
+                                       health_value, slot.box))
+
+    return make_tower_slots(towers_with_health)
+
+def _get_tower_health(detections, frame, layout=tower_layout):
+    """
+    Определяет здоровье башен в текущем потоке.
+    Возвращает слоты башен (make_tower_slots) с распознанным здоровьем.
+    """
+    slots, locked = _tower_hp_slots(detections, layout)
+    values = _read_tower_hp(slots, _tower_hp_crops(frame, slots))
+    return _towers_from_reads(slots, values, locked, layout)
+
+def _plan_slow_components(analyze_slow_components, keyframe, now, scheduler):
+    """Переводит аргумент analyze_slow_components в набор имен компонентов для этого кадра."""
+    if analyze_slow_components == SLOW_AUTO:
+        return scheduler.plan(now, keyframe)
+    if analyze_slow_components is True:
+        return SLOW_COMPONENTS
+    if not analyze_slow_components:
+        return frozenset()
+    return frozenset(analyze_slow_components)
+
+def _observe_scene(game_state, detections, keyframe, now, scheduler):
+    """Передает планировщику положения юнитов, башен и рамок HP для событийных запусков."""
+    def centers(boxes):
+        boxes = boxes.astype(np.float32)
+        return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+    units, towers = game_state.unit_array, game_state.tower_array
+    towers = towers[towers['class_id'] != EMPTY_SLOT]
+
+    hp_boxes = hp_classes = None
+    if keyframe:
+        hp_mask = engine.tables.category[detections.cls] == CATEGORY_HP
+        hp_boxes, hp_classes = detections.xyxy[hp_mask], detections.cls[hp_mask]
+    scheduler.observe_scene(
+        centers(units['box'][units['is_mine']]), centers(units['box'][~units['is_mine']]),
+        centers(towers['box'][towers['is_mine']]), centers(towers['box'][~towers['is_mine']]),
+        hp_boxes=hp_boxes, hp_classes=hp_classes, now=now)
+
+def _hand_cards(frame, recognizer):
+    """Слоты карт по распознавателю руки или None, если хотя бы одна карта руки не узнана."""
+    tables = engine.tables
+    hand, next_card = recognizer.recognize(frame)
+    if None in hand:
+        return None
+    # Имена классов те же, что у детектора: '<Карта>Deck' в руке, '<Карта>Next' — следующая
+    class_ids = [tables.ids.get(name + 'Deck', EMPTY_SLOT) for name in hand]
+    if EMPTY_SLOT in class_ids:
+        return None
+    boxes, is_next = list(recognizer.rois[:HAND_SIZE]), [False] * len(class_ids)
+    if next_card is not None and next_card + 'Next' in tables.ids:
+        class_ids.append(tables.ids[next_card + 'Next'])
+        boxes.append(recognizer.rois[NEXT_SLOT])
+        is_next.append(True)
+    return make_card_slots(class_ids, boxes, is_next)
+
+def _as_snapshot(game_state):
+    """Прежнее состояние в виде GameSnapshot (GameState, например начальный GameState(), переводится)."""
+    if game_state is None or isinstance(game_state, GameSnapshot):
+        return game_state
+    tables = engine.tables
+    return GameSnapshot.from_game_state(game_state, tables.ids, tables.names)
 
 # --- ГЛАВНАЯ ФУНКЦИЯ МОДУЛЯ ---
 
-def perceive_game_state(frame, last_game_state=None, analyze_slow_components=True):
+def perceive_game_state(frame, last_game_state=None, analyze_slow_components=True, keyframe=True,
+                        frame_seq=0, capture_time=0.0, context=None, now=None):
     """
-    Основная функция, которая принимает кадр и возвращает GameState.
-    - Всегда выполняет быстрый анализ YOLO.
-    - Выполняет медленный анализ OCR только при необходимости.
+    Основная функция, которая принимает кадр и возвращает состояние игры (GameSnapshot).
+    - На ключевых кадрах (keyframe=True) выполняет YOLO по всем классам; ID треков
+      получают только юниты (unit_tracker контекста).
+    - Между ключевыми кадрами YOLO не запускается: позиции юнитов экстраполируются
+      по скоростям треков, карты и башни берутся из `last_game_state`.
+    - Выполняет медленный анализ OCR только при необходимости. analyze_slow_components:
+      True — все медленные компоненты, False — ни одного, набор имен — только они,
+      SLOW_AUTO — по событиям сцены и дедлайнам (slow_scheduler).
+    - Эликсир оценивается на каждом кадре (см. elixir_estimator.py).
     - Использует данные из `last_game_state` если медленный анализ пропускается.
+    - Записывает в снимок номер кадра, время его захвата и время окончания восприятия.
+    - context — состояние окна (PerceptionContext), по умолчанию default_context.
+    - now — время кадра для оценок, зависящих от времени; по умолчанию time.monotonic().
+      Воспроизведение записи передает записанное время захвата, чтобы прогон был повторяемым.
+    Возвращает (GameSnapshot, Detections). Массивы снимка только для чтения, читается он как GameState.
     """
-    results = model.predict(source=frame, conf=0.3, verbose=False, tracker='bytetrack.yaml')
-    
-    current_game_state = GameState()
+    ctx = context or default_context
+    now = time.monotonic() if now is None else now
+    slow = _plan_slow_components(analyze_slow_components, keyframe, now, ctx.slow_scheduler)
+    detections = None
+    if keyframe:
+        with _timed_stage(STAGE_YOLO):
+            if REGION_SPLIT:
+                # Пока рука распознается по слотам, детектор карт не нужен
+                skip = {'cards'} if HAND_RECOGNIZER and ctx.hand_recognizer.ready else frozenset()
+                detections = _detect_regions(frame, COMPONENT_TOWER_HEALTH in slow, skip)
+            else:
+                # Обычный predict: трекер ultralytics отбросил бы впервые увиденные рамки
+                # (GameStart, новые карты и юниты); юниты трекаются в _build_game_state
+                results = engine.model.predict(source=frame, **_predict_args())
+                # Единственное преобразование тензоров в NumPy за кадр
+                detections = detections_from_results(results)
+    return _build_game_state(frame, detections, last_game_state, analyze_slow_components, slow, now,
+                             frame_seq, capture_time, ctx)
+
+def perceive_batch(frames, last_game_states, contexts, analyze_slow_components=True, frame_seqs=None,
+                   capture_times=None):
+    """
+    Восприятие кадров нескольких окон одним батчевым вызовом model.predict.
+    Каждое окно обрабатывается со своим PerceptionContext, в том числе трекером юнитов,
+    поэтому треки разных окон не смешиваются. Каждый кадр ключевой. Возвращает список (GameSnapshot, Detections) в порядке кадров.
+    """
+    now = time.monotonic()
+    plans = [_plan_slow_components(analyze_slow_components, True, now, ctx.slow_scheduler) for ctx in contexts]
+    with _timed_stage(STAGE_YOLO):
+        results = engine.model.predict(source=list(frames), **_predict_args())
+        batch_detections = [detections_from_results([r]) for r in results]
+
+    frame_seqs = frame_seqs or [0] * len(frames)
+    capture_times = capture_times or [0.0] * len(frames)
+    return [
+        _build_game_state(frame, detections, last_game_state, analyze_slow_components, slow, now,
+                          frame_seq, capture_time, ctx)
+        for frame, detections, last_game_state, slow, frame_seq, capture_time, ctx
+        in zip(frames, batch_detections, last_game_states, plans, frame_seqs, capture_times, contexts)
+    ]
+
+def _build_game_state(frame, detections, last_game_state, analyze_slow_components, slow, now,
+                      frame_seq, capture_time, ctx):
+    """
+    Строит GameSnapshot по детекциям ключевого кадра (или по экстраполяции треков, если
+    detections is None) и выполняет запланированные медленные компоненты.
+    Юниты, башни и карты собираются в массивы масками, без объекта на каждую рамку;
+    неизменившиеся башни и карты берутся из прошлого снимка без копирования.
+    """
+    tables = engine.tables
+    keyframe = detections is not None
+    last_game_state = _as_snapshot(last_game_state)
+    elixir_estimator, unit_tracker, slow_scheduler, tower_layout, hand_recognizer = (
+        ctx.elixir_estimator, ctx.unit_tracker, ctx.slow_scheduler, ctx.tower_layout, ctx.hand_recognizer)
+    pipeline = ctx.ocr_pipeline if OCR_PIPELINE else None
+    if keyframe:
+        with _timed_stage(STAGE_TRACKING):
+            # Трекаются только юниты; карты, башни, HP и статусы идут в снимок без задержки
+            unit_mask = tables.category[detections.cls] == CATEGORY_UNIT
+            track_id = np.full(len(detections.cls), -1, dtype=np.int32)
+            track_id[unit_mask] = unit_tracker.assign(detections.cls[unit_mask], detections.xyxy[unit_mask], now)
+            detections = detections._replace(track_id=track_id)
+            unit_tracker.update(track_id[unit_mask], detections.cls[unit_mask],
+                                detections.xyxy[unit_mask], detections.conf[unit_mask], now)
+    else:
+        with _timed_stage(STAGE_TRACKING):
+            detections = Detections(*unit_tracker.extrapolate(now))
+
     # --- НАСЛЕДОВАНИЕ "ЛИПКИХ" СОСТОЯНИЙ ---
-    if last_game_state:
-        current_game_state.game_start = last_game_state.game_start
-        current_game_state.match_over = last_game_state.match_over
-
-    if analyze_slow_components:
-        # Полный анализ: получаем новые данные OCR
-        current_game_state.elixir = _get_elixir_from_frame(frame)
-        all_towers = _get_tower_health(results, frame)
-        # Снова разделяем башни по принадлежности
-        current_game_state.my_towers = [t for t in all_towers if t.class_name in ALLY_TOWER_CLASSES]
-        current_game_state.enemy_towers = [t for t in all_towers if t.class_name in ENEMY_TOWER_CLASSES]
-
-    elif last_game_state is not None:
-        # Быстрый анализ: используем старые данные для медленных компонентов
-        current_game_state.elixir = last_game_state.elixir
-        current_game_state.my_towers = last_game_state.my_towers
-        current_game_state.enemy_towers = last_game_state.enemy_towers
-
-    # Всегда анализируем быстрые компоненты (юниты, карты, СТАТУСЫ)
-    if results[0].boxes is not None:
+    game_start = last_game_state.game_start if last_game_state else False
+    match_over = last_game_state.match_over if last_game_state else False
+
+    # Завершенные задачи OCR прошлых кадров: каждый результат применяется со временем своего кадра
+    towers = towers_frame_seq = None
+    if pipeline is not None:
+        for result in pipeline.collect():
+            if result.component == COMPONENT_ELIXIR_OCR:
+                elixir_estimator.correct_with_ocr(result.value, result.now)
+            elif result.component == COMPONENT_TOWER_HEALTH:
+                slots, locked = result.context
+                towers = _towers_from_reads(slots, result.value, locked, tower_layout)
+                towers_frame_seq = result.frame_seq
+
+    # Эликсир оцениваем на каждом кадре по полосе, без OCR; вне матча оценки нет
+    with _timed_stage(STAGE_ELIXIR_BAR):
+        elixir_estimator.update(frame, now, in_match=game_start and not match_over)
+
+    # OCR эликсира лишь корректирует дрейф оценки. На фиксированном такте (True) он
+    # ограничен интервалом коррекции, у планировщика для этого есть свой дедлайн.
+    # В конвейере компонент, задача которого еще выполняется, пропускается — его событие
+    # остается в планировщике до следующего кадра.
+    if COMPONENT_ELIXIR_OCR in slow and (analyze_slow_components is not True
+                                         or elixir_estimator.needs_ocr_correction(now)):
+        if pipeline is None:
+            with _timed_stage(STAGE_ELIXIR), slow_scheduler.running(COMPONENT_ELIXIR_OCR, now):
+                elixir_estimator.correct_with_ocr(_get_elixir_from_frame(frame), now)
+        elif not pipeline.busy(COMPONENT_ELIXIR_OCR):
+            with slow_scheduler.running(COMPONENT_ELIXIR_OCR, now):
+                pipeline.submit(COMPONENT_ELIXIR_OCR, frame_seq, now, _read_elixir, _elixir_crop(frame).copy())
+
+    if COMPONENT_TOWER_HEALTH in slow and (keyframe or tower_layout.locked):
+        # До фиксации раскладки башен HP ищется по рамкам YOLO, то есть только на ключевых кадрах
+        if pipeline is None:
+            with _timed_stage(STAGE_TOWER_HEALTH), slow_scheduler.running(COMPONENT_TOWER_HEALTH, now):
+                towers = _get_tower_health(detections, frame, tower_layout)
+                towers_frame_seq = frame_seq
+        elif not pipeline.busy(COMPONENT_TOWER_HEALTH):
+            with slow_scheduler.running(COMPONENT_TOWER_HEALTH, now):
+                slots, locked = _tower_hp_slots(detections, tower_layout)
+                pipeline.submit(COMPONENT_TOWER_HEALTH, frame_seq, now, _read_tower_hp,
+                                slots, _tower_hp_crops(frame, slots, copy=True), context=(slots, locked))
+    if towers is None:
+        if last_game_state is not None:
+            # Быстрый анализ: используем старые данные для медленных компонентов
+            towers, towers_frame_seq = last_game_state.tower_array, last_game_state.towers_frame_seq
+        else:
+            towers, towers_frame_seq = make_tower_slots(), 0
+
+    # Всегда анализируем быстрые компоненты (юниты, карты, СТАТУСЫ).
+    # Вся маршрутизация — маски по таблицам id класса, без обхода тензоров по одной рамке.
+    with _timed_stage(STAGE_BOXES):
+        cls = detections.cls
+        boxes = detections.xyxy
+
         # Сначала проверим статусы, они могут влиять на другие решения
-        for box in results[0].boxes:
-            class_name = model.names[int(box.cls[0])]
-            if class_name == 'GameStart':
-                if not current_game_state.game_start:
-                    print("[Vision] Detected GameStart! Bot is now potentially active.")
-                    # Устанавливаем начальное значение эликсира, чтобы бот не ждал OCR
-                    current_game_state.elixir = 7
-                current_game_state.game_start = True
-                current_game_state.match_over = False # Сброс на случай новой игры
-            elif class_name == 'MatchOver':
-                if not current_game_state.match_over:
-                    print("[Vision] Detected MatchOver! Bot will be deactivated.")
-                current_game_state.match_over = True
-        
+        if (cls == tables.game_start_id).any():
+            if not game_start:
+                print("[Vision] Detected GameStart! Bot is now potentially active.")
+                # Устанавливаем начальное значение эликсира, чтобы бот не ждал OCR
+                elixir_estimator.reset(7, now)
+                unit_tracker.reset()
+                slow_scheduler.reset()
+                tower_layout.reset("новый матч")
+                hand_recognizer.reset()
+                if pipeline is not None:
+                    pipeline.reset()
+            game_start = True
+            match_over = False # Сброс на случай новой игры
+        if (cls == tables.match_over_id).any():
+            if not match_over:
+                print("[Vision] Detected MatchOver! Bot will be deactivated.")
+                tower_layout.reset("MatchOver")
+            match_over = True
+
         # Теперь обрабатываем остальные объекты
-        for box in results[0].boxes:
-            class_name = model.names[int(box.cls[0])]
-            coords = tuple(int(i) for i in box.xyxy[0])
-            
-            if class_name in UNIT_CLASSES:
-                # Определяем принадлежность по явному списку, а не по префиксу
-                if class_name in MY_UNIT_CLASSES:
-                    current_game_state.my_units.append(Unit(class_name=class_name, box=coords))
-                else:
-                    current_game_state.enemy_units.append(Unit(class_name=class_name, box=coords))
-
-            elif class_name in CARD_CLASSES:
-                is_next = 'Next' in class_name
-                current_game_state.cards.append(Card(class_name=class_name, box=coords, is_next=is_next))
-            
-            elif class_name in ['MatchOver', 'GameStart']:
-                pass # Уже обработано
-
-    return current_game_state, results 
\ No newline at end of file
+        categories = tables.category[cls]
+        unit_idx = np.flatnonzero(categories == CATEGORY_UNIT)
+        units = np.zeros(len(unit_idx), dtype=UNIT_DTYPE)
+        units['class_id'] = cls[unit_idx]
+        units['is_mine'] = tables.is_mine[cls[unit_idx]]
+        units['box'] = boxes[unit_idx]
+        units['track_id'] = detections.track_id[unit_idx]
+        units['velocity'] = unit_tracker.velocities(detections.track_id[unit_idx])
+
+    cards = None
+    if HAND_RECOGNIZER:
+        with _timed_stage(STAGE_HAND):
+            cards = _hand_cards(frame, hand_recognizer)
+    if cards is None:
+        # Рука по слотам не распознана — карты из детектора; его рамки пополняют шаблоны
+        if keyframe:
+            card_mask = categories == CATEGORY_CARD
+            card_ids = cls[card_mask]
+            cards = make_card_slots(card_ids, boxes[card_mask], tables.is_next[card_ids], detections.conf[card_mask])
+            if HAND_RECOGNIZER:
+                hand_recognizer.learn(frame, [tables.names[c] for c in card_ids.tolist()], boxes[card_mask],
+                                      tables.is_next[card_ids], detections.conf[card_mask])
+        elif last_game_state is not None:
+            # Карты меняются только после розыгрыша — до следующего ключевого кадра берем прежние
+            cards = last_game_state.card_array
+        else:
+            cards = make_card_slots()
+
+    if keyframe:
+        _update_tower_layout(detections, game_start, match_over, tower_layout)
+
+    current_game_state = GameSnapshot(
+        units, towers, cards, tables.names,
+        elixir=elixir_estimator.estimate(now), game_start=game_start, match_over=match_over,
+        frame_seq=frame_seq, capture_time=capture_time, towers_frame_seq=towers_frame_seq,
+    )
+    if analyze_slow_components == SLOW_AUTO:
+        _observe_scene(current_game_state, detections, keyframe, now, slow_scheduler)
+
+    current_game_state.inference_done_time = time.monotonic()
+    return current_game_state, detections
@@ -0,0 +1,324 @@
+# Card hand recognition from the fixed card slots, with deck-cycle tracking.
+# The four hand slots and the next-card slot never move, so instead of searching the
+# whole frame for 196 detector classes each slot crop is reduced to a small colour
+# thumbnail and matched against card templates (normalized correlation, one matrix
+# product for all slots). A slot is re-classified only when its crop changes or a card
+# has just been played from it. Templates are learned online from the detector's own
+# card boxes (only confident detections that agree over several keyframes), overwrite
+# templates of other cards they collide with, evict the least used ones and are saved
+# between runs.
+#
+# The deck is 8 cards: 4 in hand and 4 waiting, the first of which is shown as the next
+# card. A played card goes to the back of the queue and the next card takes its slot,
+# so after every card has been seen once the next hand can be predicted without
+# detecting it (DeckCycle).
+
+import threading
+
+import cv2
+import numpy as np
+
+from calibration import CARD_SLOTS, VISION_CAPTURE_AREA
+
+# --- Настройки ---
+# Размер кропа карты в руке (ширина, высота) вокруг центра слота, в координатах кадра зрения
+CARD_CROP_SIZE = (110, 130)
+# Слот следующей карты (x, y, w, h). Калибруется под окно.
+NEXT_CARD_ROI = (40, 1250, 60, 75)
+# Размер цветной миниатюры (ширина, высота) для сравнения с шаблонами
+EMBED_SIZE = (12, 16)
+# Минимальная корреляция с шаблоном, иначе слот считается нераспознанным
+MIN_MATCH_SCORE = 0.85
+# Среднее абсолютное изменение миниатюры (0..255), после которого слот распознается заново
+SLOT_CHANGE_THRESHOLD = 12.0
+# Сколько шаблонов хранить на одну карту и насколько новый кроп должен отличаться, чтобы его добавить
+MAX_TEMPLATES_PER_CARD = 4
+NEW_TEMPLATE_MAX_SCORE = 0.97
+# Шаблон пополняется только детекциями с уверенностью не ниже LEARN_MIN_CONF, которые
+# LEARN_AGREE_FRAMES ключевых кадров подряд дают ту же карту в том же слоте (кроп не меняется)
+LEARN_MIN_CONF = 0.8
+LEARN_AGREE_FRAMES = 3
+# Детекция карты относится к слоту, если ее центр ближе этого расстояния по X (px)
+SLOT_MATCH_PX = 60
+
+DECK_SIZE = 8
+HAND_SIZE = 4
+
+def slot_rois(card_slots=CARD_SLOTS, capture_area=VISION_CAPTURE_AREA, next_roi=NEXT_CARD_ROI):
+    """
+    Области слотов (x1, y1, x2, y2) в координатах кадра зрения: слоты руки по калибровке
+    card_slots (глобальные координаты окна capture_area) и слот следующей карты next_roi.
+    """
+    w, h = CARD_CROP_SIZE
+    rois = []
+    for x, y in card_slots:
+        cx, cy = x - capture_area["left"], y - capture_area["top"]
+        rois.append((cx - w // 2, cy - h // 2, cx + w // 2, cy + h // 2))
+    nx, ny, nw, nh = next_roi
+    return rois + [(nx, ny, nx + nw, ny + nh)]
+
+# Слоты 0..3 — рука, слот 4 — следующая карта
+ALL_SLOT_ROIS = slot_rois()
+NEXT_SLOT = HAND_SIZE
+
+def card_base_name(class_name):
+    """Имя карты без суффикса класса детектора: 'PekkaDeck' / 'PekkaNext' -> 'Pekka'."""
+    return class_name.replace('Deck', '').replace('Next', '')
+
+def _thumbnails(frame, rois):
+    """Миниатюры EMBED_SIZE всех областей массивом uint8 (N, h, w, 3)."""
+    frame_h, frame_w = frame.shape[:2]
+    thumbs = np.zeros((len(rois), EMBED_SIZE[1], EMBED_SIZE[0], 3), dtype=np.uint8)
+    for i, (x1, y1, x2, y2) in enumerate(rois):
+        crop = frame[max(0, y1):min(frame_h, y2), max(0, x1):min(frame_w, x2)]
+        if crop.size:
+            thumbs[i] = cv2.resize(crop, EMBED_SIZE, interpolation=cv2.INTER_AREA)
+    return thumbs
+
+def _embed(thumbs):
+    """Векторы миниатюр с нулевым средним и единичной нормой (N, D)."""
+    vectors = thumbs.reshape(len(thumbs), -1).astype(np.float32)
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class CardTemplates:
+    """
+    Шаблоны карт: векторы миниатюр, имена карт (без суффикса Deck/Next) и число удачных
+    сопоставлений каждого шаблона. Общие для всех окон; пополняются из детекций и сохраняются в .npz.
+    """
+
+    def __init__(self, vectors=None, labels=(), hits=None):
+        self.lock = threading.Lock()
+        self.vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, EMBED_SIZE[0] * EMBED_SIZE[1] * 3) \
+            if vectors is not None else np.zeros((0, EMBED_SIZE[0] * EMBED_SIZE[1] * 3), dtype=np.float32)
+        self.labels = list(labels)
+        self.hits = np.asarray(hits, dtype=np.int64).copy() if hits is not None \
+            else np.zeros(len(self.labels), dtype=np.int64)
+        self.dirty = False
+        self.overwritten = 0
+        self.evicted = 0
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        # В файлах старого формата счетчиков нет
+        hits = data["hits"] if "hits" in data.files else None
+        return cls(data["vectors"], [str(label) for label in data["labels"]], hits)
+
+    def save(self, path):
+        with self.lock:
+            np.savez_compressed(path, vectors=self.vectors, labels=np.array(self.labels), hits=self.hits)
+            self.dirty = False
+
+    def __len__(self):
+        return len(self.labels)
+
+    def match(self, vectors):
+        """Лучшие шаблоны для векторов (N, D): (имена или None, оценки)."""
+        with self.lock:
+            if not self.labels:
+                return [None] * len(vectors), np.zeros(len(vectors), dtype=np.float32)
+            scores = vectors @ self.vectors.T
+            labels = self.labels
+            best = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(best)), best]
+            # Шаблоны, давшие уверенное совпадение, реже вытесняются при пополнении
+            np.add.at(self.hits, best[best_scores >= MIN_MATCH_SCORE], 1)
+        return [labels[i] for i in best.tolist()], best_scores
+
+    def add(self, vector, label):
+        """
+        Добавляет шаблон, если он заметно отличается от уже известных шаблонов этой карты.
+        Шаблоны других карт, с которыми кроп совпадает (оценка не ниже MIN_MATCH_SCORE),
+        ошибочны и удаляются. Если у карты уже MAX_TEMPLATES_PER_CARD шаблонов, вытесняется
+        наименее используемый из них.
+        """
+        with self.lock:
+            same = [i for i, known in enumerate(self.labels) if known == label]
+            if same and float((self.vectors[same] @ vector).max()) >= NEW_TEMPLATE_MAX_SCORE:
+                return False
+            scores = self.vectors @ vector
+            drop = [i for i, known in enumerate(self.labels) if known != label and scores[i] >= MIN_MATCH_SCORE]
+            self.overwritten += len(drop)
+            if len(same) >= MAX_TEMPLATES_PER_CARD:
+                drop.append(min(same, key=lambda i: self.hits[i]))
+                self.evicted += 1
+            keep = np.setdiff1d(np.arange(len(self.labels)), drop)
+            self.vectors = np.vstack((self.vectors[keep], vector[None, :]))
+            self.labels = [self.labels[i] for i in keep.tolist()] + [label]
+            self.hits = np.append(self.hits[keep], 0)
+            self.dirty = True
+            return True
+
+class DeckCycle:
+    """
+    Порядок колоды из 8 карт: рука (4 слота) и очередь из 4 ожидающих карт, первая из
+    которых — следующая. Неизвестные позиции — None; очередь заполняется сыгранными картами.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hand = [None] * HAND_SIZE
+        self.queue = [None] * (DECK_SIZE - HAND_SIZE)
+
+    def observe(self, hand, next_card):
+        """Сверяет цикл с распознанной рукой и следующей картой (None — не распознано)."""
+        for i, card in enumerate(hand):
+            if card is not None:
+                self.hand[i] = card
+        if next_card is not None:
+            self.queue[0] = next_card
+
+    def played(self, slot_index):
+        """Карта из слота сыграна: на ее место встает следующая, сама она уходит в конец очереди."""
+        card = self.hand[slot_index]
+        self.hand[slot_index] = self.queue.pop(0)
+        self.queue.append(card)
+        return card
+
+    def predicted_next(self):
+        return self.queue[0]
+
+    @property
+    def known(self):
+        """Известны все 8 карт и их порядок."""
+        return None not in self.hand and None not in self.queue
+
+class HandRecognizer:
+    """
+    Распознает руку и следующую карту одного окна по кропам слотов. Результат слота
+    кэшируется, пока кроп не изменится или из слота не сыграют карту. rois — области
+    слотов этого окна (slot_rois()), по умолчанию калибровка из calibration.py.
+    """
+
+    def __init__(self, templates, min_score=MIN_MATCH_SCORE, rois=None):
+        self.templates = templates
+        self.rois = list(rois) if rois is not None else list(ALL_SLOT_ROIS)
+        if len(self.rois) != HAND_SIZE + 1:
+            raise ValueError(f"Нужно {HAND_SIZE + 1} областей слотов (рука и следующая карта), "
+                             f"получено {len(self.rois)}")
+        self.min_score = min_score
+        self.cycle = DeckCycle()
+        self.lock = threading.Lock()
+        self.classified = 0
+        self.cached = 0
+        # Кандидаты в шаблоны по слотам: (карта, вектор кропа, сколько ключевых кадров подряд)
+        self._candidates = {}
+        self.reset()
+
+    def reset(self):
+        """Новый матч: кэш слотов и цикл колоды сбрасываются."""
+        with self.lock:
+            # Миниатюры слотов на момент их последнего распознавания
+            self._thumbs = np.zeros((len(self.rois), EMBED_SIZE[1], EMBED_SIZE[0], 3), dtype=np.uint8)
+            self._cards = [None] * len(self.rois)
+            self._stale = set(range(len(self.rois)))
+            self._candidates.clear()
+            self.cycle.reset()
+
+    @property
+    def ready(self):
+        """Все слоты руки распознаны."""
+        with self.lock:
+            return None not in self._cards[:HAND_SIZE]
+
+    def on_card_played(self, class_name):
+        """Карта сыграна: ее слот и слот следующей карты распознаются заново, цикл сдвигается."""
+        if class_name is None:
+            return
+        name = card_base_name(class_name)
+        with self.lock:
+            if name not in self._cards[:HAND_SIZE]:
+                return
+            slot = self._cards.index(name)
+            self.cycle.played(slot)
+            # До нового распознавания в слоте — предсказание цикла
+            self._cards[slot] = self.cycle.hand[slot]
+            self._cards[NEXT_SLOT] = self.cycle.predicted_next()
+            self._stale.update((slot, NEXT_SLOT))
+
+    def recognize(self, frame):
+        """
+        Возвращает (рука — список из 4 имен карт или None, следующая карта или None).
+        Заново сопоставляются только устаревшие слоты и слоты, кроп которых изменился
+        с момента их последнего распознавания.
+        """
+        thumbs = _thumbnails(frame, self.rois)
+        with self.lock:
+            change = np.abs(thumbs.astype(np.int16) - self._thumbs.astype(np.int16)).mean(axis=(1, 2, 3))
+            slots = sorted(self._stale.union(np.flatnonzero(change > SLOT_CHANGE_THRESHOLD).tolist()))
+
+        names, scores = self.templates.match(_embed(thumbs[slots])) if slots else ([], [])
+        with self.lock:
+            for slot, name, score in zip(slots, names, scores):
+                if score >= self.min_score:
+                    self._cards[slot] = name
+                    self._thumbs[slot] = thumbs[slot]
+                    self._stale.discard(slot)
+                elif slot not in self._stale:
+                    # Кроп изменился, а карта не узнана — прежнее значение уже неверно
+                    self._cards[slot] = None
+                    self._stale.add(slot)
+            self.classified += len(slots)
+            self.cached += len(self.rois) - len(slots)
+            self.cycle.observe(self._cards[:HAND_SIZE], self._cards[NEXT_SLOT])
+            hand, next_card = list(self._cards[:HAND_SIZE]), self._cards[NEXT_SLOT]
+        return hand, next_card if next_card is not None else self.cycle.predicted_next()
+
+    def learn(self, frame, class_names, boxes, is_next, conf=None):
+        """
+        Пополняет шаблоны кропами слотов, в которых детектор нашел карту с уверенностью
+        conf не ниже LEARN_MIN_CONF. Шаблон добавляется, только когда LEARN_AGREE_FRAMES
+        вызовов подряд дают в слоте ту же карту при неизменном кропе; такие слоты
+        распознаются заново на следующем вызове recognize().
+        """
+        slot_x = np.array([(x1 + x2) / 2 for x1, _, x2, _ in self.rois], dtype=np.float32)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        centers = (boxes[:, 0] + boxes[:, 2]) / 2
+        conf = np.ones(len(class_names), dtype=np.float32) if conf is None else np.asarray(conf, dtype=np.float32)
+        seen = {}
+        for class_name, center, next_card, score in zip(class_names, centers.tolist(),
+                                                        np.asarray(is_next).tolist(), conf.tolist()):
+            if score < LEARN_MIN_CONF:
+                continue
+            if next_card:
+                slot = NEXT_SLOT
+            else:
+                slot = int(np.argmin(np.abs(slot_x[:HAND_SIZE] - center)))
+                if abs(slot_x[slot] - center) > SLOT_MATCH_PX:
+                    continue
+            name = card_base_name(class_name)
+            if seen.setdefault(slot, name) != name:
+                # Две разные карты в одном слоте — кадр ненадежен для этого слота
+                seen[slot] = None
+        vectors = _embed(_thumbnails(frame, self.rois)) if seen else None
+        learned = set()
+        with self.lock:
+            for slot in list(self._candidates):
+                if seen.get(slot) is None:
+                    del self._candidates[slot]
+            for slot, name in seen.items():
+                if name is None:
+                    continue
+                previous = self._candidates.get(slot)
+                if previous and previous[0] == name and float(previous[1] @ vectors[slot]) >= MIN_MATCH_SCORE:
+                    count = previous[2] + 1
+                else:
+                    count = 1
+                if count < LEARN_AGREE_FRAMES:
+                    self._candidates[slot] = (name, vectors[slot], count)
+                    continue
+                del self._candidates[slot]
+                if self.templates.add(vectors[slot], name):
+                    learned.add(slot)
+            self._stale.update(learned)
+
+    def stats(self):
+        with self.lock:
+            return {"templates": len(self.templates), "classified": self.classified, "cached": self.cached,
+                    "templates_overwritten": self.templates.overwritten, "templates_evicted": self.templates.evicted,
+                    "cycle_known": self.cycle.known}
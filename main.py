@@ -1,51 +1,113 @@
 # yolo train model=yolo12l.pt data="C:/Users/e8351/Documents/CR_Neuro/CustomWorkflowObjectDetection.v3i.yolov12/data.yaml" imgsz=900 batch=15 epochs=90 lr0=0.01 augment=True copy_paste=0.1 device=00
-from ultralytics import YOLO
+import time
+# Момент запуска процесса — точка отсчета времени до первого решения
+PROCESS_START_TIME = time.monotonic()
+import argparse
 import cv2
-import mss
 import numpy as np
 import random # Для генерации случайных цветов
-from game_vision import perceive_game_state, ALLY_TOWER_CLASSES, ENEMY_TOWER_CLASSES
+import game_vision
+from game_vision import perceive_game_state, notify_card_played, ALLY_TOWER_CLASSES, ENEMY_TOWER_CLASSES
 from game_state import GameState, Tower, Unit, Card
 import threading
-import time
+from collections import deque
+from frame_buffer import FrameRing
+from capture import CaptureThread, create_capture_source
+from vision_process import VisionProcess
 from game_logic import choose_action_rule_based
-from game_automation import play_card, convert_vision_to_global_coords, clamp_coords_to_playable_area
+import game_automation
+from game_automation import convert_vision_to_global_coords, clamp_coords_to_playable_area
+from action_executor import ActionExecutor, PendingAction, MAX_ACTION_AGE
+from match_recorder import MatchRecorder, RECORD_FRAME_EVERY, RECORD_SCALE
+from metrics import registry as metrics, JsonlDumper, start_http_server, DEFAULT_DUMP_INTERVAL
+from perception_scheduler import FRAME_BUDGET
+from qos import QosController, QOS_TARGET_LATENCY
+from motion_gate import PerceptionGate, GATE_KEYFRAME, GATE_SKIP, IDLE_FPS
+from state_publisher import StatePublisher, STATE_SHM_NAME
 
 # --- Настройки ---
 MONITOR_DETAILS = {"top": 35, "left": 2674, "width": 766, "height": 1355}
 WINDOW_TITLE = "CR_Neuro"
-# Частота выполнения МЕДЛЕННОГО анализа (OCR). 1 раз в 5 циклов потока.
+# Запуск МЕДЛЕННОГО анализа (OCR): 'event' — по событиям сцены и дедлайнам
+# (см. perception_scheduler.py), 'tick' — 1 раз в SLOW_ANALYSIS_TICK_RATE циклов потока.
+SLOW_ANALYSIS_MODE = 'event'
 SLOW_ANALYSIS_TICK_RATE = 5 
+# Полный YOLO запускается раз в KEYFRAME_INTERVAL кадров; между ними позиции юнитов
+# экстраполируются по трекам. 1 — YOLO на каждом кадре.
+KEYFRAME_INTERVAL = 1
 # Пауза после выполнения действия, чтобы не кликать слишком часто
 ACTION_COOLDOWN = 1.0 # 1 секунда
+# Сколько ждать нового кадра в потоке зрения, прежде чем снова проверить флаг остановки
+FRAME_WAIT_TIMEOUT = 0.05
+# Захват: 'mss' — экран, 'file' — видео или папка с кадрами (см. capture.py)
+CAPTURE_BACKEND = 'mss'
+# Целевая частота захвата (кадров/сек). 0 — без ограничения
+CAPTURE_FPS = 30
+# Запускать ли восприятие в отдельном процессе (см. vision_process.py) вместо потока
+VISION_IN_PROCESS = False
+# Сколько последних итераций основного цикла учитывать в статистике джиттера
+LOOP_STATS_WINDOW = 10000
+# Слотов в кольце кадров: по одному на читателя (зрение и UI) плюс два для записи
+FRAME_RING_SLOTS = 4
+# Режим простоя и пропуск YOLO на неподвижной арене (см. motion_gate.py)
+MOTION_GATING = True
+# Частота захвата экрана вне матча (кадров/сек)
+IDLE_CAPTURE_FPS = IDLE_FPS
+# Порт локального эндпоинта метрик Prometheus (http://127.0.0.1:PORT/metrics). 0 — выключен
+METRICS_PORT = 0
 
 # --- Потокобезопасное хранилище состояния ---
 class SharedState:
-    def __init__(self):
+    def __init__(self, frame_shape=(MONITOR_DETAILS["height"], MONITOR_DETAILS["width"], 3)):
         self.lock = threading.Lock()
-        self.latest_frame = None
+        # Предвыделенное кольцо кадров: захват пишет в свободный слот, зрение читает без копий
+        self.frames = FrameRing(frame_shape, slots=FRAME_RING_SLOTS)
+        self.frames_processed = 0
+        self.frames_dropped = 0
         self.game_state = GameState()
-        self.yolo_results = None
+        self.detections = None
+        # time.monotonic() захвата кадра, по которому построен game_state
+        self.frame_time = 0.0
+        # Заполняется после загрузки модели (engine.start() или VisionProcess.start())
+        self.class_names = {}
         self.last_action_time = 0
         self.running = True
+        # Запись матча (см. match_recorder.py), None — выключена
+        self.recorder = None
+        # Контроллер качества (см. qos.py), None — настройки восприятия фиксированы
+        self.qos = None
+        # Гейт восприятия по движению (см. motion_gate.py), None — YOLO по KEYFRAME_INTERVAL
+        self.gate = None
+        # Публикация снимков в общую память для других процессов (см. state_publisher.py), None — выключена
+        self.publisher = None
+        # Бюджет медленных компонентов на кадр при полном качестве; QoS масштабирует его
+        self.slow_budget = FRAME_BUDGET
 
     def set_frame(self, frame):
-        with self.lock:
-            self.latest_frame = frame.copy()
+        """Копирует готовый кадр в кольцо. Захват может писать в frames.acquire_write() напрямую."""
+        return self.frames.write(frame)
 
-    def get_frame(self):
+    def record_frame_stats(self, processed, dropped):
         with self.lock:
-            return self.latest_frame.copy() if self.latest_frame is not None else None
+            self.frames_processed = processed
+            self.frames_dropped = dropped
+        metrics.set_gauge("frames_processed", processed)
+        metrics.set_gauge("frames_dropped", dropped)
 
-    def set_analysis_results(self, game_state, yolo_results):
+    def set_analysis_results(self, game_state, detections, frame_time=0.0):
         with self.lock:
             self.game_state = game_state
-            self.yolo_results = yolo_results
+            self.detections = detections
+            self.frame_time = frame_time
+        # Единственный писатель — поток зрения, поэтому публикация идет вне lock
+        if self.publisher is not None:
+            self.publisher.publish(game_state)
 
     def get_analysis_results(self):
         with self.lock:
-            # Возвращаем копии, чтобы избежать гонки данных при отрисовке
-            return self.game_state, self.yolo_results
+            # game_state — GameSnapshot с массивами только для чтения (поток зрения каждый кадр
+            # создает новый), поэтому его можно отдавать другим потокам без копирования
+            return self.game_state, self.detections, self.frame_time
 
     def can_perform_action(self):
         with self.lock:
@@ -63,58 +125,340 @@ class SharedState:
         with self.lock:
             self.running = False
 
+def slow_analysis_for_frame(frame_counter):
+    """Значение analyze_slow_components для очередного кадра в зависимости от SLOW_ANALYSIS_MODE."""
+    if SLOW_ANALYSIS_MODE == 'event':
+        return game_vision.SLOW_AUTO
+    return frame_counter % SLOW_ANALYSIS_TICK_RATE == 0
+
+def record_stage_time(stage, seconds):
+    """Наблюдатель этапов perceive_game_state: пишет длительности в гистограммы метрик."""
+    metrics.observe(f"stage_{stage}", seconds)
+
+def record_perception_latency(game_state):
+    """Задержка от захвата кадра до готового GameState."""
+    if game_state.capture_time:
+        metrics.observe("capture_to_inference", game_state.inference_done_time - game_state.capture_time)
+
+def plan_frame(state, frame, frame_counter, last_game_state):
+    """
+    (обрабатывать ли кадр, ключевой ли он, analyze_slow_components) с учетом гейта:
+    вне матча YOLO только изредка ищет GameStart, в матче пропускается на неподвижной арене.
+    """
+    analyze_slow = slow_analysis_for_frame(frame_counter)
+    keyframe = (frame_counter % KEYFRAME_INTERVAL == 0)
+    if state.gate is None:
+        return True, keyframe, analyze_slow
+    in_match = bool(last_game_state is not None and last_game_state.game_start and not last_game_state.match_over)
+    decision = state.gate.decide(frame, in_match, keyframe)
+    if decision == GATE_SKIP:
+        return False, False, False
+    # Вне матча OCR не нужен: ищем только экран начала игры
+    return True, decision == GATE_KEYFRAME, analyze_slow if in_match else False
+
+def apply_qos_settings(settings, state, vision=None):
+    """Применяет уровень качества (qos.QosLevel): интервал ключевых кадров, такт OCR, размер входа, бюджет."""
+    global KEYFRAME_INTERVAL, SLOW_ANALYSIS_TICK_RATE
+    KEYFRAME_INTERVAL = settings.keyframe_interval
+    SLOW_ANALYSIS_TICK_RATE = settings.slow_tick_rate
+    slow_budget = state.slow_budget * settings.slow_budget_scale
+    if vision is not None:
+        vision.apply_settings(imgsz=settings.imgsz, slow_budget=slow_budget)
+    else:
+        game_vision.INFERENCE_IMGSZ = settings.imgsz
+        game_vision.slow_scheduler.frame_budget = slow_budget
+
+def update_qos(state, game_state, vision=None):
+    """Передает задержку кадра контроллеру качества и применяет его решение."""
+    if state.qos is None or not game_state.capture_time:
+        return
+    settings = state.qos.observe(game_state.inference_done_time - game_state.capture_time)
+    if settings is not None:
+        apply_qos_settings(settings, state, vision)
+
+def on_model_ready(state, class_names, publish_state=None):
+    """Модель загружена: имена классов для отрисовки и публикация состояния, если она включена."""
+    state.class_names = class_names
+    print(f"[Main] Модель готова через {time.monotonic() - PROCESS_START_TIME:.2f} с после запуска")
+    if publish_state:
+        state.publisher = StatePublisher(class_names, name=publish_state)
+        print(f"[Main] Состояние публикуется в общую память: {publish_state}")
+
 # --- Функция для фонового потока ---
-def vision_worker(state: SharedState):
-    """Этот 'рабочий' постоянно анализирует последний доступный кадр."""
+def vision_worker(state: SharedState, warmup=None, publish_state=None):
+    """
+    Этот 'рабочий' постоянно анализирует последний доступный кадр. warmup — поток загрузки
+    модели (engine.start()): его ждут здесь, перед первым кадром, а не в основном потоке.
+    """
     print("Vision worker запущен.")
+    if warmup is not None:
+        warmup.join()
+        on_model_ready(state, dict(game_vision.engine.model.names), publish_state)
     worker_frame_counter = 0
     last_game_state = GameState()
+    reader = state.frames.reader()
 
     while state.is_running():
-        frame = state.get_frame()
-        if frame is not None:
-            analyze_slow = (worker_frame_counter % SLOW_ANALYSIS_TICK_RATE == 0)
-            
-            game_state, yolo_results = perceive_game_state(
-                frame, 
-                last_game_state=last_game_state, 
-                analyze_slow_components=analyze_slow
-            )
-            
-            state.set_analysis_results(game_state, yolo_results)
-            last_game_state = game_state # Сохраняем последнее состояние для следующего цикла
-            worker_frame_counter += 1
-        else:
-            # Если кадров нет, делаем небольшую паузу, чтобы не грузить CPU впустую
-            time.sleep(0.01)
+        # Берем самый свежий еще не обработанный кадр без копирования.
+        # Если новых кадров нет, ждем их, а не гоняем YOLO по тому же кадру.
+        frame_seq, frame = reader.read(timeout=FRAME_WAIT_TIMEOUT)
+        if frame is None:
+            continue
+
+        process, keyframe, analyze_slow = plan_frame(state, frame, worker_frame_counter, last_game_state)
+        if not process:
+            reader.release()
+            continue
+
+        game_state, detections = perceive_game_state(
+            frame, 
+            last_game_state=last_game_state, 
+            analyze_slow_components=analyze_slow,
+            keyframe=keyframe,
+            frame_seq=frame_seq,
+            capture_time=reader.last_timestamp
+        )
+        record_perception_latency(game_state)
+        update_qos(state, game_state)
+        if state.recorder is not None:
+            state.recorder.record_frame(frame_seq, frame, reader.last_timestamp)
+            state.recorder.record_state(game_state)
+        
+        state.set_analysis_results(game_state, detections, reader.last_timestamp)
+        last_game_state = game_state # Сохраняем последнее состояние для следующего цикла
+        worker_frame_counter += 1
+        state.record_frame_stats(reader.frames_read, reader.dropped)
+
+    reader.release()
+    print(f"Кадров обработано: {reader.frames_read}, пропущено: {reader.dropped}")
+    if SLOW_ANALYSIS_MODE == 'event':
+        print(f"[Scheduler] Медленные компоненты: {game_vision.slow_scheduler.stats()}")
+    print(f"[Vision] Кэш OCR: {game_vision.ocr_cache.stats()}")
+    print(f"[Vision] Распознавание руки: {game_vision.hand_recognizer.stats()}")
+    if game_vision.OCR_PIPELINE:
+        print(f"[Vision] Конвейер OCR: {game_vision.default_context.ocr_pipeline.stats()}")
+    game_vision.save_card_templates()
     print("Vision worker остановлен.")
 
+def vision_process_worker(state: SharedState, vision: VisionProcess):
+    """
+    Вариант vision_worker для отдельного процесса: поток лишь передает кадры в процесс
+    зрения через общую память и публикует ответы. Ожидание ответа не держит GIL.
+    """
+    print("Vision worker (процесс) запущен.")
+    worker_frame_counter = 0
+    last_game_state = None
+    reader = state.frames.reader()
+
+    while state.is_running():
+        frame_seq, frame = reader.read(timeout=FRAME_WAIT_TIMEOUT)
+        if frame is None:
+            continue
+
+        process, keyframe, analyze_slow = plan_frame(state, frame, worker_frame_counter, last_game_state)
+        if not process:
+            reader.release()
+            continue
+        game_state, detections = vision.perceive(frame, frame_seq, analyze_slow_components=analyze_slow,
+                                                  keyframe=keyframe, capture_time=reader.last_timestamp)
+        if game_state is not None and state.recorder is not None:
+            state.recorder.record_frame(frame_seq, frame, reader.last_timestamp)
+            state.recorder.record_state(game_state)
+        reader.release()
+        if game_state is None:
+            break
+        for stage, seconds in vision.last_stage_times.items():
+            record_stage_time(stage, seconds)
+        record_perception_latency(game_state)
+        update_qos(state, game_state, vision)
+
+        state.set_analysis_results(game_state, detections, reader.last_timestamp)
+        last_game_state = game_state
+        worker_frame_counter += 1
+        state.record_frame_stats(reader.frames_read, reader.dropped)
+
+    reader.release()
+    print(f"Кадров обработано: {reader.frames_read}, пропущено: {reader.dropped}")
+    print("Vision worker (процесс) остановлен.")
+
+def print_loop_jitter(durations):
+    """Печатает распределение длительности итераций основного цикла (мс)."""
+    if not durations:
+        return
+    values = np.asarray(durations) * 1000.0
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    print(f"[Main] Итерация цикла: p50={p50:.1f} мс, p95={p95:.1f} мс, p99={p99:.1f} мс, "
+          f"max={values.max():.1f} мс, std={values.std():.1f} мс ({values.size} итераций)")
+
 # --- Основной поток (UI и Действия) ---
+def parse_args():
+    parser = argparse.ArgumentParser(description="CR_Neuro: бот для Clash Royale.")
+    parser.add_argument("--source", choices=("mss", "file"), default=CAPTURE_BACKEND,
+                        help="Источник кадров: захват экрана или видео/папка с кадрами.")
+    parser.add_argument("--path", default=None, help="Видеофайл или папка с кадрами для --source file.")
+    parser.add_argument("--fps", type=float, default=CAPTURE_FPS, help="Целевая частота захвата, 0 — без ограничения.")
+    parser.add_argument("--max-speed", action="store_true", help="Воспроизводить файл без пауз, а не в реальном времени.")
+    parser.add_argument("--loop", action="store_true", help="Зациклить воспроизведение файла.")
+    parser.add_argument("--headless", action="store_true", help="Не открывать окно с отрисовкой.")
+    parser.add_argument("--dry-run", action="store_true", help="Не кликать, только печатать действия.")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL,
+                        help="Запускать YOLO раз в N кадров, между ними экстраполировать треки.")
+    parser.add_argument("--max-action-age", type=float, default=MAX_ACTION_AGE,
+                        help="Отбрасывать действия, если кадр решения старше N секунд к моменту клика.")
+    parser.add_argument("--split-regions", action="store_true",
+                        help="Отдельные проходы YOLO по арене, панели карт и башням (см. INFERENCE_REGIONS).")
+    parser.add_argument("--pipelined-ocr", action="store_true",
+                        help="OCR эликсира и HP башен в пуле потоков параллельно с YOLO следующих кадров.")
+    parser.add_argument("--vision-process", action="store_true", default=VISION_IN_PROCESS,
+                        help="Запускать восприятие в отдельном процессе.")
+    parser.add_argument("--slow-mode", choices=("event", "tick"), default=SLOW_ANALYSIS_MODE,
+                        help="Запуск OCR: по событиям сцены и дедлайнам или раз в SLOW_ANALYSIS_TICK_RATE кадров.")
+    parser.add_argument("--slow-budget-ms", type=float, default=None,
+                        help="Бюджет медленных компонентов на кадр в режиме event (по умолчанию FRAME_BUDGET).")
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="Не пропускать YOLO вне матча и на неподвижной арене (см. motion_gate.py).")
+    parser.add_argument("--publish-state", nargs="?", const=STATE_SHM_NAME, default=None, metavar="NAME",
+                        help="Публиковать снимки состояния в общую память для других процессов "
+                             f"(по умолчанию сегмент {STATE_SHM_NAME}, читатель: state_publisher.py).")
+    parser.add_argument("--qos", action="store_true",
+                        help="Подстраивать размер входа, интервал ключевых кадров и частоту OCR под задержку (qos.py).")
+    parser.add_argument("--qos-target-ms", type=float, default=QOS_TARGET_LATENCY * 1000,
+                        help="Целевая задержка кадра от захвата до снимка для --qos (мс).")
+    parser.add_argument("--qos-log", default=None, help="Дописывать решения контроллера качества в этот JSONL-файл.")
+    parser.add_argument("--record", default=None, help="Записывать матч (кадры, состояния, действия) в эту папку.")
+    parser.add_argument("--record-every", type=int, default=RECORD_FRAME_EVERY, help="Записывать каждый N-й кадр.")
+    parser.add_argument("--record-scale", type=float, default=RECORD_SCALE, help="Масштаб записываемых кадров.")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Порт эндпоинта метрик Prometheus на 127.0.0.1, 0 — выключен.")
+    parser.add_argument("--metrics-jsonl", default=None, help="Периодически дописывать сводку метрик в этот JSONL-файл.")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_DUMP_INTERVAL,
+                        help="Период записи метрик в JSONL (сек).")
+    args = parser.parse_args()
+    if args.source == "file" and not args.path:
+        parser.error("--source file требует --path")
+    return args
+
 def main():
     """Главный цикл приложения, отвечающий за UI и выполнение действий."""
-    sct = mss.mss()
-    shared_state = SharedState()
+    global KEYFRAME_INTERVAL, SLOW_ANALYSIS_MODE
+    args = parse_args()
+    game_automation.DRY_RUN = args.dry_run
+    KEYFRAME_INTERVAL = max(1, args.keyframe_interval)
+    game_vision.REGION_SPLIT = args.split_regions
+    game_vision.OCR_PIPELINE = args.pipelined_ocr
+    SLOW_ANALYSIS_MODE = args.slow_mode
+    slow_budget = args.slow_budget_ms / 1000.0 if args.slow_budget_ms is not None else None
+    if slow_budget is not None:
+        game_vision.slow_scheduler.frame_budget = slow_budget
+
+    source = create_capture_source(args.source, monitor=MONITOR_DETAILS, path=args.path, loop=args.loop)
+    if args.source == "file":
+        # Реальное время — с частотой самого файла, иначе максимально быстро
+        target_fps = None if args.max_speed else (source.native_fps or args.fps or None)
+    else:
+        target_fps = args.fps or None
+
+    shared_state = SharedState(frame_shape=source.frame_shape)
+    if slow_budget is not None:
+        shared_state.slow_budget = slow_budget
+    if args.qos:
+        shared_state.qos = QosController(target=args.qos_target_ms / 1000.0, log_path=args.qos_log)
+
+    if args.record:
+        shared_state.recorder = MatchRecorder(args.record, frame_every=args.record_every, scale=args.record_scale)
+        shared_state.recorder.start()
+        print(f"[Main] Запись матча в {args.record}")
+
+    # Метрики задержек: этапы восприятия пишутся в гистограммы через наблюдателя
+    game_vision.set_stage_observer(record_stage_time)
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = start_http_server(args.metrics_port)
+        print(f"[Metrics] Эндпоинт: http://127.0.0.1:{args.metrics_port}/metrics")
+    metrics_dumper = None
+    if args.metrics_jsonl:
+        metrics_dumper = JsonlDumper(args.metrics_jsonl, interval=args.metrics_interval)
+        metrics_dumper.start()
     
-    # Запускаем фоновый поток
-    worker_thread = threading.Thread(target=vision_worker, args=(shared_state,))
+    # Запускаем поток захвата, пока модель загружается и прогревается, затем фоновый поток анализа
+    capture_thread = CaptureThread(source, shared_state.frames, target_fps=target_fps)
+    capture_thread.start()
+    if MOTION_GATING and not args.no_motion_gate:
+        def on_idle_change(idle):
+            # Экран захватывается реже вне матча; файл читается с прежней частотой, чтобы не терять кадры записи
+            if args.source != "file":
+                capture_thread.target_fps = IDLE_CAPTURE_FPS if idle else target_fps
+        shared_state.gate = PerceptionGate(on_idle_change=on_idle_change)
+    vision = None
+    if args.vision_process:
+        vision = VisionProcess(source.frame_shape, region_split=args.split_regions, slow_budget=slow_budget,
+                               pipelined_ocr=args.pipelined_ocr)
+        on_model_ready(shared_state, vision.start(), args.publish_state)
+        worker_thread = threading.Thread(target=vision_process_worker, args=(shared_state, vision))
+    else:
+        # Модель грузится и прогревается, пока запускаются исполнитель и UI; ее ждет поток зрения
+        warmup = game_vision.engine.start(source.frame_shape)
+        worker_thread = threading.Thread(target=vision_worker, args=(shared_state, warmup, args.publish_state))
+    if shared_state.qos is not None:
+        apply_qos_settings(shared_state.qos.settings, shared_state, vision)
     worker_thread.start()
+
+    def on_card_played(action):
+        # Пауза между действиями отсчитывается от розыгрыша, а не от решения: отброшенное
+        # исполнителем действие ее не запускает
+        shared_state.action_performed()
+        if shared_state.recorder is not None:
+            shared_state.recorder.record_played(action, time.monotonic())
+        # Сразу списываем эликсир, не дожидаясь следующего чтения полосы
+        if vision is not None:
+            vision.notify_card_played(action.card_name)
+        else:
+            notify_card_played(action.card_name)
+
+    executor = ActionExecutor(max_age=args.max_action_age, on_played=on_card_played)
+    executor.start()
     
-    print("UI-поток запущен. Нажмите 'q' в окне для выхода.")
+    if args.headless:
+        print("UI-поток запущен без окна. Ctrl+C для выхода.")
+    else:
+        print("UI-поток запущен. Нажмите 'q' в окне для выхода.")
     class_colors = {}
+    display_frame = np.empty(shared_state.frames.shape, dtype=np.uint8)
+    ui_reader = shared_state.frames.reader()
+    loop_durations = deque(maxlen=LOOP_STATS_WINDOW)
+    loop_start = time.perf_counter()
+    first_decision_reported = False
 
     try:
         while True:
-            sct_img = sct.grab(MONITOR_DETAILS)
-            frame = np.array(sct_img)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-            shared_state.set_frame(frame)
+            now = time.perf_counter()
+            loop_durations.append(now - loop_start)
+            loop_start = now
 
-            game_state, yolo_results = shared_state.get_analysis_results()
+            # Файл закончился и последний кадр уже показан — выходим
+            if capture_thread.finished.is_set() and ui_reader.last_seq == shared_state.frames.sequence:
+                break
+
+            frame_seq, slot = ui_reader.read(timeout=FRAME_WAIT_TIMEOUT)
+
+            game_state, detections, frame_time = shared_state.get_analysis_results()
             
-            # --- Принятие и выполнение решения ---
+            # --- Принятие решения; клики выполняет отдельный поток, цикл не блокируется ---
+            # Пока исполнитель занят, новое решение заменяет ожидающее
             if game_state.game_start and not game_state.match_over and shared_state.can_perform_action():
+                decision_start = time.monotonic()
                 action = choose_action_rule_based(game_state)
+                game_state.decision_time = time.monotonic()
+                metrics.observe("decision", game_state.decision_time - decision_start)
+                # Первое решение — первый вызов логики, даже если она решила ничего не играть
+                if not first_decision_reported:
+                    first_decision_reported = True
+                    time_to_first_decision = game_state.decision_time - PROCESS_START_TIME
+                    metrics.set_gauge("time_to_first_decision", time_to_first_decision)
+                    print(f"[Main] Первое решение через {time_to_first_decision:.2f} с после запуска")
                 if action:
+                    if frame_time:
+                        metrics.observe("capture_to_decision", game_state.decision_time - frame_time)
                     global_coords = convert_vision_to_global_coords(action['coords'])
                     # Примагничиваем координаты к игровой зоне
                     clamped_coords = clamp_coords_to_playable_area(global_coords)
@@ -122,20 +466,33 @@ def main():
                     if global_coords != clamped_coords:
                         print(f"[Main] Координаты скорректированы: {global_coords} -> {clamped_coords}")
 
-                    play_card(action['slot_index'], clamped_coords)
-                    shared_state.action_performed()
+                    hand = game_state.get_hand_cards()
+                    played = hand[action['slot_index']].class_name if action['slot_index'] < len(hand) else None
+                    if shared_state.recorder is not None:
+                        shared_state.recorder.record_decision(action, game_state.frame_seq, game_state.decision_time,
+                                                              card_name=played)
+                    executor.submit(PendingAction(slot_index=action['slot_index'], coords=clamped_coords,
+                                                  card_name=played, frame_time=frame_time,
+                                                  decided_at=game_state.decision_time, game_state=game_state))
+
+            if args.headless or slot is None:
+                continue
+
+            # Рисуем на отдельной копии: слот кольца может одновременно читать поток зрения
+            np.copyto(display_frame, slot)
+            ui_reader.release()
+            frame = display_frame
             
             # --- Отрисовка ---
-            if yolo_results and yolo_results[0].boxes is not None:
-                for box in yolo_results[0].boxes:
-                    x1, y1, x2, y2 = [int(i) for i in box.xyxy[0]]
-                    class_id = int(box.cls[0])
-                    class_name = yolo_results[0].names[class_id]
+            if detections is not None:
+                for (x1, y1, x2, y2), conf, class_id, track_id in zip(detections.xyxy.tolist(), detections.conf.tolist(),
+                                                                       detections.cls.tolist(), detections.track_id.tolist()):
+                    class_name = shared_state.class_names[class_id]
                     if class_name not in class_colors:
                         class_colors[class_name] = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
                     color = class_colors[class_name]
                     cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    label = f"{class_name} {float(box.conf[0]):.2f}"
+                    label = f"{class_name} {conf:.2f}" if track_id < 0 else f"{class_name}#{track_id} {conf:.2f}"
                     cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
             
             towers_to_draw = game_state.my_towers + game_state.enemy_towers
@@ -149,12 +506,42 @@ def main():
 
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
+    except KeyboardInterrupt:
+        pass
     finally:
         # Чистая остановка
         print("Остановка потоков...")
+        ui_reader.release()
+        capture_thread.stop()
+        executor.stop()
         shared_state.stop()
         worker_thread.join()
-        cv2.destroyAllWindows()
+        capture_thread.join()
+        if vision is not None:
+            vision.stop()
+        executor.join()
+        if shared_state.recorder is not None:
+            shared_state.recorder.stop()
+            shared_state.recorder.join()
+            print(f"[Main] Запись матча: {shared_state.recorder.stats()}")
+        if metrics_dumper is not None:
+            metrics_dumper.stop()
+            metrics_dumper.join()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        print_loop_jitter(loop_durations)
+        print(f"[Main] Действия: {executor.stats()}")
+        if shared_state.qos is not None:
+            print(f"[QoS] Итог: {shared_state.qos.stats()}")
+        if shared_state.gate is not None:
+            print(f"[Gate] Кадры: {shared_state.gate.stats()}")
+        if shared_state.publisher is not None:
+            print(f"[Main] Опубликовано снимков: {shared_state.publisher.published}")
+            shared_state.publisher.close()
+        print(f"Захвачено кадров: {capture_thread.frames_captured}, "
+              f"среднее время захвата: {capture_thread.average_capture_ms:.1f} мс")
+        if not args.headless:
+            cv2.destroyAllWindows()
         print("Скрипт завершен.")
 
 if __name__ == "__main__":
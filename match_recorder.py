@@ -0,0 +1,263 @@
+# Match recording and offline replay.
+# MatchRecorder writes frames (JPEG, optionally subsampled and downscaled), every
+# GameState and every decision/played card to a recording directory. All encoding and
+# disk I/O happens on its own thread behind a bounded queue. When the queue is full,
+# new items are dropped and counted, so the bot never waits on the disk.
+#
+# Recording layout:
+#   frames.bin    — JPEG кадры подряд
+#   events.jsonl  — meta / frame (смещение в frames.bin, размер исходного кадра) / state / decision / played
+#
+# Replay runs the recorded frames through perceive_game_state and the decision logic at
+# maximum speed, using the recorded capture times as the clock, and compares the results
+# with the recording. Downscaled frames are resized back to the capture size first,
+# because every perception ROI is in full-frame pixels:
+#   python match_recorder.py replay recordings/match1 --json replay.json
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+# --- Настройки ---
+# Записывать каждый N-й кадр (состояния и действия записываются всегда)
+RECORD_FRAME_EVERY = 1
+# Масштаб и качество JPEG записываемых кадров
+RECORD_SCALE = 1.0
+JPEG_QUALITY = 85
+# Максимум элементов в очереди писателя; один кадр 766x1355 — около 3 МБ
+MAX_QUEUE_ITEMS = 64
+
+FRAMES_FILE = "frames.bin"
+EVENTS_FILE = "events.jsonl"
+
+class MatchRecorder(threading.Thread):
+    """
+    Фоновый писатель записи матча. Методы record_* не блокируют: кадр копируется
+    (буфер кольца переиспользуется), а сжатие, сериализация состояний и запись
+    выполняются в потоке писателя.
+    """
+
+    def __init__(self, path, frame_every=RECORD_FRAME_EVERY, scale=RECORD_SCALE, jpeg_quality=JPEG_QUALITY,
+                 max_queue=MAX_QUEUE_ITEMS):
+        super().__init__(name="match-recorder", daemon=True)
+        self.path = path
+        self.frame_every = max(1, frame_every)
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._frames_seen = 0
+        self.frames_written = 0
+        self.events_written = 0
+        self.dropped = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_frame(self, frame_seq, frame, capture_time):
+        """Ставит кадр в очередь записи с учетом прореживания frame_every."""
+        self._frames_seen += 1
+        if (self._frames_seen - 1) % self.frame_every:
+            return
+        # Копия кадра — около 3 МБ: при полной очереди кадр отбрасывается до копирования
+        if self._queue.full():
+            self.dropped += 1
+            return
+        self._put(("frame", frame_seq, capture_time, np.array(frame, copy=True)))
+
+    def record_state(self, game_state):
+        """Ставит снимок в очередь; в компактный вид он переводится в потоке писателя."""
+        self._put(("state", game_state))
+
+    def record_decision(self, action, frame_seq, decision_time, card_name=None):
+        """Решение choose_action_rule_based в координатах кадра зрения."""
+        self._put(("event", {"type": "decision", "seq": frame_seq, "time": decision_time,
+                             "slot_index": action['slot_index'], "coords": list(action['coords']),
+                             "card": card_name}))
+
+    def record_played(self, action, played_time):
+        """Карта, фактически разыгранная play_card (PendingAction)."""
+        self._put(("event", {"type": "played", "time": played_time, "slot_index": action.slot_index,
+                             "coords": list(action.coords), "card": action.card_name}))
+
+    def stop(self):
+        # Блокирующий put: маркер конца не должен потеряться при полной очереди
+        self._queue.put(None)
+
+    def run(self):
+        with open(os.path.join(self.path, FRAMES_FILE), "ab") as frames_file, \
+                open(os.path.join(self.path, EVENTS_FILE), "a", encoding="utf-8") as events_file:
+            self._write_event(events_file, {"type": "meta", "started": time.time(), "scale": self.scale,
+                                            "frame_every": self.frame_every})
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if item[0] == "event":
+                    self._write_event(events_file, item[1])
+                    continue
+                if item[0] == "state":
+                    game_state = item[1]
+                    self._write_event(events_file, {"type": "state", "seq": game_state.frame_seq,
+                                                    "time": game_state.capture_time,
+                                                    "state": game_state.to_compact()})
+                    continue
+
+                _, frame_seq, capture_time, frame = item
+                shape = list(frame.shape[:2])
+                if self.scale != 1.0:
+                    frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+                ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if not ok:
+                    continue
+                offset = frames_file.tell()
+                frames_file.write(encoded.tobytes())
+                self.frames_written += 1
+                self._write_event(events_file, {"type": "frame", "seq": frame_seq, "time": capture_time,
+                                                "offset": offset, "size": int(encoded.size), "shape": shape})
+
+    def _write_event(self, events_file, event):
+        events_file.write(json.dumps(event) + "\n")
+        self.events_written += 1
+
+    def stats(self):
+        return {"frames_written": self.frames_written, "events_written": self.events_written,
+                "dropped": self.dropped}
+
+def read_events(path):
+    """Читает события записи по порядку."""
+    with open(os.path.join(path, EVENTS_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_frame(frames_file, event, scale=1.0):
+    """
+    Декодирует кадр записи по событию "frame" и возвращает его к размеру захвата
+    (shape события; в старых записях без него — по масштабу записи scale).
+    """
+    frames_file.seek(event["offset"])
+    data = np.frombuffer(frames_file.read(event["size"]), dtype=np.uint8)
+    frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    if "shape" in event:
+        height, width = event["shape"]
+    else:
+        height, width = int(round(frame.shape[0] / scale)), int(round(frame.shape[1] / scale))
+    if frame.shape[:2] != (height, width):
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR)
+    return frame
+
+def replay(path, analyze_slow_components=None, keyframe_interval=1, limit=None):
+    """
+    Прогоняет запись через perceive_game_state и choose_action_rule_based без пауз.
+    Время кадров берется из записи, разыгранные карты подаются в зрение в записанные
+    моменты, поэтому повторные прогоны одной записи сравнимы между сборками.
+    Возвращает отчет: задержки восприятия, FPS и расхождения с записанными решениями.
+    """
+    # Импорт здесь: писателю записи модель не нужна
+    import game_vision
+    from game_logic import choose_action_rule_based
+    from game_state import GameState
+
+    if analyze_slow_components is None:
+        analyze_slow_components = game_vision.SLOW_AUTO
+    events = list(read_events(path))
+    # Кадры могли быть записаны уменьшенными: read_frame возвращает их к размеру захвата
+    scale = next((e.get("scale", 1.0) for e in events if e["type"] == "meta"), 1.0)
+    frame_events = [e for e in events if e["type"] == "frame"][:limit]
+    played = sorted((e for e in events if e["type"] == "played"), key=lambda e: e["time"])
+    recorded_decisions = {e["seq"]: e for e in events if e["type"] == "decision"}
+
+    # Каждый прогон с чистого состояния: эликсир, треки, рука, башни, задачи OCR, кэши областей и OCR
+    game_vision.reset_perception()
+    # Бюджет медленных компонентов по фиксированным оценкам стоимости: план зависит
+    # только от записи, а не от скорости машины
+    game_vision.slow_scheduler.deterministic = True
+
+    last_game_state = GameState()
+    perceive_seconds = []
+    counts = defaultdict(int)
+    played_index = 0
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(path, FRAMES_FILE), "rb") as frames_file:
+            for i, event in enumerate(frame_events):
+                frame = read_frame(frames_file, event, scale)
+                if frame is None:
+                    counts["undecodable_frames"] += 1
+                    continue
+                now = event["time"]
+                while played_index < len(played) and played[played_index]["time"] <= now:
+                    game_vision.notify_card_played(played[played_index]["card"], now=played[played_index]["time"])
+                    played_index += 1
+
+                frame_start = time.perf_counter()
+                game_state, _ = game_vision.perceive_game_state(
+                    frame, last_game_state=last_game_state, analyze_slow_components=analyze_slow_components,
+                    keyframe=(i % keyframe_interval == 0), frame_seq=event["seq"], capture_time=now, now=now)
+                perceive_seconds.append(time.perf_counter() - frame_start)
+                last_game_state = game_state
+
+                action = None
+                if game_state.game_start and not game_state.match_over:
+                    action = choose_action_rule_based(game_state)
+                counts["decisions"] += action is not None
+                recorded = recorded_decisions.get(event["seq"])
+                if recorded is not None:
+                    counts["recorded_decisions"] += 1
+                    if action is not None and action["slot_index"] == recorded["slot_index"] \
+                            and list(action["coords"]) == recorded["coords"]:
+                        counts["matching_decisions"] += 1
+    finally:
+        game_vision.slow_scheduler.deterministic = False
+    elapsed = time.perf_counter() - start
+
+    values = np.asarray(perceive_seconds, dtype=np.float64) * 1000.0
+    return {
+        "recording": path,
+        "frames": len(perceive_seconds),
+        "fps": len(perceive_seconds) / elapsed if elapsed > 0 else 0.0,
+        "perceive_ms": {
+            "p50": float(np.percentile(values, 50)) if values.size else 0.0,
+            "p95": float(np.percentile(values, 95)) if values.size else 0.0,
+            "p99": float(np.percentile(values, 99)) if values.size else 0.0,
+            "mean": float(values.mean()) if values.size else 0.0,
+        },
+        **counts,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных матчей.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="Прогнать запись через восприятие и логику решений.")
+    replay_parser.add_argument("path", help="Папка записи (main.py --record).")
+    replay_parser.add_argument("--mode", choices=("event", "slow", "fast"), default="event",
+                               help="Медленные компоненты: по планировщику, на каждом кадре или никогда.")
+    replay_parser.add_argument("--keyframe-interval", type=int, default=1)
+    replay_parser.add_argument("--limit", type=int, default=None)
+    replay_parser.add_argument("--json", dest="json_path", default=None, help="Сохранить отчет в JSON.")
+    args = parser.parse_args()
+
+    analyze = {"event": None, "slow": True, "fast": False}[args.mode]
+    report = replay(args.path, analyze_slow_components=analyze,
+                    keyframe_interval=max(1, args.keyframe_interval), limit=args.limit)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+# In-memory latency histograms and counters with two local export surfaces:
+# a periodic JSONL dump and a Prometheus-style text endpoint (/metrics).
+# Everything records into the module-level `registry`; recording is a lock plus a
+# bucket increment, cheap enough for per-frame use.
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Настройки ---
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0)
+METRIC_PREFIX = "cr_neuro_"
+DEFAULT_DUMP_INTERVAL = 10.0
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (как в Prometheus) и оценкой перцентилей."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка перцентиля линейной интерполяцией внутри корзины."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """Потокобезопасное хранилище гистограмм, счетчиков и значений (gauge)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """Сводка для JSONL: перцентили гистограмм в миллисекундах, счетчики и gauge."""
+        with self.lock:
+            return {
+                "time": time.time(),
+                "latency_ms": {
+                    name: {
+                        "count": h.count,
+                        "mean": 1000.0 * h.sum / h.count if h.count else 0.0,
+                        "p50": 1000.0 * h.quantile(0.50),
+                        "p95": 1000.0 * h.quantile(0.95),
+                        "p99": 1000.0 * h.quantile(0.99),
+                    }
+                    for name, h in self.histograms.items()
+                },
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def to_prometheus(self):
+        """Текстовый формат экспозиции Prometheus."""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{METRIC_PREFIX}{name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, value in sorted(self.gauges.items()):
+                metric = f"{METRIC_PREFIX}{name}"
+                lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+            for name, h in sorted(self.histograms.items()):
+                metric = f"{METRIC_PREFIX}{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(h.buckets, h.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum {h.sum}")
+                lines.append(f"{metric}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+# Общий реестр процесса
+registry = MetricsRegistry()
+
+class JsonlDumper(threading.Thread):
+    """Фоновый поток, периодически дописывающий снимок метрик строкой JSON в файл."""
+
+    def __init__(self, path, interval=DEFAULT_DUMP_INTERVAL, metrics=registry):
+        super().__init__(name="metrics-dumper", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.dump()
+        self.dump()
+
+    def dump(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.metrics.snapshot()) + "\n")
+
+def start_http_server(port, host="127.0.0.1", metrics=registry):
+    """
+    Запускает локальный HTTP-сервер с метриками по адресу http://host:port/metrics.
+    Возвращает объект сервера (server.shutdown() для остановки).
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Не засоряем консоль запросами скрейпера
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
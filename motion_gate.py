@@ -0,0 +1,129 @@
+# Motion-gated perception and the out-of-match low-power mode.
+# Outside a match (menus, loading screens, after MatchOver) the vision worker does not
+# need full-rate YOLO. It only has to notice the GameStart screen. In that mode the gate
+# wakes up IDLE_FPS times a second and compares a small strided grayscale sample of the
+# frame with the one from the last probe. YOLO runs only when the screen changed, and
+# at least every IDLE_PROBE_INTERVAL seconds, so GameStart is never missed for long.
+# During a match the same comparison, restricted to the arena, turns a due keyframe
+# into a cheap tracker extrapolation while nothing on the arena moves.
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import registry as metrics
+
+# --- Настройки ---
+# Область сравнения кадров в матче (x, y, w, h) — арена без панели карт и полосы эликсира
+MOTION_ROI = (0, 40, 766, 1110)
+# Шаг прореживания кадра для сравнения (px)
+MOTION_STEP = 8
+# Пиксель выборки считается изменившимся, если яркость сдвинулась больше чем на столько (0..255)
+MOTION_PIXEL_DELTA = 18
+# Доля изменившихся пикселей выборки, после которой кадр считается новым
+MOTION_MIN_FRACTION = 0.002
+# Даже на неподвижной арене YOLO запускается не реже чем раз в столько секунд
+MOTION_MAX_STATIC = 0.5
+# Вне матча: сколько раз в секунду проверять кадр и как часто запускать YOLO без изменений на экране
+IDLE_FPS = 2.0
+IDLE_PROBE_INTERVAL = 5.0
+
+# Решения гейта для кадра
+GATE_KEYFRAME = 'keyframe'          # полный YOLO
+GATE_EXTRAPOLATE = 'extrapolate'    # восприятие без YOLO (экстраполяция треков)
+GATE_SKIP = 'skip'                  # кадр не обрабатывается
+
+def frame_signature(frame, roi=None, step=MOTION_STEP):
+    """Прореженная серая выборка кадра (или области roi) для дешевого сравнения."""
+    if roi is not None:
+        x, y, w, h = roi
+        frame = frame[y:y+h, x:x+w]
+    return cv2.cvtColor(np.ascontiguousarray(frame[::step, ::step]), cv2.COLOR_BGR2GRAY)
+
+def changed_fraction(signature, reference):
+    """Доля пикселей выборки, изменившихся больше чем на MOTION_PIXEL_DELTA."""
+    if reference is None or reference.shape != signature.shape:
+        return 1.0
+    return float((cv2.absdiff(signature, reference) > MOTION_PIXEL_DELTA).mean())
+
+class PerceptionGate:
+    """
+    Решает для каждого кадра потока зрения: полный YOLO, экстраполяция или пропуск.
+    Эталон для сравнения — выборка последнего кадра, на котором запускался YOLO,
+    поэтому медленные изменения тоже накапливаются и в итоге запускают детекцию.
+    on_idle_change(idle) вызывается при входе в режим простоя и выходе из него
+    (например, чтобы снизить частоту захвата).
+    """
+
+    def __init__(self, roi=MOTION_ROI, idle_fps=IDLE_FPS, idle_probe_interval=IDLE_PROBE_INTERVAL,
+                 max_static=MOTION_MAX_STATIC, on_idle_change=None):
+        self.roi = roi
+        self.idle_period = 1.0 / idle_fps if idle_fps else 0.0
+        self.idle_probe_interval = idle_probe_interval
+        self.max_static = max_static
+        self.on_idle_change = on_idle_change
+        self.lock = threading.Lock()
+        self.idle = False
+        self._reference = None
+        self._reference_idle = None
+        self._last_keyframe = None
+        self._last_check = None
+        self.counts = {GATE_KEYFRAME: 0, GATE_EXTRAPOLATE: 0, GATE_SKIP: 0}
+
+    def decide(self, frame, in_match, keyframe_due=True, now=None):
+        """
+        Решение для кадра. in_match — матч идет (game_start и не match_over);
+        keyframe_due — по интервалу ключевых кадров этот кадр должен быть ключевым.
+        """
+        now = time.monotonic() if now is None else now
+        self._set_idle(not in_match)
+        if in_match:
+            decision = self._decide_in_match(frame, keyframe_due, now)
+        else:
+            decision = self._decide_idle(frame, now)
+        with self.lock:
+            self.counts[decision] += 1
+        metrics.inc(f"gate_{decision}")
+        return decision
+
+    def _decide_in_match(self, frame, keyframe_due, now):
+        if not keyframe_due:
+            return GATE_EXTRAPOLATE
+        signature = frame_signature(frame, self.roi)
+        stale = self._last_keyframe is None or now - self._last_keyframe >= self.max_static
+        if not stale and changed_fraction(signature, self._reference) < MOTION_MIN_FRACTION:
+            return GATE_EXTRAPOLATE
+        self._reference = signature
+        self._last_keyframe = now
+        return GATE_KEYFRAME
+
+    def _decide_idle(self, frame, now):
+        if self._last_check is not None and now - self._last_check < self.idle_period:
+            return GATE_SKIP
+        self._last_check = now
+        # Экран GameStart может появиться где угодно — вне матча сравнивается весь кадр
+        signature = frame_signature(frame)
+        due = self._last_keyframe is None or now - self._last_keyframe >= self.idle_probe_interval
+        if not due and changed_fraction(signature, self._reference_idle) < MOTION_MIN_FRACTION:
+            return GATE_SKIP
+        self._reference_idle = signature
+        self._last_keyframe = now
+        return GATE_KEYFRAME
+
+    def _set_idle(self, idle):
+        if idle == self.idle:
+            return
+        self.idle = idle
+        # Эталоны другого режима устарели
+        self._reference = self._reference_idle = None
+        self._last_check = None
+        metrics.set_gauge("idle_mode", int(idle))
+        print(f"[Gate] {'Вне матча: режим простоя' if idle else 'Матч: восприятие на полной частоте'}")
+        if self.on_idle_change is not None:
+            self.on_idle_change(idle)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, idle=self.idle)
@@ -0,0 +1,251 @@
+# Drive several emulator windows from one process with one shared model.
+# Every window has its own InstanceConfig (capture area, card slots, playable area),
+# capture thread, perception context, decision thread and action executor. A single
+# vision thread collects the newest frame of every window and runs them through one
+# batched model.predict call (game_vision.perceive_batch), so the model is loaded once
+# and throughput grows with the batch instead of with the number of model copies.
+#
+#   python multi_instance.py --instances instances.json --dry-run
+#
+# instances.json — список окон. Калибровка game_automation сдвигается к левому верхнему
+# углу окна; monitor / card_slots / playable_area можно задать явно, а path включает
+# воспроизведение файла вместо захвата экрана:
+#   [{"name": "left", "left": 0, "top": 35},
+#    {"name": "right", "left": 800, "top": 35, "path": "match.mp4"}]
+
+import argparse
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import game_automation
+import game_vision
+from action_executor import ActionExecutor, PendingAction, MAX_ACTION_AGE
+from capture import CaptureThread, create_capture_source
+from calibration import CARD_SLOTS, PLAYABLE_AREA, VISION_CAPTURE_AREA
+from frame_buffer import FrameRing
+from game_automation import convert_vision_to_global_coords, clamp_coords_to_playable_area
+from game_logic import choose_action_rule_based
+from game_state import GameState
+from hand_recognizer import HandRecognizer, slot_rois
+
+# --- Настройки ---
+CAPTURE_FPS = 30
+ACTION_COOLDOWN = 1.0
+# Ожидание новых кадров батчевым потоком зрения и потоками решений (сек)
+FRAME_WAIT_TIMEOUT = 0.05
+BATCH_IDLE_SLEEP = 0.005
+# Слотов в кольце кадров окна: один читатель (зрение) плюс два для записи
+FRAME_RING_SLOTS = 3
+
+@dataclass
+class InstanceConfig:
+    """Калибровка одного окна игры в глобальных экранных координатах."""
+    name: str
+    monitor: Dict[str, int]
+    card_slots: List[Tuple[int, int]]
+    playable_area: Tuple[int, int, int, int]
+    path: Optional[str] = None        # файл/папка с кадрами вместо захвата экрана
+
+    @classmethod
+    def at(cls, name, left, top, path=None):
+        """Калибровка из game_automation, сдвинутая к окну с левым верхним углом (left, top)."""
+        dx, dy = left - VISION_CAPTURE_AREA["left"], top - VISION_CAPTURE_AREA["top"]
+        x1, y1, x2, y2 = PLAYABLE_AREA
+        return cls(
+            name=name,
+            monitor=dict(VISION_CAPTURE_AREA, left=left, top=top),
+            card_slots=[(x + dx, y + dy) for x, y in CARD_SLOTS],
+            playable_area=(x1 + dx, y1 + dy, x2 + dx, y2 + dy),
+            path=path,
+        )
+
+    def slot_rois(self):
+        """Области слотов карт в координатах кадра этого окна (по card_slots и monitor)."""
+        return slot_rois(self.card_slots, self.monitor)
+
+def load_instances(path):
+    """Читает список InstanceConfig из JSON-файла (формат — в шапке модуля)."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    configs = []
+    for i, entry in enumerate(entries):
+        name = entry.get("name", f"instance{i}")
+        monitor = entry.get("monitor", {})
+        config = InstanceConfig.at(name, entry.get("left", monitor.get("left", VISION_CAPTURE_AREA["left"])),
+                                   entry.get("top", monitor.get("top", VISION_CAPTURE_AREA["top"])),
+                                   path=entry.get("path"))
+        if monitor:
+            config.monitor.update(monitor)
+        if "card_slots" in entry:
+            config.card_slots = [tuple(c) for c in entry["card_slots"]]
+        if "playable_area" in entry:
+            config.playable_area = tuple(entry["playable_area"])
+        configs.append(config)
+    if len({c.name for c in configs}) != len(configs):
+        raise ValueError("Имена окон в конфигурации должны быть уникальными")
+    return configs
+
+class Instance:
+    """Конвейер одного окна: захват -> (общий батч зрения) -> решение -> действие."""
+
+    def __init__(self, config: InstanceConfig, max_action_age=MAX_ACTION_AGE):
+        self.config = config
+        if config.path:
+            self.source = create_capture_source('file', monitor=config.monitor, path=config.path, loop=True)
+            target_fps = self.source.native_fps or CAPTURE_FPS
+        else:
+            self.source = create_capture_source('mss', monitor=config.monitor)
+            target_fps = CAPTURE_FPS
+        self.frames = FrameRing(self.source.frame_shape, slots=FRAME_RING_SLOTS)
+        self.reader = self.frames.reader()
+        self.capture = CaptureThread(self.source, self.frames, target_fps=target_fps)
+        self.context = game_vision.PerceptionContext(
+            name=config.name, hand_recognizer=HandRecognizer(game_vision.card_templates, rois=config.slot_rois()))
+        self.executor = ActionExecutor(max_age=max_action_age, on_played=self._on_played,
+                                       card_slots=config.card_slots, playable_area=config.playable_area,
+                                       name=f"action-executor-{config.name}")
+        self.decision = threading.Thread(target=self._decision_loop, name=f"decision-{config.name}", daemon=True)
+
+        self._condition = threading.Condition()
+        self.game_state = GameState()
+        self.frames_processed = 0
+        self.last_action_time = 0.0
+        self.running = True
+
+    def start(self):
+        self.capture.start()
+        self.executor.start()
+        self.decision.start()
+
+    def stop(self):
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        self.capture.stop()
+        self.executor.stop()
+        self.reader.release()
+
+    def join(self):
+        self.capture.join()
+        self.executor.join()
+        self.decision.join()
+
+    def publish(self, game_state):
+        """Результат восприятия от батчевого потока зрения."""
+        with self._condition:
+            self.game_state = game_state
+            self.frames_processed += 1
+            self._condition.notify_all()
+
+    def _on_played(self, action):
+        self.last_action_time = time.time()
+        game_vision.notify_card_played(action.card_name, context=self.context)
+
+    def _decision_loop(self):
+        seen = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.frames_processed > seen or not self.running,
+                                         timeout=FRAME_WAIT_TIMEOUT)
+                if not self.running:
+                    return
+                if self.frames_processed == seen:
+                    continue
+                seen = self.frames_processed
+                game_state = self.game_state
+
+            # Пока исполнитель занят, новое решение заменяет ожидающее; пауза идет от розыгрыша
+            if (not game_state.game_start or game_state.match_over
+                    or time.time() - self.last_action_time <= ACTION_COOLDOWN):
+                continue
+            action = choose_action_rule_based(game_state)
+            if not action:
+                continue
+            game_state.decision_time = time.monotonic()
+            global_coords = convert_vision_to_global_coords(action['coords'], self.config.monitor)
+            clamped_coords = clamp_coords_to_playable_area(global_coords, self.config.playable_area)
+            hand = game_state.get_hand_cards()
+            played = hand[action['slot_index']].class_name if action['slot_index'] < len(hand) else None
+            self.executor.submit(PendingAction(slot_index=action['slot_index'], coords=clamped_coords,
+                                               card_name=played, frame_time=game_state.capture_time,
+                                               decided_at=game_state.decision_time, game_state=game_state))
+
+def batch_vision_worker(instances, stop_event, stats):
+    """Собирает свежие кадры всех окон и прогоняет их через модель одним батчем."""
+    last_states = {inst.config.name: GameState() for inst in instances}
+    while not stop_event.is_set():
+        batch = []
+        for inst in instances:
+            frame_seq, frame = inst.reader.read(timeout=0)
+            if frame is not None:
+                batch.append((inst, frame_seq, frame, inst.reader.last_timestamp))
+        if not batch:
+            time.sleep(BATCH_IDLE_SLEEP)
+            continue
+
+        results = game_vision.perceive_batch(
+            [frame for _, _, frame, _ in batch],
+            [last_states[inst.config.name] for inst, _, _, _ in batch],
+            [inst.context for inst, _, _, _ in batch],
+            analyze_slow_components=game_vision.SLOW_AUTO,
+            frame_seqs=[seq for _, seq, _, _ in batch],
+            capture_times=[t for _, _, _, t in batch],
+        )
+        for (inst, _, _, _), (game_state, _) in zip(batch, results):
+            inst.reader.release()
+            last_states[inst.config.name] = game_state
+            inst.publish(game_state)
+        stats["batches"] += 1
+        stats["frames"] += len(batch)
+
+def main():
+    parser = argparse.ArgumentParser(description="CR_Neuro: несколько окон игры с общей моделью.")
+    parser.add_argument("--instances", required=True, help="JSON со списком окон (см. шапку multi_instance.py).")
+    parser.add_argument("--dry-run", action="store_true", help="Не кликать, только печатать действия.")
+    parser.add_argument("--max-action-age", type=float, default=MAX_ACTION_AGE)
+    parser.add_argument("--duration", type=float, default=None, help="Остановиться через N секунд.")
+    args = parser.parse_args()
+    game_automation.DRY_RUN = args.dry_run
+
+    instances = [Instance(config, max_action_age=args.max_action_age) for config in load_instances(args.instances)]
+    print(f"[Multi] Окон: {len(instances)} ({', '.join(i.config.name for i in instances)}). Ctrl+C для выхода.")
+    stop_event = threading.Event()
+    stats = {"batches": 0, "frames": 0}
+    vision = threading.Thread(target=batch_vision_worker, args=(instances, stop_event, stats), name="batch-vision")
+
+    for inst in instances:
+        inst.start()
+    # Модель грузится и прогревается, пока запускаются захваты окон
+    game_vision.engine.start(instances[0].source.frame_shape).join()
+    vision.start()
+    start = time.perf_counter()
+    try:
+        while not stop_event.wait(0.5):
+            if args.duration is not None and time.perf_counter() - start >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Остановка потоков...")
+        stop_event.set()
+        vision.join()
+        for inst in instances:
+            inst.stop()
+        for inst in instances:
+            inst.join()
+
+        elapsed = time.perf_counter() - start
+        batches = stats["batches"]
+        print(f"[Multi] Кадров: {stats['frames']} за {elapsed:.1f} с ({stats['frames'] / elapsed:.1f} кадр/с), "
+              f"средний батч: {stats['frames'] / batches if batches else 0.0:.2f}")
+        for inst in instances:
+            print(f"[Multi] {inst.config.name}: обработано {inst.frames_processed}, пропущено {inst.reader.dropped}, "
+                  f"действия: {inst.executor.stats()}, рука: {inst.context.hand_recognizer.stats()}")
+        game_vision.save_card_templates()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
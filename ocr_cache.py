@@ -0,0 +1,76 @@
+# Content-addressed cache of OCR results.
+# The elixir number and tower HP stay the same for many consecutive reads, so the
+# thresholded crop is usually bit-for-bit identical to one already recognized. The
+# cache key is a hash of the packed binary crop (plus its shape and the OCR config);
+# a hit returns the previous value in microseconds instead of running OCR again.
+# Failed reads are not cached, so the same crop gets another OCR attempt next time.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import registry as metrics
+
+# --- Настройки ---
+DEFAULT_CAPACITY = 256
+
+class OcrCache:
+    """LRU-кэш "бинарный кроп -> число" с ограниченным размером и счетчиками попаданий."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(processed_image, config=''):
+        """Ключ кропа: хэш упакованных бит порогового изображения, его размер и конфиг OCR."""
+        packed = np.packbits(np.ascontiguousarray(processed_image) > 0)
+        digest = hashlib.blake2b(packed.tobytes(), digest_size=16)
+        digest.update(repr((processed_image.shape, config)).encode())
+        return digest.digest()
+
+    def get(self, key):
+        """Возвращает (True, значение) при попадании, иначе (False, None)."""
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = self._entries[key]
+                hit = True
+            else:
+                self.misses += 1
+                value, hit = None, False
+        metrics.inc("ocr_cache_hits" if hit else "ocr_cache_misses")
+        return hit, value
+
+    def put(self, key, value):
+        """Запоминает значение; неудачное чтение (None) не кэшируется."""
+        if self.capacity <= 0 or value is None:
+            return
+        with self.lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,117 @@
+# Pipelined execution of the slow OCR components.
+# Without it the elixir OCR and tower-HP OCR of a slow tick run inside
+# perceive_game_state, so that frame's latency is YOLO plus every OCR. With the
+# pipeline the vision thread only cuts the small crops a component needs and submits
+# them to a shared worker pool, then moves on to the next frame. Finished results are
+# collected at the start of a later frame, merged into the newest GameSnapshot and
+# tagged with the frame they were read from. Throughput is then bound by the slowest
+# stage instead of the sum of all stages. Tesseract runs as a subprocess and OpenCV
+# releases the GIL, so the worker threads really do run in parallel.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+from metrics import registry as metrics
+
+# --- Настройки ---
+# Потоков в общем пуле OCR (на все окна)
+OCR_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def shared_executor():
+    """Общий пул потоков OCR; создается при первой задаче."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+        return _executor
+
+def shutdown_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+class OcrResult(NamedTuple):
+    component: str
+    frame_seq: int      # кадр, с которого сделаны кропы
+    now: float          # время этого кадра (для оценок, зависящих от времени)
+    value: Any          # результат функции задачи
+    context: Any        # данные, нужные для слияния результата (например, слоты башен)
+
+class OcrPipeline:
+    """
+    Задачи OCR одного окна. По каждому компоненту в работе не больше одной задачи:
+    пока она не завершилась, новые кадры этот компонент не запускают, и планировщик
+    повторит его позже. reset() (новый матч) отбрасывает результаты начатых задач.
+    """
+
+    def __init__(self, executor=None):
+        self._executor = executor
+        self.lock = threading.Lock()
+        self._pending = {}      # component -> (generation, frame_seq, now, context, future)
+        self._generation = 0
+        self.submitted = 0
+        self.completed = 0
+        self.busy_skips = 0
+        self.discarded = 0
+
+    def busy(self, component):
+        """True, если задача компонента еще выполняется (пропуск учитывается в статистике)."""
+        with self.lock:
+            pending = self._pending.get(component)
+            busy = pending is not None and not pending[4].done()
+            if busy:
+                self.busy_skips += 1
+        return busy
+
+    def submit(self, component, frame_seq, now, fn, *args, context=None):
+        """
+        Ставит fn(*args) в пул. Аргументы не должны ссылаться на буфер кадра:
+        слот кольца перезаписывается захватом, поэтому передаются копии кропов.
+        """
+        def run():
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe(f"ocr_job_{component}", time.perf_counter() - start)
+
+        future = (self._executor or shared_executor()).submit(run)
+        with self.lock:
+            self._pending[component] = (self._generation, frame_seq, now, context, future)
+            self.submitted += 1
+
+    def collect(self):
+        """Забирает завершенные задачи текущего матча; возвращает список OcrResult по порядку кадров."""
+        results = []
+        with self.lock:
+            for component, (generation, frame_seq, now, context, future) in list(self._pending.items()):
+                if not future.done():
+                    continue
+                del self._pending[component]
+                if generation != self._generation:
+                    self.discarded += 1
+                    continue
+                error = future.exception()
+                if error is not None:
+                    print(f"[OcrPipeline ERROR] {component}: {error}")
+                    continue
+                self.completed += 1
+                results.append(OcrResult(component, frame_seq, now, future.result(), context))
+        results.sort(key=lambda r: r.frame_seq)
+        return results
+
+    def reset(self):
+        with self.lock:
+            self._generation += 1
+
+    def stats(self):
+        with self.lock:
+            return {"submitted": self.submitted, "completed": self.completed, "busy_skips": self.busy_skips,
+                    "discarded": self.discarded, "in_flight": sum(not p[4].done() for p in self._pending.values())}
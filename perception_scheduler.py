@@ -0,0 +1,182 @@
+# Event-driven scheduling of the slow perception components (tower HP OCR, elixir OCR).
+# Instead of a fixed "every N-th frame" tick, each component runs when something in
+# the scene makes its value likely to have changed (units fighting next to a tower,
+# an HP bar changing size, a card being played) and at least once per its deadline.
+# A per-frame CPU budget, based on the measured cost of each component, stops several
+# components from piling up on the same frame. In deterministic mode (replay, benchmark)
+# the budget uses fixed cost estimates instead, so the same input gives the same plan
+# on any machine.
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+
+from metrics import registry as metrics
+
+# Имена компонентов совпадают с названиями этапов профилирования в game_vision
+COMPONENT_TOWER_HEALTH = 'tower_health'
+COMPONENT_ELIXIR_OCR = 'elixir_ocr'
+
+# --- Настройки ---
+# Бюджет процессорного времени медленных компонентов на один кадр (сек)
+FRAME_BUDGET = 0.030
+# Начальная оценка стоимости компонента до первого замера (сек)
+INITIAL_COST_ESTIMATE = 0.010
+# Сглаживание оценки стоимости (экспоненциальное среднее)
+COST_SMOOTHING = 0.2
+# Фиксированные оценки стоимости компонентов (сек) для детерминированного режима
+FIXED_COMPONENT_COSTS = {
+    COMPONENT_TOWER_HEALTH: 0.020,
+    COMPONENT_ELIXIR_OCR: 0.008,
+}
+# Юнит ближе этого расстояния (px) к башне противника считается угрозой ее HP
+THREAT_RADIUS = 200
+# Изменение ширины рамки HP (px), которое считается изменением здоровья
+HP_BOX_CHANGE_PX = 3
+# Задержка OCR эликсира после розыгрыша карты: цифра обновляется не сразу (сек)
+CARD_PLAYED_OCR_DELAY = 0.3
+
+@dataclass
+class SlowComponent:
+    name: str
+    max_interval: float              # дедлайн: запускать не реже, чем раз в столько секунд
+    min_interval: float = 0.0        # и не чаще, даже при частых событиях
+    needs_keyframe: bool = False     # компоненту нужны свежие рамки YOLO
+
+DEFAULT_COMPONENTS = (
+    # После фиксации раскладки башен (tower_layout.py) HP читается и без свежих рамок YOLO
+    SlowComponent(COMPONENT_TOWER_HEALTH, max_interval=2.0, min_interval=0.25),
+    SlowComponent(COMPONENT_ELIXIR_OCR, max_interval=2.0, min_interval=0.5),
+)
+
+class SlowComponentScheduler:
+    """
+    Решает, какие медленные компоненты запускать на текущем кадре.
+    Компонент готов к запуску, если истек его дедлайн или пришло событие (trigger)
+    и с прошлого запуска прошло не меньше min_interval. Готовые компоненты берутся
+    по срочности, пока их суммарная оценка стоимости укладывается в frame_budget;
+    самый срочный запускается всегда, чтобы дорогой компонент не голодал.
+    При deterministic=True бюджет считается по FIXED_COMPONENT_COSTS, а не по замерам:
+    план зависит только от времени кадров и событий (воспроизведение записи, бенчмарк).
+    """
+
+    def __init__(self, components=DEFAULT_COMPONENTS, frame_budget=FRAME_BUDGET, deterministic=False):
+        self.lock = threading.Lock()
+        self.components = {c.name: c for c in components}
+        self.frame_budget = frame_budget
+        self.deterministic = deterministic
+        self._cost = {name: INITIAL_COST_ESTIMATE for name in self.components}
+        self.runs = defaultdict(int)
+        self.deferred = defaultdict(int)
+        self.triggers = defaultdict(lambda: defaultdict(int))
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает время запусков и события (новый матч): все компоненты сразу готовы."""
+        with self.lock:
+            self._last_run = {name: float('-inf') for name in self.components}
+            self._pending = {}  # name -> время, с которого событие считается наступившим
+            self._prev_hp = None
+
+    def trigger(self, name, reason, delay=0.0, now=None):
+        """Сообщает о событии, после которого компоненту `name` стоит запуститься."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            due = now + delay
+            self._pending[name] = min(due, self._pending.get(name, due))
+            self.triggers[name][reason] += 1
+        metrics.inc(f"slow_{name}_trigger_{reason}")
+
+    def plan(self, now=None, keyframe=True):
+        """Возвращает frozenset имен компонентов, которые нужно запустить на этом кадре."""
+        now = time.monotonic() if now is None else now
+        ready = []
+        with self.lock:
+            for name, component in self.components.items():
+                if component.needs_keyframe and not keyframe:
+                    continue
+                since = now - self._last_run[name]
+                overdue = since >= component.max_interval
+                pending_at = self._pending.get(name)
+                event = pending_at is not None and now >= pending_at and since >= component.min_interval
+                if overdue or event:
+                    # Просроченные дедлайны важнее событий, внутри группы — по доле просрочки
+                    ready.append((not overdue, -since / component.max_interval, name))
+
+            ready.sort()
+            selected = []
+            spent = 0.0
+            for _, _, name in ready:
+                cost = FIXED_COMPONENT_COSTS.get(name, INITIAL_COST_ESTIMATE) if self.deterministic \
+                    else self._cost[name]
+                if selected and spent + cost > self.frame_budget:
+                    self.deferred[name] += 1
+                    metrics.inc(f"slow_{name}_deferred")
+                    continue
+                selected.append(name)
+                spent += cost
+        return frozenset(selected)
+
+    @contextmanager
+    def running(self, name, now=None):
+        """Оборачивает запуск компонента: снимает его событие и обновляет оценку стоимости."""
+        now = time.monotonic() if now is None else now
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self._last_run[name] = now
+                self._pending.pop(name, None)
+                self._cost[name] += COST_SMOOTHING * (elapsed - self._cost[name])
+                self.runs[name] += 1
+            metrics.inc(f"slow_{name}_runs")
+
+    def observe_scene(self, my_unit_centers, enemy_unit_centers, my_tower_centers, enemy_tower_centers,
+                      hp_boxes=None, hp_classes=None, now=None):
+        """
+        Генерирует события по сцене кадра. Центры — массивы (N, 2).
+        - Юниты рядом с башней противника -> HP башен скоро изменится.
+        - Рамки HP (hp_boxes (N, 4) с классами hp_classes) появились, пропали или изменили
+          ширину -> HP изменилось. Рамки передаются только с ключевых кадров.
+        """
+        if _any_within(enemy_unit_centers, my_tower_centers, THREAT_RADIUS) or \
+                _any_within(my_unit_centers, enemy_tower_centers, THREAT_RADIUS):
+            self.trigger(COMPONENT_TOWER_HEALTH, 'units_near_tower', now=now)
+
+        if hp_boxes is None:
+            return
+        order = np.lexsort((hp_boxes[:, 0], hp_classes))
+        current = (hp_classes[order], hp_boxes[order, 2] - hp_boxes[order, 0])
+        with self.lock:
+            previous, self._prev_hp = self._prev_hp, current
+        if previous is None:
+            return
+        if not np.array_equal(previous[0], current[0]) or \
+                (current[1].size and np.abs(current[1] - previous[1]).max() > HP_BOX_CHANGE_PX):
+            self.trigger(COMPONENT_TOWER_HEALTH, 'hp_box_changed', now=now)
+
+    def stats(self):
+        """Число запусков, отложенных из-за бюджета запусков, события и оценка стоимости (мс)."""
+        with self.lock:
+            return {
+                name: {
+                    "runs": self.runs[name],
+                    "deferred": self.deferred[name],
+                    "cost_ms": 1000.0 * self._cost[name],
+                    "triggers": dict(self.triggers[name]),
+                }
+                for name in self.components
+            }
+
+def _any_within(points, targets, radius):
+    """True, если хотя бы одна точка из points ближе radius к какой-либо из targets."""
+    if len(points) == 0 or len(targets) == 0:
+        return False
+    diff = np.asarray(points, dtype=np.float32)[:, None, :] - np.asarray(targets, dtype=np.float32)[None, :, :]
+    return bool(((diff ** 2).sum(axis=2) < radius * radius).any())
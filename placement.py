@@ -0,0 +1,178 @@
+# Vectorized arena maps and batch placement scoring for the decision logic.
+# Every frame the decision logic builds a ThreatMap of the playable area (in vision
+# frame coordinates): enemy threat (a Gaussian around each enemy's position, pushed
+# ahead along its tracker velocity), lane pressure (enemy minus own units per lane)
+# and own tower coverage. Candidate placements are scored all at once with NumPy,
+# first on a coarse grid and then refined around the best cell while time remains,
+# so the cost stays within a few milliseconds however many units are on screen.
+
+import time
+
+import numpy as np
+
+from calibration import PLAYABLE_AREA, VISION_CAPTURE_AREA
+from game_state import GameSnapshot, EMPTY_SLOT
+from metrics import registry as metrics
+
+# --- Настройки ---
+# Игровая зона в координатах кадра зрения (choose_action_rule_based работает в них)
+PLAYABLE_AREA_LOCAL = (PLAYABLE_AREA[0] - VISION_CAPTURE_AREA["left"], PLAYABLE_AREA[1] - VISION_CAPTURE_AREA["top"],
+                       PLAYABLE_AREA[2] - VISION_CAPTURE_AREA["left"], PLAYABLE_AREA[3] - VISION_CAPTURE_AREA["top"])
+# Граница левой и правой линии (середина арены по X)
+ARENA_CENTER_X = VISION_CAPTURE_AREA["width"] / 2
+# Шаг грубой сетки и уточнения (px)
+GRID_CELL = 32
+REFINE_CELL = 8
+# Бюджет времени выбора точки (сек); грубая сетка считается всегда, уточнение — пока есть время
+PLACEMENT_BUDGET = 0.003
+# Радиус "угрозы" врага (σ гауссианы, px) и на сколько секунд вперед сдвигать врага по скорости
+THREAT_SIGMA = 90.0
+THREAT_LOOKAHEAD = 0.5
+# Дальность стрельбы башни (px)
+TOWER_RANGE = 300
+# Сколько ближайших к нам врагов учитывать, чтобы стоимость карты угроз была ограничена
+MAX_THREAT_UNITS = 64
+# Веса слагаемых оценки
+THREAT_WEIGHT = 1.0
+PRESSURE_WEIGHT = 0.3
+COVERAGE_WEIGHT = 0.5
+# Разброс притяжения к целевой точке или ряду (px)
+TARGET_SIGMA = 60.0
+
+MODE_DEFENSE = 'defense'
+MODE_SUPPORT = 'support'
+MODE_ROW = 'row'
+
+def _centers(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+def _scene_arrays(game_state):
+    """(центры врагов, скорости врагов, центры своих юнитов, центры своих башен) массивами (N, 2)."""
+    if isinstance(game_state, GameSnapshot):
+        units, towers = game_state.unit_array, game_state.tower_array
+        enemies = units[~units['is_mine']]
+        my_towers = towers[(towers['class_id'] != EMPTY_SLOT) & towers['is_mine']]
+        return (_centers(enemies['box']), enemies['velocity'].astype(np.float32),
+                _centers(units['box'][units['is_mine']]), _centers(my_towers['box']))
+    return (_centers([u.box for u in game_state.enemy_units]),
+            np.asarray([u.velocity for u in game_state.enemy_units], dtype=np.float32).reshape(-1, 2),
+            _centers([u.box for u in game_state.my_units]), _centers([t.box for t in game_state.my_towers]))
+
+def _grid(x1, y1, x2, y2, step):
+    """Центры ячеек прямоугольника с шагом step массивом (N, 2)."""
+    xs = np.arange(x1 + step / 2, x2, step, dtype=np.float32)
+    ys = np.arange(y1 + step / 2, y2, step, dtype=np.float32)
+    gx, gy = np.meshgrid(xs, ys)
+    return np.stack((gx.ravel(), gy.ravel()), axis=1)
+
+class ThreatMap:
+    """
+    Карты арены одного кадра. Поля считаются для произвольного массива точек (N, 2),
+    поэтому одни и те же формулы дают и сетку, и уточнение вокруг лучшей ячейки.
+    threat, pressure, coverage — значения на грубой сетке `points` (для отладки и оверлея).
+    """
+
+    def __init__(self, game_state, area=PLAYABLE_AREA_LOCAL, cell=GRID_CELL):
+        self.area = area
+        enemies, velocities, my_units, self.my_towers = _scene_arrays(game_state)
+        # Индексы учтенных врагов в game_state.enemy_units
+        self.enemy_index = np.arange(len(enemies))
+        if len(enemies) > MAX_THREAT_UNITS:
+            # Самые опасные — ближе всего к нашей стороне (больше Y)
+            self.enemy_index = np.argsort(-enemies[:, 1])[:MAX_THREAT_UNITS]
+            enemies, velocities = enemies[self.enemy_index], velocities[self.enemy_index]
+        self.enemies = enemies
+        self.threat_centers = enemies + velocities * THREAT_LOOKAHEAD
+
+        # Давление на линию: враги минус свои юниты на нашей половине (Y ниже верха игровой зоны)
+        def per_lane(centers):
+            centers = centers[centers[:, 1] >= area[1]]
+            right = centers[:, 0] >= ARENA_CENTER_X
+            return np.array([(~right).sum(), right.sum()], dtype=np.float32)
+        self.lane_pressure = per_lane(enemies) - per_lane(my_units)
+
+        self.points = _grid(*area, cell)
+        self.threat = self.threat_at(self.points)
+        self.pressure = self.pressure_at(self.points)
+        self.coverage = self.coverage_at(self.points)
+
+    def threat_at(self, points):
+        if len(self.threat_centers) == 0:
+            return np.zeros(len(points), dtype=np.float32)
+        d2 = ((points[:, None, :] - self.threat_centers[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-d2 / (2 * THREAT_SIGMA ** 2)).sum(axis=1)
+
+    def pressure_at(self, points):
+        return self.lane_pressure[(points[:, 0] >= ARENA_CENTER_X).astype(np.intp)]
+
+    def coverage_at(self, points):
+        """Число своих башен, до которых точка в пределах TOWER_RANGE."""
+        if len(self.my_towers) == 0:
+            return np.zeros(len(points), dtype=np.float32)
+        d2 = ((points[:, None, :] - self.my_towers[None, :, :]) ** 2).sum(axis=2)
+        return (d2 < TOWER_RANGE * TOWER_RANGE).sum(axis=1).astype(np.float32)
+
+    def score(self, points, mode, target=None):
+        """
+        Оценки точек (N,) для режима:
+        MODE_DEFENSE — ближе к угрозе и под прикрытием своих башен;
+        MODE_SUPPORT — ближе к target (x, y) и дальше от угроз;
+        MODE_ROW — ближе к ряду target (y), на линии с меньшим давлением врага и без угроз.
+        """
+        if points is self.points:
+            threat, pressure, coverage = self.threat, self.pressure, self.coverage
+        else:
+            threat, pressure, coverage = self.threat_at(points), self.pressure_at(points), self.coverage_at(points)
+        if mode == MODE_DEFENSE:
+            return threat * (1.0 + COVERAGE_WEIGHT * coverage)
+        if mode == MODE_SUPPORT:
+            d2 = ((points - np.asarray(target, dtype=np.float32)) ** 2).sum(axis=1)
+            return np.exp(-d2 / (2 * TARGET_SIGMA ** 2)) - THREAT_WEIGHT * threat
+        if mode == MODE_ROW:
+            # Внутри линии предпочитаем ее середину, чтобы при равных оценках не уходить к краю
+            x1, _, x2, _ = self.area
+            lane_center = np.where(points[:, 0] >= ARENA_CENTER_X, (ARENA_CENTER_X + x2) / 2, (x1 + ARENA_CENTER_X) / 2)
+            closeness = np.exp(-((points[:, 1] - target) ** 2 + (points[:, 0] - lane_center) ** 2)
+                               / (2 * TARGET_SIGMA ** 2))
+            return closeness - THREAT_WEIGHT * threat - PRESSURE_WEIGHT * pressure
+        raise ValueError(f"Неизвестный режим размещения: {mode}")
+
+    def best_placement(self, mode, target=None, budget=PLACEMENT_BUDGET):
+        """
+        Лучшая точка игровой зоны (x, y) для режима. Грубая сетка оценивается целиком,
+        затем, пока не истек бюджет, сетка вдвое мельче уточняет окрестность лучшей точки.
+        """
+        start = time.perf_counter()
+        deadline = start + budget
+        scores = self.score(self.points, mode, target)
+        best = self.points[int(np.argmax(scores))]
+        best_score = float(scores.max())
+
+        x1, y1, x2, y2 = self.area
+        step = GRID_CELL / 2
+        while step >= REFINE_CELL and time.perf_counter() < deadline:
+            window = _grid(max(x1, best[0] - 2 * step), max(y1, best[1] - 2 * step),
+                           min(x2, best[0] + 2 * step), min(y2, best[1] + 2 * step), step)
+            if len(window):
+                window_scores = self.score(window, mode, target)
+                i = int(np.argmax(window_scores))
+                if window_scores[i] > best_score:
+                    best, best_score = window[i], float(window_scores[i])
+            step /= 2
+        metrics.observe("placement", time.perf_counter() - start)
+        return int(best[0]), int(best[1])
+
+    def threatened_towers(self, radius):
+        """Маска своих башен, рядом с которыми (ближе radius) есть враг."""
+        if len(self.enemies) == 0 or len(self.my_towers) == 0:
+            return np.zeros(len(self.my_towers), dtype=bool)
+        d2 = ((self.my_towers[:, None, :] - self.enemies[None, :, :]) ** 2).sum(axis=2)
+        return (d2 < radius * radius).any(axis=1)
+
+    def closest_enemy(self):
+        """Индекс (в game_state.enemy_units) врага, ближайшего к какой-либо своей башне, или None."""
+        if len(self.enemies) == 0 or len(self.my_towers) == 0:
+            return None
+        d2 = ((self.enemies[:, None, :] - self.my_towers[None, :, :]) ** 2).sum(axis=2)
+        return int(self.enemy_index[np.argmin(d2.min(axis=1))])
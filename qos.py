@@ -0,0 +1,133 @@
+# Adaptive quality-of-service controller for the perception settings.
+# The controller watches the per-frame latency from capture to a finished GameSnapshot
+# (smoothed) against a target. When the pipeline falls behind, it steps down a ladder of
+# quality levels, each trading some accuracy for speed: a smaller inference input size,
+# YOLO on fewer keyframes, and a rarer or cheaper slow-component (OCR) rate. When there
+# is steady headroom, it steps back up. Upgrades need a longer hold than downgrades.
+# An upgrade that had to be undone right away doubles the hold for that step, so the
+# controller does not oscillate on a host that sits between two levels. Every decision
+# is printed, counted in metrics and optionally appended to a JSONL log for tuning.
+
+import json
+import threading
+import time
+from typing import NamedTuple
+
+from metrics import registry as metrics
+
+class QosLevel(NamedTuple):
+    imgsz: int                  # размер входа модели (game_vision.INFERENCE_IMGSZ)
+    keyframe_interval: int      # YOLO раз в N кадров
+    slow_tick_rate: int         # режим 'tick': медленные компоненты раз в N кадров
+    slow_budget_scale: float    # режим 'event': доля бюджета медленных компонентов на кадр
+
+# --- Настройки ---
+# Лестница уровней от лучшего качества к самому дешевому; это и есть границы регулирования
+QOS_LEVELS = (
+    QosLevel(900, 1, 5, 1.0),
+    QosLevel(768, 1, 5, 1.0),
+    QosLevel(640, 1, 8, 0.75),
+    QosLevel(640, 2, 10, 0.5),
+    QosLevel(512, 2, 15, 0.5),
+    QosLevel(512, 3, 20, 0.25),
+)
+# Целевая задержка кадра от захвата до готового снимка (сек)
+QOS_TARGET_LATENCY = 0.060
+# Коэффициент сглаживания задержки (EMA)
+QOS_SMOOTHING = 0.1
+# Понижать качество, если сглаженная задержка выше target * QOS_DEGRADE_RATIO дольше QOS_DEGRADE_HOLD
+QOS_DEGRADE_RATIO = 1.0
+QOS_DEGRADE_HOLD = 1.0
+# Повышать, если она ниже target * QOS_UPGRADE_RATIO дольше QOS_UPGRADE_HOLD
+QOS_UPGRADE_RATIO = 0.6
+QOS_UPGRADE_HOLD = 5.0
+# Во сколько раз растет выдержка повышения, если после него пришлось сразу понизить качество, и ее предел
+QOS_UPGRADE_BACKOFF = 2.0
+QOS_MAX_UPGRADE_HOLD = 120.0
+# Сколько кадров после смены уровня не принимать решений (задержка еще отражает старые настройки)
+QOS_SETTLE_FRAMES = 10
+
+class QosController:
+    """
+    Выбирает уровень качества по измеренной задержке. observe() вызывается потоком зрения
+    на каждом кадре и возвращает новый QosLevel, если уровень сменился, иначе None.
+    Применение настроек остается за вызывающим кодом.
+    """
+
+    def __init__(self, target=QOS_TARGET_LATENCY, levels=QOS_LEVELS, start_level=0, log_path=None):
+        self.target = target
+        self.levels = tuple(levels)
+        self.level = min(max(0, start_level), len(self.levels) - 1)
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        # Выдержка повышения на уровень i (из уровня i + 1)
+        self._upgrade_hold = [QOS_UPGRADE_HOLD] * len(self.levels)
+        self._upgraded_at = None
+        self.decisions = 0
+        self._reset_window()
+        metrics.set_gauge("qos_level", self.level)
+
+    def _reset_window(self):
+        self.latency = None
+        self._frames = 0
+        self._over_since = None
+        self._under_since = None
+
+    @property
+    def settings(self) -> QosLevel:
+        return self.levels[self.level]
+
+    def observe(self, latency, now=None):
+        """Учитывает задержку кадра (сек). Возвращает новый QosLevel при смене уровня."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.latency = latency if self.latency is None else self.latency + QOS_SMOOTHING * (latency - self.latency)
+            self._frames += 1
+            if self._frames < QOS_SETTLE_FRAMES:
+                return None
+
+            if self.latency > self.target * QOS_DEGRADE_RATIO:
+                self._under_since = None
+                self._over_since = self._over_since if self._over_since is not None else now
+                if now - self._over_since >= QOS_DEGRADE_HOLD and self.level < len(self.levels) - 1:
+                    if self._upgraded_at is not None and now - self._upgraded_at < self._upgrade_hold[self.level]:
+                        # Повышение на этот уровень не выдержало нагрузки — в следующий раз ждать дольше
+                        self._upgrade_hold[self.level] = min(QOS_MAX_UPGRADE_HOLD,
+                                                             self._upgrade_hold[self.level] * QOS_UPGRADE_BACKOFF)
+                    return self._change(self.level + 1, "degrade", now)
+            elif self.latency < self.target * QOS_UPGRADE_RATIO:
+                self._over_since = None
+                self._under_since = self._under_since if self._under_since is not None else now
+                if self.level > 0 and now - self._under_since >= self._upgrade_hold[self.level - 1]:
+                    self._upgraded_at = now
+                    return self._change(self.level - 1, "upgrade", now)
+            else:
+                self._over_since = self._under_since = None
+            return None
+
+    def _change(self, level, reason, now):
+        """Смена уровня (вызывать под lock): запись решения и сброс окна измерений."""
+        previous, latency = self.level, self.latency
+        self.level = level
+        self.decisions += 1
+        settings = self.levels[level]
+        print(f"[QoS] {reason}: уровень {previous} -> {level}, задержка {latency * 1000:.1f} мс "
+              f"(цель {self.target * 1000:.1f} мс), imgsz {settings.imgsz}, keyframe {settings.keyframe_interval}, "
+              f"slow tick {settings.slow_tick_rate}, бюджет x{settings.slow_budget_scale}")
+        metrics.set_gauge("qos_level", level)
+        metrics.inc(f"qos_{reason}")
+        if self.log_path:
+            record = {"time": now, "reason": reason, "from": previous, "to": level,
+                      "latency_ms": round(latency * 1000, 2), "target_ms": round(self.target * 1000, 2),
+                      "upgrade_hold": self._upgrade_hold[min(level, len(self.levels) - 1)],
+                      **settings._asdict()}
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        self._reset_window()
+        return settings
+
+    def stats(self):
+        with self.lock:
+            return {"level": self.level, "decisions": self.decisions,
+                    "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+                    **self.settings._asdict()}
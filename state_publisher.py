@@ -0,0 +1,208 @@
+# Publishes the latest GameSnapshot to a fixed-layout shared-memory segment so that other
+# local processes (dashboards, loggers, experimental decision engines) can read the bot's
+# state without running vision themselves.
+#
+# Segment layout (little-endian):
+#   header  magic, layout version, payload capacity, sequence (u64), publish time (f64),
+#           payload length, class-names length
+#   names   JSON list of class names by id, written once when the segment is created
+#   payload GameSnapshot.to_bytes() of the latest state (frame_seq and timestamps included)
+#
+# Writes use a seqlock. The writer makes the sequence odd, copies the payload, writes
+# its length and publish time, and only then stores the even sequence on its own. A
+# reader reads the sequence, then length and time, then the payload, and rereads the
+# sequence. It retries if the two reads differ or the sequence is odd. The writer never
+# waits for readers and readers never take a lock, so polling costs the perception
+# thread nothing beyond one memcpy per frame. There is one writer per segment.
+
+import argparse
+import json
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from game_state import GameSnapshot, UNIT_DTYPE
+
+# --- Настройки ---
+# Имя сегмента по умолчанию
+STATE_SHM_NAME = "cr_neuro_state"
+# Сколько юнитов помещается в сегмент; лишние (дальние от нашей стороны) не публикуются
+MAX_PUBLISHED_UNITS = 256
+# Сколько раз читатель повторяет чтение, если попал на запись
+READ_RETRIES = 8
+
+_MAGIC = b"CRSTATE\0"
+LAYOUT_VERSION = 1
+# magic, версия раскладки, емкость полезной нагрузки, последовательность, время публикации,
+# длина полезной нагрузки, длина имен классов
+_HEADER = struct.Struct('<8sIIQdII')
+_SEQ_OFFSET = 16
+_SEQ = struct.Struct('<Q')
+# Время публикации и длина полезной нагрузки сразу за последовательностью
+_META_OFFSET = 24
+_META = struct.Struct('<dI')
+
+def _align(n, to=8):
+    return (n + to - 1) // to * to
+
+def _attach(name):
+    """Подключается к существующему сегменту, не передавая его resource_tracker'у этого процесса."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # До Python 3.13: трекер удалил бы чужой сегмент при выходе читателя
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def _limit_units(snapshot, max_units):
+    """Снимок не больше чем с max_units юнитами: остаются ближайшие к нашей стороне (больший Y)."""
+    units = snapshot.unit_array
+    if len(units) <= max_units:
+        return snapshot
+    keep = np.sort(np.argsort(-units['box'][:, 3], kind='stable')[:max_units])
+    return GameSnapshot(units[keep], snapshot.tower_array, snapshot.card_array, snapshot.class_names,
+                        elixir=snapshot.elixir, game_start=snapshot.game_start, match_over=snapshot.match_over,
+                        frame_seq=snapshot.frame_seq, capture_time=snapshot.capture_time,
+                        inference_done_time=snapshot.inference_done_time, decision_time=snapshot.decision_time,
+                        action_time=snapshot.action_time, towers_frame_seq=snapshot.towers_frame_seq)
+
+class StatePublisher:
+    """
+    Писатель сегмента. publish() вызывается потоком зрения для каждого нового снимка.
+    Сегмент с тем же именем, оставшийся от упавшего процесса, пересоздается.
+    """
+
+    def __init__(self, class_names, name=STATE_SHM_NAME, max_units=MAX_PUBLISHED_UNITS):
+        names = class_names if isinstance(class_names, list) else [class_names[i] for i in sorted(class_names)]
+        self._names = json.dumps(names).encode("utf-8")
+        self.max_units = max_units
+        self.capacity = len(GameSnapshot.empty().to_bytes()) + max_units * UNIT_DTYPE.itemsize
+        self._payload_offset = _HEADER.size + _align(len(self._names))
+        size = self._payload_offset + self.capacity
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self._buf = self._shm.buf
+        self._sequence = 0
+        self.published = 0
+        _HEADER.pack_into(self._buf, 0, _MAGIC, LAYOUT_VERSION, self.capacity, 0, 0.0, 0, len(self._names))
+        self._buf[_HEADER.size:_HEADER.size + len(self._names)] = self._names
+
+    def publish(self, snapshot: GameSnapshot):
+        """Записывает снимок в сегмент. Не блокируется читателями."""
+        data = _limit_units(snapshot, self.max_units).to_bytes()
+        start = self._payload_offset
+        # Нечетная последовательность — идет запись. Длина и время пишутся, пока она нечетная,
+        # а четная последовательность — отдельной последней записью: читатель не сможет
+        # сочетать новую последовательность со старой длиной
+        self._sequence += 1
+        _SEQ.pack_into(self._buf, _SEQ_OFFSET, self._sequence)
+        self._buf[start:start + len(data)] = data
+        _META.pack_into(self._buf, _META_OFFSET, time.monotonic(), len(data))
+        self._sequence += 1
+        _SEQ.pack_into(self._buf, _SEQ_OFFSET, self._sequence)
+        self.published += 1
+
+    def close(self):
+        """Закрывает и удаляет сегмент; подключенные читатели дочитывают свою копию."""
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+class StateReader:
+    """
+    Читатель сегмента для другого локального процесса. Ничего не блокирует: read()
+    копирует последний опубликованный снимок, poll() возвращает его, только если он новый.
+    """
+
+    def __init__(self, name=STATE_SHM_NAME):
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+        magic, version, self.capacity, _, _, _, names_length = _HEADER.unpack_from(self._buf)
+        if magic != _MAGIC or version != LAYOUT_VERSION:
+            self._shm.close()
+            raise ValueError(f"Сегмент {name} не является состоянием CR_Neuro версии {LAYOUT_VERSION}")
+        self.class_names = json.loads(bytes(self._buf[_HEADER.size:_HEADER.size + names_length]).decode("utf-8"))
+        self._payload_offset = _HEADER.size + _align(names_length)
+        self.last_sequence = 0
+        # Время публикации последнего прочитанного снимка (time.monotonic() писателя)
+        self.published_at = 0.0
+        self.retries = 0
+
+    @property
+    def sequence(self):
+        """Текущая последовательность писателя (четная — запись завершена), 0 — еще ничего не опубликовано."""
+        return _SEQ.unpack_from(self._buf, _SEQ_OFFSET)[0]
+
+    def _read_consistent(self):
+        """(последовательность, время публикации, байты снимка) или None, если писатель все время занят."""
+        start = self._payload_offset
+        for _ in range(READ_RETRIES):
+            # Порядок: последовательность, затем длина и время, затем данные, затем повторная проверка
+            sequence = _SEQ.unpack_from(self._buf, _SEQ_OFFSET)[0]
+            if sequence % 2:
+                self.retries += 1
+                time.sleep(0)
+                continue
+            published_at, length = _META.unpack_from(self._buf, _META_OFFSET)
+            if length > self.capacity:
+                self.retries += 1
+                continue
+            data = bytes(self._buf[start:start + length])
+            if _SEQ.unpack_from(self._buf, _SEQ_OFFSET)[0] == sequence:
+                return sequence, published_at, data
+            self.retries += 1
+        return None
+
+    def read(self):
+        """Последний опубликованный GameSnapshot или None (ничего не опубликовано или писатель занят)."""
+        result = self._read_consistent()
+        if result is None or result[0] == 0:
+            return None
+        self.last_sequence, self.published_at, data = result
+        return GameSnapshot.from_bytes(data, self.class_names)
+
+    def poll(self):
+        """Снимок, если после прошлого чтения опубликован новый, иначе None."""
+        if self.sequence == self.last_sequence:
+            return None
+        return self.read()
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Читатель опубликованного состояния CR_Neuro (main.py --publish-state).")
+    parser.add_argument("--name", default=STATE_SHM_NAME, help="Имя сегмента общей памяти.")
+    parser.add_argument("--interval", type=float, default=0.5, help="Период опроса (сек).")
+    args = parser.parse_args()
+
+    reader = StateReader(args.name)
+    print(f"[StateReader] Подключено к {args.name}, классов: {len(reader.class_names)}")
+    try:
+        while True:
+            snapshot = reader.poll()
+            if snapshot is not None:
+                age = time.monotonic() - snapshot.capture_time if snapshot.capture_time else 0.0
+                print(f"[StateReader] кадр {snapshot.frame_seq}, возраст {age * 1000:.0f} мс\n{snapshot}")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+# Modules of the bot live in the repository root and are imported by their flat names.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
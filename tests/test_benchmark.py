@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("pytesseract")
+
+import benchmark
+import game_vision
+from elixir_estimator import OCR_CORRECTION_INTERVAL
+
+FRAMES = [np.zeros((8, 8, 3), dtype=np.uint8) for _ in range(6)]
+
+@pytest.fixture
+def perceive_calls(monkeypatch):
+    """Заглушка восприятия без модели: этап YOLO и параметры каждого вызова."""
+    calls = []
+
+    def perceive(frame, last_game_state=None, analyze_slow_components=True, keyframe=True, **kwargs):
+        with game_vision._timed_stage(game_vision.STAGE_YOLO):
+            calls.append({"keyframe": keyframe, "slow": analyze_slow_components,
+                          "ocr_interval": game_vision.elixir_estimator.ocr_interval,
+                          "deterministic": game_vision.slow_scheduler.deterministic,
+                          "ocr_cache_size": game_vision.ocr_cache.stats()["size"]})
+        return last_game_state, None
+
+    monkeypatch.setattr(game_vision, "perceive_game_state", perceive)
+    return calls
+
+def test_report_has_percentiles_per_stage_without_warmup(perceive_calls):
+    report = benchmark.run_benchmark(FRAMES, analyze_slow_components=False, warmup=2, keyframe_interval=3)
+    assert len(perceive_calls) == 2 + len(FRAMES)
+    assert [c["keyframe"] for c in perceive_calls[2:]] == [True, False, False, True, False, False]
+    assert report["frames"] == len(FRAMES) and report["fps"] > 0
+    for stage in (benchmark.STAGE_TOTAL, game_vision.STAGE_YOLO):
+        summary = report["stages"][stage]
+        assert summary["count"] == len(FRAMES)
+        assert summary["p50"] <= summary["p95"] <= summary["p99"]
+    assert "ocr_cache" not in report
+
+def test_each_run_starts_from_reset_perception(perceive_calls, monkeypatch):
+    game_vision.ocr_cache.put(b"stale", 7)
+    resets = []
+    reset_perception = game_vision.reset_perception
+    monkeypatch.setattr(game_vision, "reset_perception", lambda: resets.append(1) or reset_perception())
+
+    benchmark.run_benchmark(FRAMES, analyze_slow_components=False, warmup=0)
+    assert resets == [1]
+    assert perceive_calls[0]["ocr_cache_size"] == 0
+
+def test_slow_run_reads_elixir_every_frame_and_restores_interval(perceive_calls):
+    report = benchmark.run_benchmark(FRAMES, analyze_slow_components=True, warmup=0)
+    assert all(c["ocr_interval"] == 0.0 and c["slow"] is True for c in perceive_calls)
+    assert game_vision.elixir_estimator.ocr_interval == OCR_CORRECTION_INTERVAL
+    assert "ocr_cache" in report
+
+def test_scheduler_uses_fixed_costs_during_run(perceive_calls):
+    benchmark.run_benchmark(FRAMES, analyze_slow_components=game_vision.SLOW_AUTO, warmup=1)
+    assert all(c["deterministic"] for c in perceive_calls)
+    assert not game_vision.slow_scheduler.deterministic
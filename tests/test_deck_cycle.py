@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import numpy as np
+
+from hand_recognizer import (CardTemplates, DeckCycle, HandRecognizer, EMBED_SIZE, LEARN_AGREE_FRAMES, LEARN_MIN_CONF,
+                             MAX_TEMPLATES_PER_CARD)
+
+HAND = ['Pekka', 'Giant', 'Arrows', 'Knight']
+
+def test_played_card_goes_to_back_of_queue():
+    cycle = DeckCycle()
+    cycle.observe(HAND, 'Fireball')
+    assert cycle.played(1) == 'Giant'
+    assert cycle.hand == ['Pekka', 'Fireball', 'Arrows', 'Knight']
+    assert cycle.queue == [None, None, None, 'Giant']
+    assert cycle.predicted_next() is None
+
+def test_unrecognized_slots_keep_known_cards():
+    cycle = DeckCycle()
+    cycle.observe(HAND, None)
+    cycle.observe([None, 'Giant', None, None], None)
+    assert cycle.hand == HAND
+
+def test_full_cycle_predicts_hand():
+    cycle = DeckCycle()
+    waiting = ['Fireball', 'Zap', 'Musketeer', 'Hog']
+    for slot, next_card in enumerate(waiting):
+        cycle.observe(cycle.hand if slot else HAND, next_card)
+        cycle.played(slot)
+    # Все 8 карт увидены: очередь — сыгранные карты руки по порядку
+    assert cycle.known
+    assert cycle.hand == waiting
+    assert cycle.queue == HAND
+    assert cycle.predicted_next() == 'Pekka'
+    cycle.played(2)
+    assert cycle.hand == ['Fireball', 'Zap', 'Pekka', 'Hog']
+    assert cycle.predicted_next() == 'Giant'
+
+def test_reset_forgets_cards():
+    cycle = DeckCycle()
+    cycle.observe(HAND, 'Zap')
+    cycle.reset()
+    assert cycle.hand == [None] * 4 and not cycle.known
+
+def _unit(rng):
+    vector = rng.standard_normal(EMBED_SIZE[0] * EMBED_SIZE[1] * 3).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_template_of_other_card_is_overwritten():
+    rng = np.random.default_rng(0)
+    vector = _unit(rng)
+    templates = CardTemplates()
+    assert templates.add(vector, 'Pekka')
+    # Тот же кроп уверенно размечен другой картой — старый шаблон ошибочен
+    assert templates.add(vector, 'Giant')
+    assert templates.labels == ['Giant'] and templates.overwritten == 1
+
+def test_least_used_template_is_evicted():
+    rng = np.random.default_rng(1)
+    vectors = [_unit(rng) for _ in range(MAX_TEMPLATES_PER_CARD + 1)]
+    templates = CardTemplates()
+    for vector in vectors[:MAX_TEMPLATES_PER_CARD]:
+        templates.add(vector, 'Pekka')
+    # Все шаблоны, кроме второго, хотя бы раз совпали
+    templates.match(np.stack([v for i, v in enumerate(vectors[:MAX_TEMPLATES_PER_CARD]) if i != 1]))
+    assert templates.add(vectors[-1], 'Pekka')
+    assert len(templates) == MAX_TEMPLATES_PER_CARD and templates.evicted == 1
+    assert not np.any(np.all(templates.vectors == vectors[1], axis=1))
+
+def test_learn_needs_confident_agreeing_keyframes():
+    frame = np.random.default_rng(2).integers(0, 256, (1355, 766, 3), dtype=np.uint8)
+    templates = CardTemplates()
+    recognizer = HandRecognizer(templates)
+    box = [[0, 0, 10, 10]]
+    for _ in range(LEARN_AGREE_FRAMES):
+        recognizer.learn(frame, ['PekkaNext'], box, [True], [LEARN_MIN_CONF - 0.1])
+    assert len(templates) == 0
+    for _ in range(LEARN_AGREE_FRAMES - 1):
+        recognizer.learn(frame, ['PekkaNext'], box, [True], [0.95])
+    assert len(templates) == 0
+    # Другая карта в слоте сбрасывает счетчик согласия
+    recognizer.learn(frame, ['GiantNext'], box, [True], [0.95])
+    recognizer.learn(frame, ['PekkaNext'], box, [True], [0.95])
+    assert len(templates) == 0
+    for _ in range(LEARN_AGREE_FRAMES - 1):
+        recognizer.learn(frame, ['PekkaNext'], box, [True], [0.95])
+    assert templates.labels == ['Pekka']
@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from elixir_estimator import (BAR_MAX_GREEN, BAR_MIN_BLUE, BAR_MIN_RED, DOUBLE_ELIXIR_AFTER,
+                              ELIXIR_REGEN_SECONDS, ElixirEstimator, measure_bar)
+
+ROI = (0, 0, 100, 4)
+
+def _bar_frame(fill, holes=()):
+    """Кадр с полосой, заполненной слева на долю fill; holes — столбцы, закрытые чем-то другим."""
+    frame = np.zeros((4, 100, 3), dtype=np.uint8)
+    frame[:, :int(fill * 100)] = (BAR_MIN_BLUE, BAR_MAX_GREEN, BAR_MIN_RED)
+    for column in holes:
+        frame[:, column] = 0
+    return frame
+
+def test_measure_bar_confidence_drops_for_non_prefix_fill():
+    fill, confidence = measure_bar(_bar_frame(0.5), ROI)
+    assert fill == 0.5 and confidence == 1.0
+    _, confidence = measure_bar(_bar_frame(0.8, holes=range(10, 40)), ROI)
+    assert confidence < 0.9
+    assert measure_bar(None, ROI) == (None, 0.0)
+
+def test_regeneration_model_dominates_single_bar_reading():
+    estimator = ElixirEstimator(bar_roi=ROI)
+    estimator.reset(5, now=0.0)
+    value = estimator.update(_bar_frame(1.0), now=0.0)
+    # Один кадр полосы "10" сдвигает оценку лишь немного
+    assert 5.0 < value < 6.0
+
+def test_low_confidence_reading_is_ignored():
+    estimator = ElixirEstimator(bar_roi=ROI)
+    estimator.reset(5, now=0.0)
+    assert estimator.update(_bar_frame(1.0, holes=range(20, 60)), now=0.0) == 5.0
+
+def test_estimate_is_dropped_outside_match():
+    estimator = ElixirEstimator(bar_roi=ROI)
+    estimator.reset(5, now=0.0)
+    assert estimator.update(_bar_frame(0.5), now=1.0, in_match=False) is None
+    estimator.correct_with_ocr(8, now=1.5)
+    assert estimator.estimate(now=10.0) is None
+    estimator.reset(7, now=20.0)
+    assert estimator.estimate(now=20.0) == 7
+
+def test_double_elixir_regenerates_twice_as_fast():
+    estimator = ElixirEstimator(bar_roi=ROI)
+    estimator.reset(0, now=0.0)
+    assert estimator.estimate(now=2 * ELIXIR_REGEN_SECONDS + 0.01) == 2
+    # К двойному эликсиру полоса давно полна: тратим все и считаем восстановление заново
+    estimator.on_card_played(cost=10, now=DOUBLE_ELIXIR_AFTER)
+    assert estimator.estimate(now=DOUBLE_ELIXIR_AFTER + 2 * ELIXIR_REGEN_SECONDS + 0.01) == 4
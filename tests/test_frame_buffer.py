@@ -0,0 +1,68 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from frame_buffer import FrameRing
+
+SHAPE = (4, 4, 3)
+
+def _frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+def test_reader_gets_latest_frame_and_counts_dropped():
+    ring = FrameRing(SHAPE)
+    reader = ring.reader()
+    assert ring.write(_frame(1)) == 1
+    seq, frame = reader.read(timeout=0)
+    assert seq == 1 and frame[0, 0, 0] == 1
+    reader.release()
+
+    for value in (2, 3, 4):
+        ring.write(_frame(value))
+    seq, frame = reader.read(timeout=0)
+    assert seq == 4 and frame[0, 0, 0] == 4
+    assert reader.frames_read == 2
+    assert reader.dropped == 2
+
+def test_read_without_new_frame_times_out():
+    ring = FrameRing(SHAPE)
+    reader = ring.reader()
+    ring.write(_frame(1))
+    reader.read(timeout=0)
+    assert reader.read(timeout=0.01) == (None, None)
+
+def test_frame_is_read_only_view():
+    ring = FrameRing(SHAPE)
+    reader = ring.reader()
+    ring.write(_frame(7))
+    _, frame = reader.read(timeout=0)
+    with pytest.raises(ValueError):
+        frame[0, 0, 0] = 0
+
+def test_pinned_slot_is_not_overwritten():
+    ring = FrameRing(SHAPE, slots=3)
+    reader = ring.reader()
+    ring.write(_frame(1))
+    _, pinned = reader.read(timeout=0)
+    # Писатель продолжает в свободные слоты, кадр читателя остается прежним
+    for value in range(2, 10):
+        ring.write(_frame(value))
+    assert (pinned == 1).all()
+    seq, latest = reader.read(timeout=0)
+    assert seq == 9 and latest[0, 0, 0] == 9
+
+def test_no_free_slot_raises():
+    ring = FrameRing(SHAPE, slots=2)
+    reader = ring.reader()
+    ring.write(_frame(1))
+    reader.read(timeout=0)
+    ring.write(_frame(2))
+    # Один слот читается, другой — последний опубликованный: свободных нет
+    with pytest.raises(RuntimeError):
+        ring.acquire_write()
+    reader.release()
+    ring.write(_frame(3))
+
+def test_publish_without_acquire_raises():
+    with pytest.raises(RuntimeError):
+        FrameRing(SHAPE).publish()
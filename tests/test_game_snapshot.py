@@ -0,0 +1,51 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from game_state import Card, GameSnapshot, GameState, Tower, Unit, UNIT_DTYPE
+
+CLASS_NAMES = ['MyPekka', 'EnemyKnight', 'MyKingTower', 'EnemyPrincessTower', 'PekkaDeck', 'ZapNext']
+CLASS_IDS = {name: i for i, name in enumerate(CLASS_NAMES)}
+
+def _snapshot(elixir=6):
+    state = GameState(
+        elixir=elixir,
+        my_towers=[Tower('MyKingTower', 4008, (300, 1000, 460, 1150))],
+        enemy_towers=[Tower('EnemyPrincessTower', 1512, (100, 150, 200, 260))],
+        my_units=[Unit('MyPekka', (320, 700, 380, 780), track_id=3, velocity=(0.0, -40.0))],
+        enemy_units=[Unit('EnemyKnight', (330, 500, 370, 560), track_id=5)],
+        cards=[Card('PekkaDeck', (180, 1180, 290, 1310)), Card('ZapNext', (40, 1250, 100, 1325), is_next=True)],
+        game_start=True, frame_seq=42, capture_time=10.5, inference_done_time=10.55,
+    )
+    return GameSnapshot.from_game_state(state, CLASS_IDS, CLASS_NAMES)
+
+def test_bytes_round_trip():
+    snapshot = _snapshot()
+    restored = GameSnapshot.from_bytes(snapshot.to_bytes(), CLASS_NAMES)
+    assert restored.unit_array.tobytes() == snapshot.unit_array.tobytes()
+    assert restored.tower_array.tobytes() == snapshot.tower_array.tobytes()
+    assert restored.card_array.tobytes() == snapshot.card_array.tobytes()
+    for name in ('elixir', 'game_start', 'match_over', 'frame_seq', 'towers_frame_seq', 'capture_time',
+                 'inference_done_time', 'decision_time', 'action_time'):
+        assert getattr(restored, name) == getattr(snapshot, name), name
+    assert restored.to_compact() == snapshot.to_compact()
+    assert [u.class_name for u in restored.my_units] == ['MyPekka']
+    assert restored.my_units[0].track_id == 3
+
+def test_unknown_elixir_and_no_units_round_trip():
+    snapshot = GameSnapshot.empty(CLASS_NAMES)
+    restored = GameSnapshot.from_bytes(snapshot.to_bytes(), CLASS_NAMES)
+    assert restored.elixir is None
+    assert len(restored.unit_array) == 0 and restored.unit_array.dtype == UNIT_DTYPE
+    assert restored.my_towers == [] and restored.cards == []
+
+def test_arrays_of_restored_snapshot_are_read_only():
+    restored = GameSnapshot.from_bytes(_snapshot().to_bytes(), CLASS_NAMES)
+    with pytest.raises(ValueError):
+        restored.unit_array['box'][0, 0] = 0
+
+def test_unsupported_version_is_rejected():
+    data = bytearray(_snapshot().to_bytes())
+    data[0:2] = (999).to_bytes(2, 'little')
+    with pytest.raises(ValueError):
+        GameSnapshot.from_bytes(bytes(data), CLASS_NAMES)
@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ocr_cache import OcrCache
+
+def _crop(seed):
+    return (np.random.default_rng(seed).random((12, 30)) > 0.5).astype(np.uint8) * 255
+
+def test_hit_and_miss_counters():
+    cache = OcrCache(capacity=4)
+    key = OcrCache.key(_crop(0))
+    assert cache.get(key) == (False, None)
+    cache.put(key, 7)
+    assert cache.get(key) == (True, 7)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+def test_failed_read_is_not_cached():
+    cache = OcrCache()
+    key = OcrCache.key(_crop(0))
+    cache.put(key, None)
+    assert cache.get(key) == (False, None)
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = OcrCache(capacity=2)
+    a, b, c = (OcrCache.key(_crop(seed)) for seed in range(3))
+    cache.put(a, 1)
+    cache.put(b, 2)
+    cache.get(a)
+    cache.put(c, 3)
+    assert cache.get(b) == (False, None)
+    assert cache.get(a) == (True, 1)
+    assert cache.get(c) == (True, 3)
+    assert cache.stats()["evictions"] == 1
+
+def test_key_depends_on_binary_content_and_config():
+    crop = _crop(0)
+    # Одинаковый порог — одинаковый ключ, даже если значения пикселей разные
+    assert OcrCache.key(crop) == OcrCache.key((crop > 0).astype(np.uint8))
+    assert OcrCache.key(crop, '--psm 7') != OcrCache.key(crop, '--psm 8')
+    assert OcrCache.key(crop) != OcrCache.key(_crop(1))
+
+def test_zero_capacity_stores_nothing():
+    cache = OcrCache(capacity=0)
+    key = OcrCache.key(_crop(0))
+    cache.put(key, 5)
+    assert cache.get(key) == (False, None)
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from perception_scheduler import (SlowComponentScheduler, COMPONENT_ELIXIR_OCR, COMPONENT_TOWER_HEALTH,
+                                  FIXED_COMPONENT_COSTS)
+
+BOTH = frozenset((COMPONENT_TOWER_HEALTH, COMPONENT_ELIXIR_OCR))
+
+def _measured(scheduler, cost):
+    # Замеры медленной машины: обе оценки стоимости больше бюджета кадра
+    for name in BOTH:
+        scheduler._cost[name] = cost
+
+def test_measured_costs_defer_components():
+    scheduler = SlowComponentScheduler(frame_budget=0.030)
+    _measured(scheduler, 0.025)
+    assert len(scheduler.plan(now=0.0)) == 1
+    assert sum(scheduler.stats()[name]["deferred"] for name in BOTH) == 1
+
+def test_deterministic_plan_ignores_measured_costs():
+    budget = sum(FIXED_COMPONENT_COSTS.values())
+    plans = []
+    for cost in (0.001, 0.025):
+        scheduler = SlowComponentScheduler(frame_budget=budget, deterministic=True)
+        _measured(scheduler, cost)
+        plans.append(scheduler.plan(now=0.0))
+    assert plans == [BOTH, BOTH]
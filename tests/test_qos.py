@@ -0,0 +1,55 @@
+import pytest
+
+from qos import QosController, QosLevel, QOS_SETTLE_FRAMES
+
+LEVELS = (QosLevel(900, 1, 5, 1.0), QosLevel(640, 2, 10, 0.5), QosLevel(512, 3, 20, 0.25))
+TARGET = 0.060
+STEP = 0.1
+
+def _run(qos, latency, start, seconds):
+    """Подает задержку каждые STEP секунд; возвращает (время, уровень) первой смены уровня или None."""
+    now = start
+    while now < start + seconds:
+        settings = qos.observe(latency, now=now)
+        if settings is not None:
+            return now, qos.level
+        now += STEP
+    return None
+
+def test_degrades_when_over_target():
+    qos = QosController(target=TARGET, levels=LEVELS)
+    changed_at, level = _run(qos, 0.2, 0.0, 10.0)
+    assert level == 1
+    # Решение не раньше окна установления и выдержки понижения
+    assert changed_at >= (QOS_SETTLE_FRAMES - 1) * STEP + 1.0
+    assert qos.settings == LEVELS[1]
+
+def test_stays_on_level_between_thresholds():
+    qos = QosController(target=TARGET, levels=LEVELS, start_level=1)
+    assert _run(qos, TARGET * 0.8, 0.0, 30.0) is None
+
+def test_does_not_step_past_ladder_ends():
+    qos = QosController(target=TARGET, levels=LEVELS, start_level=2)
+    assert _run(qos, 1.0, 0.0, 10.0) is None
+    qos = QosController(target=TARGET, levels=LEVELS, start_level=0)
+    assert _run(qos, 0.001, 0.0, 30.0) is None
+
+def test_upgrade_waits_longer_after_failed_upgrade():
+    qos = QosController(target=TARGET, levels=LEVELS, start_level=1)
+    settle = (QOS_SETTLE_FRAMES - 1) * STEP
+    upgraded_at, level = _run(qos, 0.001, 0.0, 30.0)
+    assert level == 0
+    first_hold = upgraded_at - settle
+
+    # Повышение сразу не выдержало нагрузки: выдержка повышения на уровень 0 удваивается
+    degraded_at, level = _run(qos, 0.2, upgraded_at + STEP, 10.0)
+    assert level == 1
+    upgraded_again_at, level = _run(qos, 0.001, degraded_at + STEP, 60.0)
+    assert level == 0
+    second_hold = upgraded_again_at - (degraded_at + STEP) - settle
+    assert second_hold == pytest.approx(2 * first_hold, rel=0.05)
+
+def test_stats_report_current_settings():
+    qos = QosController(target=TARGET, levels=LEVELS, start_level=1)
+    stats = qos.stats()
+    assert stats["level"] == 1 and stats["imgsz"] == 640 and stats["latency_ms"] is None
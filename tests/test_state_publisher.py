@@ -0,0 +1,65 @@
+import os
+import sys
+import uuid
+from multiprocessing import resource_tracker
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from game_state import GameSnapshot, UNIT_DTYPE
+from state_publisher import READ_RETRIES, StatePublisher, StateReader, _SEQ, _SEQ_OFFSET
+
+CLASS_NAMES = ['MyPekka', 'EnemyKnight']
+
+def _snapshot(frame_seq, unit_bottoms=()):
+    units = np.zeros(len(unit_bottoms), dtype=UNIT_DTYPE)
+    units['box'][:, 3] = unit_bottoms
+    snapshot = GameSnapshot.empty(CLASS_NAMES)
+    return GameSnapshot(units, snapshot.tower_array, snapshot.card_array, CLASS_NAMES, elixir=frame_seq % 11,
+                        game_start=True, frame_seq=frame_seq, capture_time=float(frame_seq))
+
+@pytest.fixture
+def segment():
+    publisher = StatePublisher(CLASS_NAMES, name=f"cr_neuro_test_{os.getpid()}_{uuid.uuid4().hex[:8]}", max_units=2)
+    reader = StateReader(publisher.name)
+    if sys.version_info < (3, 13) and os.name == 'posix':
+        # Читатель рассчитан на другой процесс и снимает сегмент с учета resource_tracker'а;
+        # здесь это учет писателя, который удалит сегмент в close()
+        resource_tracker.register(reader._shm._name, 'shared_memory')
+    yield publisher, reader
+    reader.close()
+    publisher.close()
+
+def test_nothing_published_yet(segment):
+    _, reader = segment
+    assert reader.class_names == CLASS_NAMES
+    assert reader.read() is None
+
+def test_round_trip_and_poll(segment):
+    publisher, reader = segment
+    publisher.publish(_snapshot(1, [100]))
+    snapshot = reader.poll()
+    assert snapshot.frame_seq == 1 and snapshot.elixir == 1
+    assert snapshot.to_bytes() == _snapshot(1, [100]).to_bytes()
+    assert reader.poll() is None
+
+    publisher.publish(_snapshot(2))
+    publisher.publish(_snapshot(3))
+    assert reader.poll().frame_seq == 3
+    assert reader.last_sequence == reader.sequence == 6
+
+def test_units_beyond_capacity_keep_nearest(segment):
+    publisher, reader = segment
+    publisher.publish(_snapshot(1, [300, 900, 600]))
+    assert reader.read().unit_array['box'][:, 3].tolist() == [900, 600]
+
+def test_reader_gives_up_while_write_in_progress(segment):
+    publisher, reader = segment
+    publisher.publish(_snapshot(1))
+    # Нечетная последовательность — писатель посреди записи
+    _SEQ.pack_into(publisher._buf, _SEQ_OFFSET, 3)
+    assert reader.read() is None
+    assert reader.retries == READ_RETRIES
+    _SEQ.pack_into(publisher._buf, _SEQ_OFFSET, 4)
+    assert reader.read().frame_seq == 1
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from tower_layout import LOCK_STABLE_KEYFRAMES, TowerLayout
+
+HP_TO_TOWERS = {
+    'TowerPrincessHP': ('PrincessTower', ('PrincessTower',)),
+    'KingTowerHP': ('KingTower', ('KingTower',)),
+}
+PRINCESS = (['PrincessTower'], [(100, 200, 200, 320)], ['TowerPrincessHP'], [(110, 160, 190, 190)])
+KING = ('KingTower', (300, 100, 460, 260), 'KingTowerHP', (320, 60, 440, 95))
+
+def _with_king(names, boxes, hp_names, hp_boxes):
+    return names + [KING[0]], boxes + [KING[1]], hp_names + [KING[2]], hp_boxes + [KING[3]]
+
+def _lock(layout):
+    for _ in range(LOCK_STABLE_KEYFRAMES):
+        layout.observe(*PRINCESS)
+    assert layout.locked and len(layout.slots) == 1
+
+def test_locks_after_stable_keyframes():
+    layout = TowerLayout(HP_TO_TOWERS)
+    for _ in range(LOCK_STABLE_KEYFRAMES - 1):
+        layout.observe(*PRINCESS)
+    assert not layout.locked
+    _lock(layout)
+
+def test_tower_appearing_after_lock_is_merged_once_stable():
+    layout = TowerLayout(HP_TO_TOWERS)
+    _lock(layout)
+    for _ in range(LOCK_STABLE_KEYFRAMES - 1):
+        layout.observe(*_with_king(*PRINCESS))
+    assert len(layout.slots) == 1
+    layout.observe(*_with_king(*PRINCESS))
+    assert [s.class_name for s in layout.slots] == ['PrincessTower', 'KingTower']
+    # Уже известные башни повторно не добавляются
+    for _ in range(LOCK_STABLE_KEYFRAMES):
+        layout.observe(*_with_king(*PRINCESS))
+    assert len(layout.slots) == 2
+
+def test_flickering_new_tower_is_not_merged():
+    layout = TowerLayout(HP_TO_TOWERS)
+    _lock(layout)
+    for _ in range(LOCK_STABLE_KEYFRAMES):
+        layout.observe(*_with_king(*PRINCESS))
+        layout.observe(*PRINCESS)
+    assert len(layout.slots) == 1
+
+def test_reset_forgets_layout():
+    layout = TowerLayout(HP_TO_TOWERS)
+    _lock(layout)
+    layout.reset()
+    assert not layout.locked and layout.slots == []
@@ -0,0 +1,175 @@
+# Per-match cache of tower positions and HP crop rectangles.
+# Towers do not move during a match, so HP boxes are matched to towers once after
+# GameStart and the resulting crop rectangles are reused for every HP read. OCR then
+# runs on fixed ROIs and no longer depends on YOLO finding the HP boxes on that frame.
+# The layout is dropped on MatchOver, on a new GameStart and when a tower is destroyed,
+# and is locked again from the next keyframes. A tower whose HP box shows up only after
+# locking, such as the king tower once it activates, is merged into the locked layout
+# after it has been seen on LOCK_STABLE_KEYFRAMES keyframes in a row.
+
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+# --- Настройки ---
+# Обрезка рамки HP до цифр: (слева, сверху, справа, снизу) в пикселях
+HP_CROP_OFFSETS = {
+    'MyKingHP': (35, 12, 32, 0),
+    'KingTowerHP': (35, 0, 32, 10),
+    'MyPrincessTowerHP': (30, 12, 28, 0),
+    'TowerPrincessHP': (20, 0, 20, 10),
+}
+# Максимальное расстояние (px) между центрами рамки HP и ее башни
+MAX_HP_TOWER_DIST = 250
+# Раскладка фиксируется, когда набор пар "башня — HP" не меняется столько ключевых кадров подряд
+LOCK_STABLE_KEYFRAMES = 3
+# Столько неудачных чтений HP подряд — башня считается разрушенной
+MAX_MISSED_READS = 10
+
+@dataclass
+class TowerSlot:
+    class_name: str                        # класс башни в GameState (например, 'PrincessTower')
+    box: Tuple[int, int, int, int]
+    hp_class: str
+    hp_roi: Tuple[int, int, int, int]      # (x1, y1, x2, y2) области цифр HP
+    missed_reads: int = 0
+
+def hp_crop_roi(hp_class, hp_box):
+    """Прямоугольник цифр внутри рамки HP или None, если после обрезки он пуст."""
+    left, top, right, bottom = HP_CROP_OFFSETS[hp_class]
+    x1, y1, x2, y2 = hp_box
+    roi = (x1 + left, y1 + top, x2 - right, y2 - bottom)
+    return roi if roi[0] < roi[2] and roi[1] < roi[3] else None
+
+def match_hp_to_towers(tower_names, tower_boxes, hp_names, hp_boxes, hp_to_towers, max_dist=MAX_HP_TOWER_DIST):
+    """
+    Сопоставляет рамки HP ближайшим допустимым башням (матрица расстояний на NumPy).
+    hp_to_towers: класс HP -> (класс башни в GameState, кортеж допустимых классов детекций башен).
+    Каждая башня достается не более чем одной рамке HP — самой близкой.
+    Возвращает список TowerSlot.
+    """
+    if len(tower_names) == 0 or len(hp_names) == 0:
+        return []
+    tower_boxes = np.asarray(tower_boxes, dtype=np.float32).reshape(-1, 4)
+    hp_boxes = np.asarray(hp_boxes, dtype=np.float32).reshape(-1, 4)
+    tower_centers = (tower_boxes[:, :2] + tower_boxes[:, 2:]) / 2
+    hp_centers = (hp_boxes[:, :2] + hp_boxes[:, 2:]) / 2
+
+    dist = np.linalg.norm(hp_centers[:, None, :] - tower_centers[None, :, :], axis=2)
+    allowed = np.array([[tower in hp_to_towers.get(hp, (None, ()))[1] for tower in tower_names] for hp in hp_names],
+                       dtype=bool).reshape(dist.shape)
+    dist[~allowed] = np.inf
+
+    slots = []
+    used_hp, used_towers = set(), set()
+    # Жадно от самых близких пар
+    for flat in np.argsort(dist, axis=None):
+        hp_index, tower_index = divmod(int(flat), dist.shape[1])
+        if dist[hp_index, tower_index] >= max_dist:
+            break
+        if hp_index in used_hp or tower_index in used_towers:
+            continue
+        hp_class = hp_names[hp_index]
+        roi = hp_crop_roi(hp_class, hp_boxes[hp_index].astype(int).tolist())
+        if roi is None:
+            continue
+        used_hp.add(hp_index)
+        used_towers.add(tower_index)
+        slots.append(TowerSlot(class_name=hp_to_towers[hp_class][0],
+                               box=tuple(tower_boxes[tower_index].astype(int).tolist()),
+                               hp_class=hp_class, hp_roi=roi))
+    return slots
+
+class TowerLayout:
+    """Раскладка башен текущего матча. Потокобезопасна."""
+
+    def __init__(self, hp_to_towers):
+        self.hp_to_towers = hp_to_towers
+        self.lock = threading.Lock()
+        self.slots = []
+        self.locked = False
+        self._candidate_key = None
+        self._stable_count = 0
+        # Пары, найденные после фиксации: ключ пары -> ключевых кадров подряд
+        self._new_counts = {}
+
+    def reset(self, reason=None):
+        """Сбрасывает раскладку; она будет зафиксирована заново по следующим ключевым кадрам."""
+        with self.lock:
+            if self.locked and reason:
+                print(f"[TowerLayout] Раскладка сброшена: {reason}")
+            self.slots = []
+            self.locked = False
+            self._candidate_key = None
+            self._stable_count = 0
+            self._new_counts = {}
+
+    @staticmethod
+    def _key(slot):
+        # Пара сравнивается с точностью до 20 px, чтобы дрожание рамок не мешало фиксации
+        return slot.hp_class, slot.box[0] // 20, slot.box[1] // 20
+
+    def observe(self, tower_names, tower_boxes, hp_names, hp_boxes):
+        """
+        Ключевой кадр: сопоставляет HP и башни. До фиксации возвращает свежие пары (их
+        можно сразу читать) и фиксирует раскладку, если она стабильна. После фиксации
+        дополняет раскладку башнями, которых в ней нет, и возвращает ее.
+        """
+        slots = match_hp_to_towers(tower_names, tower_boxes, hp_names, hp_boxes, self.hp_to_towers)
+        key = tuple(sorted(self._key(s) for s in slots))
+        with self.lock:
+            if self.locked:
+                self._merge_new(slots)
+                return self.slots
+            if slots and key == self._candidate_key:
+                self._stable_count += 1
+            else:
+                self._candidate_key, self._stable_count = key, 1
+            if self._stable_count >= LOCK_STABLE_KEYFRAMES:
+                self.slots, self.locked = slots, True
+                print(f"[TowerLayout] Раскладка зафиксирована: {len(slots)} башен")
+        return slots
+
+    def _merge_new(self, slots):
+        """Добавляет в зафиксированную раскладку пары с новыми башнями, стабильные LOCK_STABLE_KEYFRAMES кадров (под lock)."""
+        known = np.array([s.box for s in self.slots], dtype=np.float32).reshape(-1, 4)
+        counts = {}
+        for slot in slots:
+            cx, cy = (slot.box[0] + slot.box[2]) / 2, (slot.box[1] + slot.box[3]) / 2
+            if ((cx >= known[:, 0]) & (cx <= known[:, 2]) & (cy >= known[:, 1]) & (cy <= known[:, 3])).any():
+                continue
+            key = self._key(slot)
+            counts[key] = self._new_counts.get(key, 0) + 1
+            if counts[key] >= LOCK_STABLE_KEYFRAMES:
+                self.slots = self.slots + [slot]
+                known = np.vstack((known, np.array(slot.box, dtype=np.float32)[None, :]))
+                del counts[key]
+                print(f"[TowerLayout] В раскладку добавлена башня {slot.class_name} ({slot.hp_class})")
+        # Пары, пропавшие на этом кадре, начинают отсчет заново
+        self._new_counts = counts
+
+    def check_destroyed(self, broken_boxes):
+        """Сбрасывает раскладку, если рамка разрушенной башни попала на одну из зафиксированных."""
+        if not self.locked or len(broken_boxes) == 0:
+            return False
+        broken = np.asarray(broken_boxes, dtype=np.float32).reshape(-1, 4)
+        centers = (broken[:, :2] + broken[:, 2:]) / 2
+        with self.lock:
+            boxes = np.array([s.box for s in self.slots], dtype=np.float32).reshape(-1, 4)
+        inside = ((centers[:, None, 0] >= boxes[None, :, 0]) & (centers[:, None, 0] <= boxes[None, :, 2]) &
+                  (centers[:, None, 1] >= boxes[None, :, 1]) & (centers[:, None, 1] <= boxes[None, :, 3]))
+        if inside.any():
+            self.reset("башня разрушена")
+            return True
+        return False
+
+    def record_read(self, slot: TowerSlot, value: Optional[int]):
+        """Учитывает результат чтения HP зафиксированной башни; долгие неудачи означают разрушение."""
+        if value is not None:
+            slot.missed_reads = 0
+            return
+        slot.missed_reads += 1
+        if self.locked and slot.missed_reads >= MAX_MISSED_READS and any(s is slot for s in self.slots):
+            self.reset(f"HP {slot.class_name} не читается {slot.missed_reads} раз подряд")
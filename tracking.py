@@ -0,0 +1,144 @@
+# Unit tracking and per-unit motion state.
+# YOLO runs as plain predict over all classes; only the unit detections of a keyframe
+# are associated with tracks here (greedy IoU against each live track's predicted box,
+# same class only). Cards, towers and status banners never pass through a tracker, so
+# nothing is held back waiting for a track to activate. The tracker belongs to a
+# PerceptionContext, so windows and benchmark runs do not share track state.
+# On keyframes each track's velocity is estimated; between keyframes unit boxes are
+# extrapolated with a constant-velocity model, so GameState can be refreshed without YOLO.
+
+import threading
+
+import numpy as np
+
+# --- Настройки ---
+# Сглаживание скорости (доля нового измерения)
+VELOCITY_SMOOTHING = 0.5
+# Сколько секунд трек живет без подтверждения детекцией
+TRACK_TTL = 0.6
+# Дальше этого времени (сек) от последней детекции бокс не экстраполируется
+MAX_EXTRAPOLATION = 0.4
+# Детекция продолжает трек того же класса, если IoU с его предсказанным боксом не меньше этого
+TRACK_MATCH_IOU = 0.3
+
+def box_iou(a, b):
+    """Матрица IoU (N, M) для боксов xyxy a (N, 4) и b (M, 4)."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+class UnitTracker:
+    """
+    Хранит последние бокс, центр и скорость (пикс/сек) каждого трека юнита.
+    Вызывается из потока зрения; lock защищает чтение скоростей из других потоков.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._tracks = {}
+        self._next_id = 1
+
+    def reset(self):
+        with self.lock:
+            self._tracks.clear()
+
+    def assign(self, class_ids, boxes, now):
+        """
+        ID треков для детекций юнитов ключевого кадра (int32 (N,)). Детекции жадно, по
+        убыванию IoU, сопоставляются с предсказанными на `now` боксами живых треков того же
+        класса; остальные получают новые ID. Сами треки обновляет update().
+        """
+        class_ids = np.asarray(class_ids).reshape(-1)
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        result = np.full(len(class_ids), -1, dtype=np.int32)
+        predicted, _, track_cls, track_ids = self.extrapolate(now)
+        if len(class_ids) and len(track_ids):
+            iou = box_iou(boxes, predicted)
+            iou[class_ids[:, None] != track_cls[None, :]] = 0.0
+            det_idx, trk_idx = np.nonzero(iou >= TRACK_MATCH_IOU)
+            used_tracks = set()
+            for i in np.argsort(-iou[det_idx, trk_idx], kind='stable').tolist():
+                d, t = int(det_idx[i]), int(trk_idx[i])
+                if result[d] < 0 and t not in used_tracks:
+                    result[d] = track_ids[t]
+                    used_tracks.add(t)
+        with self.lock:
+            for d in np.flatnonzero(result < 0).tolist():
+                result[d] = self._next_id
+                self._next_id += 1
+        return result
+
+    def update(self, track_ids, class_ids, boxes, confs, now):
+        """Обновляет треки по детекциям ключевого кадра (массивы одинаковой длины; id < 0 — без трека)."""
+        with self.lock:
+            for track_id, class_id, box, conf in zip(track_ids.tolist(), class_ids.tolist(),
+                                                     boxes.tolist(), confs.tolist()):
+                if track_id < 0:
+                    continue
+                center = ((box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0)
+                track = self._tracks.get(track_id)
+                velocity = (0.0, 0.0)
+                if track is not None:
+                    dt = now - track['seen']
+                    if dt > 0:
+                        measured = ((center[0] - track['center'][0]) / dt, (center[1] - track['center'][1]) / dt)
+                        old = track['velocity']
+                        velocity = (old[0] + VELOCITY_SMOOTHING * (measured[0] - old[0]),
+                                    old[1] + VELOCITY_SMOOTHING * (measured[1] - old[1]))
+                    else:
+                        velocity = track['velocity']
+                self._tracks[track_id] = {
+                    'class_id': class_id, 'box': box, 'center': center,
+                    'velocity': velocity, 'conf': conf, 'seen': now,
+                }
+
+            # Удаляем треки, которые давно не подтверждались
+            for track_id in [t for t, track in self._tracks.items() if now - track['seen'] > TRACK_TTL]:
+                del self._tracks[track_id]
+
+    def velocity(self, track_id):
+        """Скорость трека (vx, vy) в пикселях в секунду; (0, 0), если трек неизвестен."""
+        with self.lock:
+            track = self._tracks.get(track_id)
+            return track['velocity'] if track is not None else (0.0, 0.0)
+
+    def velocities(self, track_ids):
+        """Скорости треков массивом float32 (N, 2); для неизвестных треков и id < 0 — нули."""
+        result = np.zeros((len(track_ids), 2), dtype=np.float32)
+        with self.lock:
+            for i, track_id in enumerate(np.asarray(track_ids).tolist()):
+                track = self._tracks.get(track_id)
+                if track is not None:
+                    result[i] = track['velocity']
+        return result
+
+    def extrapolate(self, now):
+        """
+        Предсказывает боксы живых треков на момент `now` по модели постоянной скорости.
+        Возвращает (xyxy int32 (N, 4), conf, cls, track_id) в формате Detections.
+        """
+        with self.lock:
+            tracks = [(t, track) for t, track in self._tracks.items() if now - track['seen'] <= TRACK_TTL]
+
+        count = len(tracks)
+        xyxy = np.empty((count, 4), dtype=np.int32)
+        conf = np.empty(count, dtype=np.float32)
+        cls = np.empty(count, dtype=np.int32)
+        track_id = np.empty(count, dtype=np.int32)
+        for i, (t, track) in enumerate(tracks):
+            dt = min(now - track['seen'], MAX_EXTRAPOLATION)
+            dx, dy = track['velocity'][0] * dt, track['velocity'][1] * dt
+            x1, y1, x2, y2 = track['box']
+            xyxy[i] = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+            conf[i] = track['conf']
+            cls[i] = track['class_id']
+            track_id[i] = t
+        return xyxy, conf, cls, track_id
@@ -0,0 +1,157 @@
+# Runs perceive_game_state in a separate worker process.
+# Frames are passed through multiprocessing.shared_memory (one copy into the
+# segment, no pickling of pixels); the worker returns the GameSnapshot as bytes
+# (GameSnapshot.to_bytes), the frame's Detections and the per-stage timings of that
+# frame. YOLO post-processing, OCR handling and box iteration then no longer compete
+# for the main interpreter's GIL.
+
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from game_state import GameSnapshot, class_name_list
+
+# Сколько ждать ответа воркера, прежде чем проверить, жив ли он
+RESPONSE_POLL_TIMEOUT = 1.0
+# Сколько ждать загрузки модели в процессе-воркере
+STARTUP_TIMEOUT = 120.0
+
+# Типы сообщений в очереди запросов
+_MSG_FRAME = 'frame'
+_MSG_CARD_PLAYED = 'card_played'
+_MSG_SETTINGS = 'settings'
+_MSG_STOP = 'stop'
+
+def _worker_main(shm_name, frame_shape, requests, responses, region_split, slow_budget, pipelined_ocr):
+    """Точка входа процесса-воркера: загружает модель и обрабатывает кадры из общей памяти."""
+    # Импорт внутри процесса: модель загружается здесь, а не в основном процессе
+    import game_vision
+    game_vision.REGION_SPLIT = region_split
+    game_vision.OCR_PIPELINE = pipelined_ocr
+    if slow_budget is not None:
+        game_vision.slow_scheduler.frame_budget = slow_budget
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=shm.buf)
+    last_game_state = None
+    # Длительности этапов текущего кадра уходят в основной процесс вместе с результатом
+    stage_times = {}
+    game_vision.set_stage_observer(stage_times.__setitem__)
+    # Загрузка и прогрев до ответа 'ready': первый кадр не ждет инициализации бэкенда
+    game_vision.engine.load()
+    game_vision.engine.warmup(frame_shape)
+    responses.put(('ready', dict(game_vision.engine.model.names)))
+
+    try:
+        while True:
+            message = requests.get()
+            kind = message[0]
+            if kind == _MSG_STOP:
+                break
+            if kind == _MSG_CARD_PLAYED:
+                game_vision.notify_card_played(message[1])
+                continue
+            if kind == _MSG_SETTINGS:
+                imgsz, slow_budget = message[1:]
+                game_vision.INFERENCE_IMGSZ = imgsz
+                if slow_budget is not None:
+                    game_vision.slow_scheduler.frame_budget = slow_budget
+                continue
+
+            _, frame_seq, capture_time, analyze_slow, keyframe = message
+            stage_times.clear()
+            game_state, detections = game_vision.perceive_game_state(
+                frame,
+                last_game_state=last_game_state,
+                analyze_slow_components=analyze_slow,
+                keyframe=keyframe,
+                frame_seq=frame_seq,
+                capture_time=capture_time,
+            )
+            last_game_state = game_state
+            responses.put(('result', frame_seq, game_state.to_bytes(), detections, dict(stage_times)))
+    finally:
+        print(f"[VisionProcess] Медленные компоненты: {game_vision.slow_scheduler.stats()}")
+        print(f"[VisionProcess] Кэш OCR: {game_vision.ocr_cache.stats()}")
+        print(f"[VisionProcess] Распознавание руки: {game_vision.hand_recognizer.stats()}")
+        if game_vision.OCR_PIPELINE:
+            print(f"[VisionProcess] Конвейер OCR: {game_vision.default_context.ocr_pipeline.stats()}")
+        game_vision.save_card_templates()
+        del frame
+        shm.close()
+
+class VisionProcess:
+    """
+    Клиент процесса-воркера зрения. perceive() блокирует только вызывающий поток
+    (ожидание очереди отпускает GIL), поэтому основной цикл продолжает захват и действия.
+    """
+
+    def __init__(self, frame_shape, region_split=False, slow_budget=None, pipelined_ocr=False):
+        self.frame_shape = tuple(frame_shape)
+        nbytes = int(np.prod(self.frame_shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._frame = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+        context = mp.get_context('spawn')
+        self._requests = context.Queue()
+        self._responses = context.Queue()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(self._shm.name, self.frame_shape, self._requests, self._responses, region_split, slow_budget,
+                  pipelined_ocr),
+            name="vision-process",
+            daemon=True,
+        )
+        self.class_names = {}
+        # Список имен по id класса для восстановления снимков
+        self._class_name_list = []
+        # Длительности этапов восприятия последнего кадра: {stage: seconds}
+        self.last_stage_times = {}
+
+    def start(self):
+        """Запускает процесс и ждет загрузки модели. Возвращает словарь имен классов."""
+        self._process.start()
+        kind, names = self._responses.get(timeout=STARTUP_TIMEOUT)
+        self.class_names = names
+        self._class_name_list = class_name_list(names)
+        return names
+
+    def perceive(self, frame, frame_seq, analyze_slow_components=True, keyframe=True, capture_time=0.0):
+        """
+        Отправляет кадр воркеру и ждет результат.
+        Возвращает (game_state, detections) или (None, None), если процесс завершился.
+        Длительности этапов этого кадра сохраняются в last_stage_times.
+        """
+        np.copyto(self._frame, frame)
+        self._requests.put((_MSG_FRAME, frame_seq, capture_time, analyze_slow_components, keyframe))
+        while True:
+            try:
+                kind, result_seq, state_bytes, detections, stage_times = self._responses.get(
+                    timeout=RESPONSE_POLL_TIMEOUT)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    print("[VisionProcess ERROR] Процесс зрения завершился.")
+                    return None, None
+                continue
+            if result_seq == frame_seq:
+                self.last_stage_times = stage_times
+                return GameSnapshot.from_bytes(state_bytes, self._class_name_list), detections
+
+    def notify_card_played(self, class_name):
+        """Передает в процесс зрения информацию о розыгрыше карты (для оценки эликсира)."""
+        self._requests.put((_MSG_CARD_PLAYED, class_name))
+
+    def apply_settings(self, imgsz=None, slow_budget=None):
+        """Меняет размер входа модели и бюджет медленных компонентов в процессе зрения (см. qos.py)."""
+        self._requests.put((_MSG_SETTINGS, imgsz, slow_budget))
+
+    def stop(self):
+        if self._process.is_alive():
+            self._requests.put((_MSG_STOP,))
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+        del self._frame
+        self._shm.close()
+        self._shm.unlink()